@@ -0,0 +1,57 @@
+#  -*- coding: utf-8 -*-
+#  bench_adapters.py ---
+#
+#  Compare converting custom types (datetime, Decimal, UUID) by walking
+#  the response tree before encoding against letting the mappers call
+#  the shared adapters only for the objects they don't know.
+#
+#  usage: PYTHONPATH=.. python bench_adapters.py
+#
+
+
+import datetime
+import timeit
+import uuid
+from decimal import Decimal
+
+from diablo.mappers.jsonmapper import JsonMapper
+from diablo.mappers.xmlmapper import XmlMapper
+
+
+def prewalk(data):
+    """ The conversion that handlers did before the adapters. """
+
+    if isinstance(data, dict):
+        return dict((key, prewalk(value)) for key, value in data.iteritems())
+    elif isinstance(data, (list, tuple)):
+        return [prewalk(item) for item in data]
+    elif isinstance(data, (datetime.datetime, datetime.date)):
+        return data.isoformat()
+    elif isinstance(data, (Decimal, uuid.UUID)):
+        return str(data)
+    return data
+
+
+def run(number=10):
+    now = datetime.datetime(2012, 4, 8, 13, 43, 27)
+    rows = [{'id': uuid.uuid4(), 'name': u'Order %d' % (i,), 'total': Decimal('19.90'),
+             'created': now, 'lines': [{'sku': 'A-%d' % (i,), 'qty': 2}]}
+            for i in range(5000)]
+    print '%-6s %-10s %10s' % ('mapper', 'custom', 'ms/call')
+    for name, mapper in (('json', JsonMapper()), ('xml', XmlMapper())):
+        assert len(mapper._format_data(prewalk(rows), 'utf-8')) == len(mapper._format_data(rows, 'utf-8'))
+        cases = [
+            ('prewalk', lambda: mapper._format_data(prewalk(rows), 'utf-8')),
+            ('adapters', lambda: mapper._format_data(rows, 'utf-8')),
+            ]
+        for kind, fn in cases:
+            elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+            print '%-6s %-10s %10.2f' % (name, kind, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_adapters.py ends here
@@ -0,0 +1,54 @@
+#  -*- coding: utf-8 -*-
+#  bench_csv.py ---
+#
+#  Compare payload size and encode time of tabular data in CSV against
+#  JSON and XML.
+#
+#  usage: PYTHONPATH=.. python bench_csv.py
+#
+
+
+import timeit
+
+from diablo.mappers.csvmapper import CsvMapper
+from diablo.mappers.jsonmapper import JsonMapper
+from diablo.mappers.xmlmapper import XmlMapper
+
+
+def make_rows(n=10000):
+    return [{
+        'date': '2013-01-%02d' % (i % 28 + 1,),
+        'product': u'Snowboard %d' % (i % 50,),
+        'quantity': i % 7,
+        'amount': i * 1.25,
+        'region': u'Pirkanmaa',
+        } for i in range(n)]
+
+
+def run(number=3):
+    rows = make_rows()
+    columns = ('date', 'product', 'quantity', 'amount', 'region')
+    cases = [
+        ('json', JsonMapper(), rows),
+        ('xml', XmlMapper(), {'rows': rows}),
+        ('csv', CsvMapper(columns), rows),
+        ('csv (streamed)', CsvMapper(columns), None),
+        ]
+
+    print '%-16s %10s %10s' % ('mapper', 'bytes', 'ms/call')
+    for name, mapper, data in cases:
+        if data is None:
+            fn = lambda: ''.join(mapper._format_data(iter(rows), 'utf-8'))
+        else:
+            fn = lambda: mapper._format_data(data, 'utf-8')
+        size = len(fn())
+        elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        print '%-16s %10d %10.2f' % (name, size, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_csv.py ends here
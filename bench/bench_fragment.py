@@ -0,0 +1,54 @@
+#  -*- coding: utf-8 -*-
+#  bench_fragment.py ---
+#
+#  Compare encoding a page of product cards from dicts on every request
+#  against splicing cached Fragments of the same cards.
+#
+#  usage: PYTHONPATH=.. python bench_fragment.py
+#
+
+
+import timeit
+
+from diablo.fragment import Fragment
+from diablo.mappers.jsonmapper import JsonMapper
+from diablo.mappers.xmlmapper import XmlMapper
+
+
+def make_card(i):
+    return {
+        'id': i,
+        'name': u'Snowboard %d' % (i,),
+        'price': i * 1.5,
+        'description': u'Freestyle board for all conditions. ' * 5,
+        'sizes': [150, 155, 160, 165],
+        'vendor': {'name': u'Hämeen Lauta Oy', 'country': 'FI'},
+        }
+
+
+def encode(mapper, data):
+    """ Encode the data and consume the chunks of a streamed result. """
+
+    content = mapper._format_data(data, 'utf-8')
+    return content if isinstance(content, str) else ''.join(content)
+
+
+def run(number=20):
+    cards = [make_card(i) for i in range(1000)]
+    fragments = [Fragment(card) for card in cards]
+    print '%-6s %-12s %10s' % ('mapper', 'cards', 'ms/call')
+    for name, mapper in (('json', JsonMapper()), ('xml', XmlMapper())):
+        # warm up the fragment caches
+        encode(mapper, {'cards': fragments})
+        for kind, data in (('dicts', cards), ('fragments', fragments)):
+            fn = lambda: encode(mapper, {'cards': data})
+            elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+            print '%-6s %-12s %10.2f' % (name, kind, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_fragment.py ends here
@@ -0,0 +1,56 @@
+#  -*- coding: utf-8 -*-
+#  bench_json.py ---
+#
+#  Compare the compact JsonMapper output against the old indented
+#  ``json.dumps(indent=4, ensure_ascii=True)`` output.
+#
+#  usage: PYTHONPATH=.. python bench_json.py
+#
+
+
+import timeit
+
+from diablo.mappers.jsonmapper import JsonMapper, json, json_backend, json_speedups
+
+
+def make_payload(n=2000):
+    return [{
+        'id': i,
+        'name': u'user number %d' % (i,),
+        'email': 'user%d@example.com' % (i,),
+        'active': i % 2 == 0,
+        'score': i * 1.5,
+        'tags': ['a', 'b', 'c'],
+        'address': {'street': u'Hämeenkatu %d' % (i,), 'city': u'Tampere'},
+        } for i in range(n)]
+
+
+def legacy_format(data):
+    return json.dumps(data, indent=4, ensure_ascii=True, encoding='utf-8')
+
+
+def run(number=20):
+    data = make_payload()
+    compact = JsonMapper()
+    utf8 = JsonMapper(ensure_ascii=False)
+    pretty = JsonMapper(pretty=True)
+    cases = [
+        ('legacy json.dumps(indent=4)', lambda: legacy_format(data)),
+        ('JsonMapper(pretty=True)', lambda: pretty._format_data(data, 'utf-8')),
+        ('JsonMapper()', lambda: compact._format_data(data, 'utf-8')),
+        ('JsonMapper(ensure_ascii=False)', lambda: utf8._format_data(data, 'utf-8')),
+        ]
+
+    print 'backend: %s, C speedups: %s' % (json_backend, json_speedups)
+    print '%-32s %10s %10s' % ('case', 'ms/call', 'bytes')
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        print '%-32s %10.2f %10d' % (name, elapsed * 1000, len(fn()))
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_json.py ends here
@@ -0,0 +1,125 @@
+#  -*- coding: utf-8 -*-
+#  bench_response.py ---
+#
+#  Measure the cost of the Response objects that a request goes through.
+#  The legacy pipeline allocates a Response (with a __dict__ and a
+#  header dict) in _processResponse and another one in
+#  _finalize_response. The current one updates a single slotted
+#  Response in place and shares the constant header dict.
+#
+#  Reports the time per request, the bytes held by the final response
+#  (object, __dict__ and headers, not the content) and the number of GC
+#  tracked objects that stay alive with each response.
+#
+#  usage: PYTHONPATH=.. python bench_response.py
+#
+
+
+import gc
+import sys
+import timeit
+
+from diablo.http import Response
+from diablo.mappers.jsonmapper import JsonMapper
+
+
+class LegacyResponse(object):
+    """ The Response before __slots__. """
+
+    def __init__(self, code=None, content=None, headers=None):
+        self.code = code
+        self.content = content or ''
+        self.headers = headers if headers is not None else {}
+
+
+class LegacyJsonMapper(JsonMapper):
+    """ JsonMapper with the encode steps of the legacy pipeline. """
+
+    def encode(self, response):
+        res = self._prepare_response(response)
+        res.content = self._format_data(res.content, self.charset)
+        return self._finalize_response(res)
+
+    def _prepare_response(self, response):
+        if not isinstance(response, LegacyResponse):
+            return LegacyResponse(0, response)
+        return response
+
+    def _finalize_response(self, response):
+        headers = {'Content-Type': self._get_content_type()}
+        if isinstance(response.content, basestring):
+            headers['Content-Length'] = len(response.content)
+        res = LegacyResponse(content=response.content, headers=headers)
+        res.code = response.code
+        return res
+
+    def _get_content_type(self):
+        return '%s; charset=%s' % (self.content_type, self.charset)
+
+
+def legacy_request(mapper, data):
+    """ Legacy _processResponse, encode and _writeResponse steps. """
+
+    res = mapper.encode(LegacyResponse(0, data))
+    for key, value in res.headers.items():
+        pass
+    return res
+
+
+def current_request(mapper, data):
+    """ Current _processResponse, encode and _writeResponse steps. """
+
+    res = mapper.encode(Response(0, data))
+    for key, value in res.iterheaders():
+        pass
+    return res
+
+
+def size_of(response):
+    """ Bytes held by the response object itself (not the content). """
+
+    size = sys.getsizeof(response)
+    if hasattr(response, '__dict__'):
+        size += sys.getsizeof(response.__dict__)
+    return size + sys.getsizeof(response._headers if isinstance(response, Response) else response.headers)
+
+
+def count_gc_objects(fn, n=10000):
+    """ Number of GC tracked objects kept alive per result of ``fn``.
+
+    The collector is disabled and the results are kept alive while
+    counting.
+    """
+
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        keep = [fn() for i in xrange(n)]
+        return (len(gc.get_objects()) - before - 1) / float(n), keep
+    finally:
+        gc.enable()
+
+
+def run(number=50000):
+    data = {'id': 1}
+    legacy_mapper, mapper = LegacyJsonMapper(), JsonMapper()
+    cases = [
+        ('legacy', lambda: legacy_request(legacy_mapper, data)),
+        ('slotted', lambda: current_request(mapper, data)),
+        ]
+
+    print '%-10s %12s %14s %12s' % ('pipeline', 'us/request', 'bytes/response', 'gc objs/req')
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=7)) / number
+        objects, keep = count_gc_objects(fn)
+        print '%-10s %12.2f %14d %12.1f' % (
+            name, elapsed * 1e6, size_of(fn()), objects)
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_response.py ends here
@@ -0,0 +1,93 @@
+#  -*- coding: utf-8 -*-
+#  bench_serializer.py ---
+#
+#  Serialize 10k model objects with a compiled Schema and compare it to
+#  dict building written by hand and to a generic getattr based loop
+#  over the same field declarations.
+#
+#  usage: PYTHONPATH=.. python bench_serializer.py
+#
+
+
+import timeit
+from decimal import Decimal
+
+from diablo.serializer import Schema, Field
+
+
+class Obj(object):
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+class VendorSchema(Schema):
+    name = Field()
+    country = Field('country_code')
+
+
+class ProductSchema(Schema):
+    id = Field()
+    name = Field('title')
+    price = Field(convert=str)
+    stock = Field()
+    vendor = Field(schema=VendorSchema)
+
+
+def by_hand(products):
+    result = []
+    for product in products:
+        vendor = product.vendor
+        result.append({
+            'id': product.id,
+            'name': product.title,
+            'price': str(product.price),
+            'stock': product.stock,
+            'vendor': {
+                'name': vendor.name,
+                'country': vendor.country_code,
+                } if vendor is not None else None,
+            })
+    return result
+
+
+def reflective(schema, obj):
+    """ Walk the field declarations for every object. """
+
+    if obj is None:
+        return None
+    result = {}
+    for name, field in schema._fields:
+        value = obj
+        for part in (field.source or name).split('.'):
+            value = getattr(value, part)
+        if field.schema is not None:
+            value = reflective(field.schema, value)
+        if field.convert is not None:
+            value = field.convert(value)
+        result[name] = value
+    return result
+
+
+def run(number=10):
+    products = [
+        Obj(id=i, title=u'Board %d' % (i,), price=Decimal('199.90'), stock=i % 7,
+            vendor=Obj(name=u'Lauta Oy', country_code='FI'))
+        for i in range(10000)]
+    cases = [
+        ('by hand', lambda: by_hand(products)),
+        ('reflective', lambda: [reflective(ProductSchema, p) for p in products]),
+        ('compiled', lambda: ProductSchema.serialize(products)),
+        ]
+    assert cases[0][1]() == cases[1][1]() == cases[2][1]()
+    print '%-12s %10s' % ('serializer', 'ms/10k')
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        print '%-12s %10.2f' % (name, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_serializer.py ends here
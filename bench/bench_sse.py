@@ -0,0 +1,63 @@
+#  -*- coding: utf-8 -*-
+#  bench_sse.py ---
+#
+#  Publish an event to 10k subscribers through a Channel (encoded once)
+#  and compare it to encoding the event for every subscriber.
+#
+#  usage: PYTHONPATH=.. python bench_sse.py
+#
+
+
+import timeit
+
+from twisted.internet import defer, task
+
+from diablo.mappers.jsonmapper import JsonMapper
+from diablo.sse import Channel, Event
+
+
+class Subscriber(object):
+    """ Request that only counts the written bytes. """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def finish(self):
+        pass
+
+    def notifyFinish(self):
+        return defer.Deferred()
+
+
+def run(number=10):
+    mapper = JsonMapper()
+    data = {'product': 1, 'price': '9.90', 'stock': [{'store': i, 'count': i * 2} for i in range(20)]}
+    subscribers = [Subscriber() for i in range(10000)]
+    channel = Channel(clock=task.Clock())
+    for subscriber in subscribers:
+        channel.subscribe(subscriber, mapper)
+
+    def per_subscriber():
+        for subscriber in subscribers:
+            subscriber.write(Event(data, id='1').frame(mapper))
+
+    cases = [
+        ('per subscriber', per_subscriber),
+        ('channel', lambda: channel.publish(data, id='1')),
+        ]
+    print '%-16s %10s' % ('publish', 'ms/10k')
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        print '%-16s %10.2f' % (name, elapsed * 1000)
+    channel.close()
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_sse.py ends here
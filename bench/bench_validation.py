@@ -0,0 +1,89 @@
+#  -*- coding: utf-8 -*-
+#  bench_validation.py ---
+#
+#  Compare the cost of validating a decoded request body with a compiled
+#  InputSchema against the cost of decoding it (JsonMapper) and against
+#  validation code written by hand.
+#
+#  usage: PYTHONPATH=.. python bench_validation.py
+#
+
+
+import json
+import timeit
+
+from diablo.mappers.jsonmapper import JsonMapper
+from diablo.validation import InputSchema, Rule
+
+
+class VendorInput(InputSchema):
+    name = Rule(str, max_length=100)
+    country = Rule(str, min_length=2, max_length=2)
+
+
+class ProductInput(InputSchema):
+    id = Rule(int, min=1)
+    name = Rule(str, min_length=1, max_length=200)
+    price = Rule(float, min=0)
+    stock = Rule(int, required=False, default=0, min=0)
+    kind = Rule(choices=('board', 'binding', 'boot'))
+    vendor = Rule(schema=VendorInput)
+
+
+class OrderInput(InputSchema):
+    products = Rule(schema=ProductInput, many=True, max_length=100000)
+
+
+def by_hand(data):
+    errors = {}
+    for i, p in enumerate(data['products']):
+        prefix = 'products.%d.' % (i,)
+        if not isinstance(p.get('id'), (int, long)) or p['id'] < 1:
+            errors[prefix + 'id'] = 'invalid'
+        name = p.get('name')
+        if not isinstance(name, basestring) or not 1 <= len(name) <= 200:
+            errors[prefix + 'name'] = 'invalid'
+        if not isinstance(p.get('price'), (int, long, float)) or p['price'] < 0:
+            errors[prefix + 'price'] = 'invalid'
+        if 'stock' not in p:
+            p['stock'] = 0
+        elif not isinstance(p['stock'], (int, long)) or p['stock'] < 0:
+            errors[prefix + 'stock'] = 'invalid'
+        if p.get('kind') not in ('board', 'binding', 'boot'):
+            errors[prefix + 'kind'] = 'invalid'
+        vendor = p.get('vendor')
+        if not isinstance(vendor, dict):
+            errors[prefix + 'vendor'] = 'invalid'
+        else:
+            if not isinstance(vendor.get('name'), basestring) or len(vendor['name']) > 100:
+                errors[prefix + 'vendor.name'] = 'invalid'
+            country = vendor.get('country')
+            if not isinstance(country, basestring) or len(country) != 2:
+                errors[prefix + 'vendor.country'] = 'invalid'
+    return errors
+
+
+def run(number=10):
+    body = json.dumps({'products': [
+        {'id': i + 1, 'name': u'Board %d' % (i,), 'price': 199.9, 'stock': i % 7,
+         'kind': 'board', 'vendor': {'name': u'Lauta Oy', 'country': 'FI'}}
+        for i in range(10000)]})
+    mapper = JsonMapper()
+    data = mapper.decode(body)
+    cases = [
+        ('decode', lambda: mapper.decode(body)),
+        ('by hand', lambda: by_hand(data)),
+        ('compiled', lambda: OrderInput.validate(data)),
+        ]
+    print '%-10s %10s' % ('step', 'ms/10k')
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        print '%-10s %10.2f' % (name, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_validation.py ends here
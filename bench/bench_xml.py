@@ -0,0 +1,72 @@
+#  -*- coding: utf-8 -*-
+#  bench_xml.py ---
+#
+#  Compare the XmlMapper parser backends on large documents and the
+#  XmlEncoder against SimplerXMLGenerator on large nested payloads.
+#
+#  usage: PYTHONPATH=.. python bench_xml.py
+#
+
+
+import timeit
+
+from diablo.mappers.xmlmapper import XmlMapper
+
+
+def make_document(n):
+    items = ''.join(
+        '<order_item><id>%d</id><name>Snowboard %d</name><price>%d.50</price>'
+        '<tags><tag>a</tag><tag>b</tag></tags></order_item>' % (i, i, i)
+        for i in range(n))
+    return '<?xml version="1.0" encoding="utf-8"?>\n<root><orders>%s</orders></root>' % (items,)
+
+
+class LegacyXmlMapper(XmlMapper):
+    """ XmlMapper that always formats with SimplerXMLGenerator. """
+
+    def _get_encoder(self, charset):
+        return None
+
+
+def make_payload(n):
+    return {'orders': [{
+        'id': i,
+        'name': u'Snowboard <%d> & co' % (i,),
+        'price': i * 1.5,
+        'shipped': i % 2 == 0,
+        'tags': ['winter', 'sports'],
+        'customer': {'name': u'Matti Meikäläinen', 'city': 'Tampere'},
+        } for i in range(n)]}
+
+
+def run_format(number=3):
+    print '%-10s %-14s %10s' % ('items', 'formatter', 'ms/call')
+    for n in (1000, 10000):
+        data = make_payload(n)
+        legacy = LegacyXmlMapper()
+        fast = XmlMapper()
+        assert legacy._format_data(data, 'utf-8') == fast._format_data(data, 'utf-8')
+        for name, mapper in (('generator', legacy), ('XmlEncoder', fast)):
+            fn = lambda: mapper._format_data(data, 'utf-8')
+            elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+            print '%-10d %-14s %10.2f' % (n, name, elapsed * 1000)
+
+
+def run_parse(number=3):
+    print '%-10s %-14s %10s' % ('items', 'parser', 'ms/call')
+    for n in (1000, 10000, 50000):
+        doc = make_document(n)
+        for parser in ('sax', 'etree'):
+            mapper = XmlMapper(numbermode='basic', parser=parser)
+            fn = lambda: mapper._parse_data(doc, 'utf-8')
+            elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+            print '%-10d %-14s %10.2f' % (n, parser, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    run_parse()
+    run_format()
+
+
+#
+#  bench_xml.py ends here
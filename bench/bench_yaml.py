@@ -0,0 +1,55 @@
+#  -*- coding: utf-8 -*-
+#  bench_yaml.py ---
+#
+#  Compare YamlMapper (LibYAML and pure python) against the old
+#  ``yaml.dump()``/``yaml.load()`` calls.
+#
+#  usage: PYTHONPATH=.. python bench_yaml.py
+#
+
+
+import timeit
+
+import yaml
+
+from diablo.mappers.yamlmapper import YamlMapper
+
+
+def make_payload(n=500):
+    return [{
+        'id': i,
+        'name': u'user number %d' % (i,),
+        'active': i % 2 == 0,
+        'score': i * 1.5,
+        'tags': ['a', 'b', 'c'],
+        'address': {'street': u'Hämeenkatu %d' % (i,), 'city': u'Tampere'},
+        } for i in range(n)]
+
+
+def run(number=3):
+    data = make_payload()
+    document = yaml.safe_dump(data)
+    pure = YamlMapper(use_libyaml=False)
+    fast = YamlMapper()
+    cases = [
+        ('legacy yaml.dump()', lambda: yaml.dump(data)),
+        ('YamlMapper(use_libyaml=False)', lambda: pure._format_data(data, 'utf-8')),
+        ('YamlMapper()', lambda: fast._format_data(data, 'utf-8')),
+        ('legacy yaml.load()', lambda: yaml.load(document, Loader=yaml.Loader)),
+        ('YamlMapper(use_libyaml=False)', lambda: pure._parse_data(document, 'utf-8')),
+        ('YamlMapper()', lambda: fast._parse_data(document, 'utf-8')),
+        ]
+
+    print 'libyaml: %s' % (yaml.__with_libyaml__,)
+    print '%-32s %10s' % ('case', 'ms/call')
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        print '%-32s %10.2f' % (name, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    run()
+
+
+#
+#  bench_yaml.py ends here
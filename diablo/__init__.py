@@ -2,13 +2,30 @@
 import datamapper
 from diablo.mappers.xmlmapper import XmlMapper
 from diablo.mappers.jsonmapper import JsonMapper
+from diablo.mappers.ndjsonmapper import NdJsonMapper
 from diablo.mappers.yamlmapper import YamlMapper
+from diablo.mappers.msgpackmapper import MsgPackMapper
+from diablo.mappers.multipartmapper import MultipartMapper
+from diablo.mappers.patchmapper import JsonPatchMapper, MergePatchMapper
+from diablo.mappers.csvmapper import CsvMapper, TsvMapper
 
 def register_mappers():
     textmapper = datamapper.DataMapper()
     jsonmapper = JsonMapper()
+    ndjsonmapper = NdJsonMapper()
     xmlmapper = XmlMapper(numbermode='basic')
     yamlmapper = YamlMapper()
+    msgpackmapper = MsgPackMapper()
+    csvmapper = CsvMapper()
+    tsvmapper = TsvMapper()
+    multipartmapper = MultipartMapper()
+    jsonpatchmapper = JsonPatchMapper()
+    mergepatchmapper = MergePatchMapper()
+
+    # patch mappers (PATCH bodies only). registered first so that they
+    # don't take over application/*
+    datamapper.manager.register_mapper(jsonpatchmapper, 'application/json-patch+json')
+    datamapper.manager.register_mapper(mergepatchmapper, 'application/merge-patch+json')
 
     # we'll be tolerant on what we receive
     # remember to put these false content types in the beginning so that they
@@ -17,6 +34,7 @@ def register_mappers():
     datamapper.manager.register_mapper(jsonmapper, 'text/javascript', 'json')
     datamapper.manager.register_mapper(jsonmapper, 'text/x-javascript', 'json')
     datamapper.manager.register_mapper(jsonmapper, 'text/x-json', 'json')
+    datamapper.manager.register_mapper(msgpackmapper, 'application/x-msgpack', 'msgpack')
 
     # text mapper
     datamapper.manager.register_mapper(textmapper, 'text/plain', 'text')
@@ -28,8 +46,23 @@ def register_mappers():
     # json mapper
     datamapper.manager.register_mapper(jsonmapper, 'application/json', 'json')
 
+    # ndjson mapper
+    datamapper.manager.register_mapper(ndjsonmapper, 'application/x-ndjson', 'ndjson')
+
+    # msgpack mapper (binary). registered before yaml so that yaml stays
+    # the mapper of application/*
+    datamapper.manager.register_mapper(msgpackmapper, 'application/msgpack', 'msgpack')
+
+    # csv and tsv mappers. registered before yaml so that yaml stays the
+    # mapper of text/*
+    datamapper.manager.register_mapper(csvmapper, 'text/csv', 'csv')
+    datamapper.manager.register_mapper(tsvmapper, 'text/tab-separated-values', 'tsv')
+
     # yaml mapper
     datamapper.manager.register_mapper(yamlmapper, 'text/yaml', 'yaml')
     datamapper.manager.register_mapper(yamlmapper, 'application/yaml', 'yaml')
 
+    # multipart mapper (uploads only)
+    datamapper.manager.register_mapper(multipartmapper, 'multipart/form-data')
+
 register_mappers()
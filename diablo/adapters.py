@@ -0,0 +1,98 @@
+#  -*- coding: utf-8 -*-
+#  adapters.py ---
+#
+#  Registry of type adapters shared by all mappers.
+#
+
+
+import datetime
+import inspect
+import uuid
+from decimal import Decimal
+
+
+class AdapterRegistry(object):
+    """ Adapters that turn objects of custom types into data the mappers
+    know how to encode (strings, numbers, lists, dicts...).
+
+    The mappers consult the registry only for the objects they don't
+    handle themselves, e.g. ``JsonMapper`` through the ``default`` hook
+    of the json encoder. The adapter of a class is looked up by the exact
+    class first and then along its MRO, and the result (also a miss) is
+    cached per class so the lookup is a single dict access afterwards.
+
+    Example::
+
+        from diablo import adapters
+        adapters.register(Money, lambda money: str(money.amount))
+    """
+
+    def __init__(self):
+        self._adapters = {}
+        self._cache = {}
+
+    def register(self, cls, adapter):
+        """ Register an adapter for a class (and its subclasses).
+
+        :param cls: the class
+        :param adapter: function that takes an instance of the class and
+                        returns data the mappers can encode
+        """
+
+        self._adapters[cls] = adapter
+        self._cache.clear()
+
+    def unregister(self, cls):
+        """ Remove the adapter of a class. """
+
+        self._adapters.pop(cls, None)
+        self._cache.clear()
+
+    def lookup(self, cls):
+        """ Return the adapter for the class or ``None``. """
+
+        try:
+            return self._cache[cls]
+        except KeyError:
+            pass
+        adapter = None
+        for base in inspect.getmro(cls):
+            adapter = self._adapters.get(base)
+            if adapter is not None:
+                break
+        self._cache[cls] = adapter
+        return adapter
+
+    def adapt(self, obj):
+        """ Adapt the object.
+
+        :raises: ``TypeError`` if there's no adapter for the object
+        """
+
+        adapter = self.lookup(obj.__class__)
+        if adapter is None:
+            raise TypeError('no adapter for %r' % (obj,))
+        return adapter(obj)
+
+
+def _isoformat(obj):
+    return obj.isoformat()
+
+
+# singleton instance
+registry = AdapterRegistry()
+
+register = registry.register
+unregister = registry.unregister
+
+register(datetime.datetime, _isoformat)
+register(datetime.date, _isoformat)
+register(datetime.time, _isoformat)
+register(Decimal, str)
+register(uuid.UUID, str)
+register(set, list)
+register(frozenset, list)
+
+
+#
+#  adapters.py ends here
@@ -19,10 +19,24 @@ class RESTApi(Resource):
     Currently only implements URL routing.
     """
 
-    def __init__(self, routes):
-        """ Compile regexes and create class objects for URL routes. """
+    def __init__(self, routes, batch_path=None, batch_resource=None):
+        """ Compile regexes and create class objects for URL routes.
+
+        :param batch_path: path of the batch resource (e.g. ``/batch``)
+                           that runs many requests at once. ``None``
+                           disables batches.
+        :param batch_resource: the resource class for batches, by default
+                               ``diablo.batch.BatchResource``
+        """
         self._routes = [(re.compile(pattern), self._getResourceClass(clsname))
                         for pattern, clsname in routes]
+        self._batch_paths = ()
+        if batch_path:
+            batch_path = batch_path.rstrip('/')
+            self._batch_paths = (batch_path, batch_path + '/')
+        if batch_resource is None:
+            from diablo.batch import BatchResource as batch_resource
+        self._batch_resource = batch_resource
         Resource.__init__(self)
 
     def _getResourceClass(self, clsname):
@@ -75,6 +89,9 @@ class RESTApi(Resource):
                 matching_route = potential_match(route[0].match(newpath), route)
             return matching_route
 
+        if request.path in self._batch_paths:
+            return self._batch_resource(self)
+
         for route in self._routes:
             match = try_to_match(request.path, route)
             if match:
@@ -10,6 +10,10 @@ from twisted.web import http
 from .http import Unauthorized, Forbidden, Response
 
 
+# the challenge is the same for every response so the headers are shared
+_challenge_headers = {'WWW-Authenticate': 'Basic realm="diablo"'}
+
+
 def authenticate(username, password):
     """ Check credentials.
 
@@ -80,7 +84,7 @@ class HttpBasic(object):
 
         content = exc.content or ''
         response = Response(code=http.UNAUTHORIZED, content=content)
-        response.headers['WWW-Authenticate'] = 'Basic realm="diablo"'
+        response.shareHeaders(_challenge_headers)
         return response
 
 
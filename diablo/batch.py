@@ -0,0 +1,238 @@
+#  -*- coding: utf-8 -*-
+#  batch.py ---
+#
+#  Batch resource that runs many sub-requests within one HTTP request.
+#
+
+
+import logging
+from StringIO import StringIO
+
+from twisted.internet import defer
+from twisted.web import http
+from twisted.web.http_headers import Headers
+from twisted.web.server import NOT_DONE_YET, UnsupportedMethod
+
+from diablo import datamapper
+from diablo.fragment import Fragment
+from diablo.http import BadRequest, HTTPError
+from diablo.mappers.jsonmapper import JsonMapper
+from diablo.resource import Resource
+from diablo.util import extract_charset, strip_charset
+from diablo.validation import InputSchema, Rule
+
+
+# encodes the bodies of the sub-requests, whatever the batch came in
+_body_mapper = JsonMapper()
+
+
+class SubRequestInput(InputSchema):
+    """ One sub-request of a batch. """
+
+    method = Rule(str, required=False, default='GET',
+                  choices=('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+    path = Rule(str, min_length=1)
+    headers = Rule(dict, required=False, default={})
+    body = Rule(required=False, null=True)
+
+
+class BatchResource(Resource):
+    """ Runs a list of sub-requests through the routes of the ``RESTApi``.
+
+    The body of the request is a list of sub-requests::
+
+        [{"method": "GET", "path": "/products/1"},
+         {"method": "POST", "path": "/orders", "body": {"product": 1}}]
+
+    The batch is authenticated once (using the ``authentication`` of this
+    resource). Sub-requests to resources that have the same
+    ``authentication`` object run as the same user without authenticating
+    again. Other resources authenticate their sub-request with its own
+    ``headers``. All the sub-requests are started right away so
+    handlers that return deferreds run concurrently. The response is a
+    list of ``{"status": ..., "headers": {...}, "body": ...}`` in the
+    order of the sub-requests.
+
+    The bodies of the sub-requests are passed to the resources as json.
+    Sub-responses are encoded in the format of the batch response. Json
+    bodies are spliced into the response as they are (see
+    ``diablo.fragment``), others are parsed back into data. Streamed
+    bodies are collected in memory.
+
+    Enable with ``RESTApi(routes, batch_path='/batch')``.
+    """
+
+    log = logging.getLogger('diablo')
+
+    """ Maximum number of sub-requests in a batch. """
+    max_requests = 50
+
+    def __init__(self, api):
+        """ Initialize the resource.
+
+        :param api: the ``RESTApi`` that routes the sub-requests
+        """
+
+        Resource.__init__(self)
+        self.api = api
+
+    def post(self, data, request, *args, **kw):
+        """ Run the sub-requests.
+
+        :returns: deferred list of sub-responses
+        """
+
+        if not isinstance(data, (list, tuple)):
+            raise BadRequest('batch must be a list of requests')
+        if len(data) > self.max_requests:
+            raise BadRequest('too many requests in a batch, max %d' % (self.max_requests,))
+        items = list(SubRequestInput.validate(iter(data)))
+        encoder = datamapper.manager.select_encoder(request, self)
+        return defer.gatherResults([
+            self._runSubRequest(item, request, encoder) for item in items])
+
+    def _runSubRequest(self, item, request, encoder):
+        """ Route and render one sub-request.
+
+        :returns: deferred sub-response
+        """
+
+        subrequest = SubRequest(item['method'], item['path'], item['headers'],
+                                request.user, self.authentication)
+        subrequest.received_headers['accept'] = encoder.content_type
+        if item.get('body') is not None:
+            subrequest.content = StringIO(_body_mapper.encode(item['body']).content)
+            subrequest.received_headers['content-type'] = _body_mapper.content_type
+        resource = self.api.getChild(subrequest.path, subrequest)
+        if isinstance(resource, BatchResource):
+            subrequest.setResponseCode(http.BAD_REQUEST)
+            subrequest.finish()
+        else:
+            self._render(resource, subrequest)
+        return subrequest.notifyFinish().addCallback(
+            self._getSubResponse, subrequest, encoder)
+
+    def _render(self, resource, subrequest):
+        """ Render the sub-request like ``twisted.web.server.Request``. """
+
+        try:
+            body = resource.render(subrequest)
+        except UnsupportedMethod, exc:
+            subrequest.setResponseCode(http.NOT_ALLOWED)
+            subrequest.setHeader('allow', ', '.join(exc.allowedMethods))
+            body = ''
+        except Exception:
+            self.log.exception('batch sub-request failed')
+            subrequest.setResponseCode(http.INTERNAL_SERVER_ERROR)
+            body = ''
+        if body is not NOT_DONE_YET:
+            subrequest.write(body)
+            subrequest.finish()
+
+    def _getSubResponse(self, ignored, subrequest, encoder):
+        """ Turn the finished sub-request into an item of the response. """
+
+        headers = dict((name.lower(), values[0])
+                       for name, values in subrequest.responseHeaders.getAllRawHeaders()
+                       if name.lower() != 'content-length')
+        return {
+            'status': subrequest.code,
+            'headers': headers,
+            'body': self._getSubResponseBody(subrequest, headers.get('content-type'), encoder),
+            }
+
+    def _getSubResponseBody(self, subrequest, content_type, encoder):
+        """ Return the body of the sub-response as data. """
+
+        body = ''.join(subrequest.written)
+        if not body:
+            return None
+        elif not content_type:
+            return body
+        mimetype = strip_charset(content_type).strip()
+        if mimetype == encoder.content_type == 'application/json':
+            # already in the right format
+            return Fragment(json=body)
+        try:
+            mapper = datamapper.manager.get_mapper_by_content_type(mimetype)
+            return mapper.decode(body, extract_charset(content_type))
+        except HTTPError:
+            return body
+
+
+class SubRequest(object):
+    """ In-process request for running a sub-request of a batch.
+
+    Implements the parts of ``twisted.web.server.Request`` that the
+    resources use. The response is collected into ``written``.
+
+    ``user`` was authenticated with the ``authenticated_with``
+    authentication of the batch. Resources with another authentication
+    authenticate the sub-request themselves.
+    """
+
+    def __init__(self, method, uri, headers, user, authenticated_with):
+        self.method = method.upper()
+        self.uri = uri
+        path, _, query = uri.partition('?')
+        self.path = path
+        self.args = http.parse_qs(query, 1) if query else {}
+        self.received_headers = dict((name.lower(), value) for name, value in headers.iteritems())
+        self.responseHeaders = Headers()
+        self.content = None
+        self.user = user
+        self.authenticated_with = authenticated_with
+        self.code = http.OK
+        self.written = []
+        self.startedWriting = False
+        self.finished = False
+        self.producer = None
+        self._finished = defer.Deferred()
+
+    def getHeader(self, name):
+        return self.received_headers.get(name.lower())
+
+    def setHeader(self, name, value):
+        self.responseHeaders.setRawHeaders(name, [value])
+
+    def setResponseCode(self, code, message=None):
+        self.code = code
+
+    def setETag(self, etag):
+        """ Set the header, sub-requests are never conditional. """
+        self.setHeader('etag', etag)
+
+    def setLastModified(self, when):
+        """ Set the header, sub-requests are never conditional. """
+        self.setHeader('last-modified', http.datetimeToString(when))
+
+    def write(self, data):
+        if data:
+            self.startedWriting = True
+            self.written.append(data)
+
+    def registerProducer(self, producer, streaming):
+        """ Pull everything from the producer right away. """
+
+        self.producer = producer
+        if streaming:
+            producer.resumeProducing()
+        else:
+            while self.producer is producer and not self.finished:
+                producer.resumeProducing()
+
+    def unregisterProducer(self):
+        self.producer = None
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            self._finished.callback(None)
+
+    def notifyFinish(self):
+        """ Return a deferred that fires when the response is complete. """
+        return self._finished
+
+
+#
+#  batch.py ends here
@@ -15,6 +15,15 @@ from http import Response, BadRequest, NotAcceptable
 import util
 
 
+# cache of Content-Type header values: (content type, charset) -> header
+_content_type_headers = {}
+
+# shared header dicts: (content type, charset) -> {'Content-Type': ...}
+_shared_headers = {}
+
+_non_ascii = re.compile('[\x80-\xff]').search
+
+
 class DataMapper(object):
     """ Base class for all data mappers.
 
@@ -24,12 +33,26 @@ class DataMapper(object):
     content_type = 'text/plain'
     charset = 'utf-8'
 
+    """ Only used for parsing requests.
+
+    The response of a request that was parsed with an input only mapper
+    is formatted based on the url or the Accept header instead.
+    """
+    input_only = False
+
+    """ Content type of the responses to requests parsed with an input
+    only mapper when the url or the Accept header doesn't name one. """
+    output_content_type = None
+
     def encode(self, response):
         """ Format the data.
 
         In derived classed, it is usually better idea to override
         ``_format_data()`` than this method.
 
+        The content of the returned response is always a byte string
+        (encoded in ``charset``) or an iterable of byte strings.
+
         :param response: diablo's ``Response`` object or the data
                          itself. May also be ``None``.
         :return: diablo's ``Response``
@@ -53,6 +76,32 @@ class DataMapper(object):
         charset = charset or self.charset
         return self._parse_data(data, charset)
 
+    def decode_stream(self, stream, charset=None):
+        """ Parse the data from a file-like object.
+
+        Mappers that are able to parse incrementally should override this.
+        By default, reads the whole stream and calls ``decode()``.
+
+        :param stream: file-like object holding the data
+        :param charset: the charset of the data.
+        :returns: the parsed data or ``None`` if the stream is empty.
+        """
+
+        data = stream.read()
+        return self.decode(data, charset) if data else None
+
+    def for_request(self, request, resource):
+        """ Return the mapper to use for this particular request.
+
+        Mappers that have per request variants (e.g. pretty printed
+        output) can override this. By default returns ``self``.
+
+        :param request: the HTTP request
+        :param resource: the invoked resource
+        """
+
+        return self
+
     def _decode_data(self, data, charset):
         """ Decode string data.
 
@@ -60,21 +109,38 @@ class DataMapper(object):
         """
 
         try:
+            if data.__class__ is str:
+                return data.decode(charset)
             return util.force_unicode(data, charset)
         except UnicodeDecodeError:
             raise BadRequest('wrong charset')
 
     def _encode_data(self, data):
-        """ Encode string data. """
+        """ Encode string data.
+
+        Byte strings are assumed to be utf-8 (or ascii) and are passed
+        through as they are if no re-encoding is needed.
+
+        :returns: byte string
+        """
+
+        if data.__class__ is str:
+            if self.charset == 'utf-8' or not _non_ascii(data):
+                return data
+        elif data.__class__ is unicode:
+            return data.encode(self.charset)
         return util.smart_str(data, self.charset)
 
     def _format_data(self, data, charset):
         """ Format the data
 
         @param data the data (may be None)
+        :returns: byte string or an iterable of byte strings
         """
 
-        return self._encode_data(data) if data else u''
+        if data.__class__ not in (str, unicode):
+            data = _materialize(data)
+        return self._encode_data(data) if data else ''
 
     def _parse_data(self, data, charset):
         """ Parse the data
@@ -96,22 +162,65 @@ class DataMapper(object):
         return response
 
     def _finalize_response(self, response):
-        """ Convert the ``Response`` object into diablo ``Response``
+        """ Add content headers to the ``Response`` (in place).
 
         :return: diablo's ``Response``
         """
 
-        headers = {'Content-Type': self._get_content_type(),
-                   'Content-Length': len(response.content)}
+        content = response.content
+        if content.__class__ is unicode:
+            # mappers should return bytes but encode here just in case
+            content = response.content = content.encode(self.charset or 'utf-8')
+        elif content is None:
+            content = response.content = ''
+        headers = self._get_headers()
+        if content.__class__ is str:
+            headers = dict(headers)
+            headers['Content-Length'] = len(content)
+            response.addHeaders(headers)
+        else:
+            # content is an iterable of chunks, length is unknown
+            response.shareHeaders(headers)
+        return response
+
+    def _get_headers(self):
+        """ Return the (shared) dict of constant headers. """
 
-        res = Response(content=response.content, headers=headers)
-        # status_code is set separately to allow zero
-        res.code = response.code
-        return res
+        headers = _shared_headers.get((self.content_type, self.charset))
+        if headers is None:
+            headers = _shared_headers[(self.content_type, self.charset)] = {
+                'Content-Type': self._get_content_type()}
+        return headers
 
     def _get_content_type(self):
-        """ Return Content-Type header with charset info. """
-        return '%s; charset=%s' % (self.content_type, self.charset)
+        """ Return Content-Type header with charset info.
+
+        Binary formats (``charset`` is ``None``) have no charset info.
+        The header values are built once and cached.
+        """
+
+        key = (self.content_type, self.charset)
+        try:
+            return _content_type_headers[key]
+        except KeyError:
+            if self.charset is None:
+                header = self.content_type
+            else:
+                header = '%s; charset=%s' % key
+            _content_type_headers[key] = header
+            return header
+
+
+def _materialize(data):
+    """ Turn the iterators (e.g. generators) in the data into lists. """
+
+    if isinstance(data, dict):
+        return dict((key, _materialize(value)) for key, value in data.iteritems())
+    elif isinstance(data, tuple):
+        return tuple(_materialize(item) for item in data)
+    elif isinstance(data, list) or util.is_iterator(data):
+        return [_materialize(item) for item in data]
+    return data
 
 
 class DataMapperManager(object):
@@ -153,32 +262,41 @@ class DataMapperManager(object):
         mappers = dict([(name, mapper) for name in cont_type_names])
         self._datamappers.update(mappers)
 
-    def select_encoder(self, request, resource):
+    def select_encoder(self, request, resource, accept=True):
         """ Select appropriate formatter based on the request.
 
         :param request: the HTTP request
         :param resource: the invoked resource
+        :param accept: ``False`` if the Accept header should be ignored
+                       (e.g. it names the format of an event stream)
         """
 
         # 1. get from resource
-        if resource.mapper:
+        if resource.mapper and not _is_input_only(resource.mapper):
             return resource.mapper
         # 2. get from content
+        output_content_type = None
         mapper_name = self._get_name_from_content_type(request)
         if mapper_name:
-            return self._get_mapper(mapper_name)
+            mapper = self._get_mapper(mapper_name)
+            if not _is_input_only(mapper):
+                return mapper
+            output_content_type = getattr(mapper, 'output_content_type', None)
         # 3. get from url
         mapper_name = self._get_name_from_url(request)
         if mapper_name:
             return self._get_mapper(mapper_name)
         # 4. get from accept header
-        mapper_name = self._get_name_from_accept(request)
-        if mapper_name:
+        mapper_name = self._get_name_from_accept(request) if accept else None
+        if mapper_name and not (output_content_type and mapper_name == '*/*'):
             return self._get_mapper(mapper_name)
-        # 5. use resource's default
+        # 5. use the output format of the input only mapper
+        if output_content_type:
+            return self._get_mapper(output_content_type)
+        # 6. use resource's default
         if resource.default_mapper:
             return resource.default_mapper
-        # 6. use manager's default
+        # 7. use manager's default
         return self._get_default_mapper()
 
     def select_decoder(self, request, resource):
@@ -318,15 +436,41 @@ class DataMapperManager(object):
 manager = DataMapperManager()
 
 
+def _is_input_only(mapper):
+    """ Check whether the mapper only parses (e.g. multipart uploads). """
+    return getattr(mapper, 'input_only', False)
+
+
+def _bind_mapper(mapper, request, resource):
+    """ Give the mapper a chance to specialize itself for the request. """
+    for_request = getattr(mapper, 'for_request', None)
+    return for_request(request, resource) if for_request else mapper
+
+
 # utility function to format outgoing data (selects formatter automatically)
 def encode(request, response, resource):
-    return manager.select_encoder(request, resource).encode(response)
+    mapper = manager.select_encoder(request, resource)
+    return _bind_mapper(mapper, request, resource).encode(response)
+
+
+# utility function to get the formatter of a request (e.g. for encoding many times)
+def get_encoder(request, resource, accept=True):
+    mapper = manager.select_encoder(request, resource, accept)
+    return _bind_mapper(mapper, request, resource)
 
 
 # utility function to parse incoming data (selects parser automatically)
 def decode(data, request, resource):
     charset = util.get_charset(request)
-    return manager.select_decoder(request, resource).decode(data, charset)
+    mapper = manager.select_decoder(request, resource)
+    return _bind_mapper(mapper, request, resource).decode(data, charset)
+
+
+# utility function to parse incoming data from a stream (selects parser automatically)
+def decode_stream(stream, request, resource):
+    charset = util.get_charset(request)
+    mapper = manager.select_decoder(request, resource)
+    return _bind_mapper(mapper, request, resource).decode_stream(stream, charset)
 
 
 #
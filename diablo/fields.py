@@ -0,0 +1,95 @@
+#  -*- coding: utf-8 -*-
+#  fields.py ---
+#
+#  Sparse fieldsets: ?fields=id,name,vendor.name
+#
+
+
+from itertools import imap, repeat
+
+from diablo.http import BadRequest
+from diablo.util import is_iterator
+
+
+# parsed selections by the query argument, clients tend to repeat them
+_parsed = {}
+_max_parsed = 256
+
+
+def parse_fields(value):
+    """ Parse the value of a ``fields`` query argument.
+
+    Fields are separated by commas and nested fields are given as dotted
+    paths. The result is a tree of dicts where ``None`` means that the
+    whole value of the field is selected.
+
+    E.g.  id,vendor.name,vendor.country  ->
+    {'id': None, 'vendor': {'name': None, 'country': None}}
+
+    :returns: the tree or ``None`` if no fields are given. The tree is a
+              copy, so the caller may modify it.
+    :raises: ``BadRequest`` if a path is malformed
+    """
+
+    try:
+        return _copy(_parsed[value])
+    except KeyError:
+        pass
+    tree = {}
+    for path in value.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        names = path.split('.')
+        if not all(names):
+            raise BadRequest('invalid field: %s' % (path,))
+        node = tree
+        for name in names[:-1]:
+            child = node.get(name, {})
+            if child is None:
+                # the whole field is already selected
+                break
+            node = node.setdefault(name, child)
+        else:
+            node[names[-1]] = None
+    tree = tree or None
+    if len(_parsed) >= _max_parsed:
+        _parsed.clear()
+    _parsed[value] = tree
+    return _copy(tree)
+
+
+def project(data, fields):
+    """ Select the fields from the data.
+
+    Dicts keep only the selected keys (missing ones are ignored), lists
+    and iterators are projected item by item (iterators lazily) and
+    other values are returned as they are.
+
+    :param fields: tree returned by ``parse_fields()``
+    """
+
+    if fields is None:
+        return data
+    elif isinstance(data, dict):
+        result = {}
+        for name, subfields in fields.iteritems():
+            if name in data:
+                value = data[name]
+                result[name] = value if subfields is None else project(value, subfields)
+        return result
+    elif isinstance(data, (list, tuple)):
+        return [project(item, fields) for item in data]
+    elif is_iterator(data):
+        return imap(project, data, repeat(fields))
+    return data
+
+
+def _copy(tree):
+    if tree is None:
+        return None
+    return dict((name, _copy(subfields)) for name, subfields in tree.iteritems())
+
+
+#
+#  fields.py ends here
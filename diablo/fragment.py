@@ -0,0 +1,73 @@
+#  -*- coding: utf-8 -*-
+#  fragment.py ---
+#
+#  Pre-encoded pieces of response data.
+#
+
+
+class Fragment(object):
+    """ Piece of response data that is already encoded.
+
+    Fragments can be placed anywhere in the response data. ``JsonMapper``
+    and ``XmlMapper`` splice their bytes into the output verbatim instead
+    of encoding the data again.
+
+    The encodings can be given per format (``json``, ``xml``). They must
+    be byte strings in the charset of the mapper (utf-8 by default). For
+    xml, the fragment is the content of the element it's placed in.
+
+    If there's no encoding for a format, ``data`` is encoded the first
+    time it's needed and the result is cached in the fragment. So a
+    fragment that is kept (e.g. in a cache of product cards) is encoded
+    only once per mapper.
+
+    Example::
+
+        card = Fragment(json='{"id":1,"name":"Snowboard"}')
+        profile = Fragment(user)   # encoded lazily
+        return {'cards': [card], 'profile': profile}
+    """
+
+    __slots__ = ('data', '_encodings')
+
+    def __init__(self, data=None, **encodings):
+        """ Initialize the fragment.
+
+        :param data: the data of the fragment (for lazily built encodings)
+        :param encodings: byte strings by format name
+        """
+
+        for value in encodings.itervalues():
+            if not isinstance(value, str):
+                raise TypeError('fragment encodings must be byte strings')
+        self.data = data
+        self._encodings = encodings
+
+    def encoded(self, fmt, cache_key, encode):
+        """ Return the encoding of the fragment.
+
+        :param fmt: name of the format (e.g. ``json``)
+        :param cache_key: key for caching the encoding built by ``encode``.
+                          Identifies the encoder and its settings.
+        :param encode: function that encodes ``data`` into a byte string.
+                       Called if there's no encoding for the format.
+        :returns: byte string
+        """
+
+        encodings = self._encodings
+        try:
+            return encodings[fmt]
+        except KeyError:
+            pass
+        try:
+            return encodings[cache_key]
+        except KeyError:
+            encoded = encodings[cache_key] = encode(self.data)
+            return encoded
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.data)
+
+
+#
+#  fragment.py ends here
@@ -6,9 +6,16 @@
 #
 
 
+import os
+import re
+import urllib
+
 from twisted.web import http
 
 
+_control_chars = re.compile(u'[\x00-\x1f\x7f]')
+
+
 class HTTPError(Exception):
     def __init__(self, code, content=None):
         self.code = code
@@ -45,6 +52,11 @@ class Conflict(HTTPError):
         HTTPError.__init__(self, http.CONFLICT, content)
 
 
+class RequestEntityTooLarge(HTTPError):
+    def __init__(self, content=None):
+        HTTPError.__init__(self, http.REQUEST_ENTITY_TOO_LARGE, content)
+
+
 class InternalServerError(HTTPError):
     def __init__(self, content=None):
         HTTPError.__init__(self, http.INTERNAL_SERVER_ERROR, content)
@@ -56,6 +68,21 @@ class NotAcceptable(HTTPError):
 
 
 class Response(object):
+    """ HTTP response of a resource.
+
+    One ``Response`` is created per request and it is updated in place as
+    it passes through serializing, formatting and writing.
+
+    Header dicts can be shared between responses (e.g. the constant
+    headers of a mapper, see ``shareHeaders()``). A shared dict is copied
+    the first time it is modified through ``headers`` or ``setHeader()``.
+    Use ``iterheaders()`` and ``getHeader()`` for reading so that the
+    dict isn't copied needlessly. The dict given to the constructor
+    belongs to the caller (e.g. a module level constant) and is treated
+    as shared too.
+    """
+
+    __slots__ = ('code', 'content', '_headers', '_shared')
 
     @classmethod
     def fromError(cls, error):
@@ -64,14 +91,160 @@ class Response(object):
     def __init__(self, code=None, content=None, headers=None):
         self.code = code
         self.content = content or ''
-        self.headers = headers if headers is not None else {}
+        if headers is None:
+            self._headers = {}
+            self._shared = False
+        else:
+            self._headers = headers
+            self._shared = True
+
+    def _get_headers(self):
+        if self._shared:
+            self._headers = dict(self._headers)
+            self._shared = False
+        return self._headers
+
+    def _set_headers(self, headers):
+        self._headers = headers
+        self._shared = False
+
+    headers = property(_get_headers, _set_headers, doc="""
+        The header dict (a private copy, safe to modify). """)
+
+    def shareHeaders(self, headers):
+        """ Add headers from a dict that is shared with other responses.
+
+        If the response has no headers of its own, the dict is used as
+        it is (and copied only if the response is modified later).
+        Otherwise the headers are added to the response's own dict.
+        """
+
+        if not self._headers:
+            self._headers = headers
+            self._shared = True
+        else:
+            self.headers.update(headers)
+
+    def addHeaders(self, headers):
+        """ Add headers from a dict that the caller hands over.
+
+        If the response has no headers of its own, the dict is taken
+        into use as it is, so the caller must not modify it afterwards.
+        """
+
+        if not self._headers:
+            self._headers = headers
+            self._shared = False
+        else:
+            self.headers.update(headers)
+
+    def setHeader(self, name, value):
+        self.headers[name] = value
+
+    def getHeader(self, name, default=None):
+        return self._headers.get(name, default)
+
+    def iterheaders(self):
+        """ Iterate over the ``(name, value)`` pairs of the headers. """
+        return self._headers.iteritems()
 
     def __repr__(self):
         return '%s: code[%d], content[%s], headers[%s]' % (
             self.__class__.__name__,
             self.code,
             self.content,
-            repr(self.headers))
+            repr(self._headers))
+
+
+class RawResponse(Response):
+    """ Response with content that is already encoded.
+
+    The content (a byte string) is written as it is. There's no
+    serializing, content negotiation or datamapper involved. Useful for
+    cached renditions and blobs from storage.
+
+    If ``etag`` or ``last_modified`` (seconds since the epoch) is given,
+    conditional GET requests are answered with ``304 Not Modified``.
+    """
+
+    __slots__ = ('etag', 'last_modified')
+
+    def __init__(self, content, content_type, code=http.OK, headers=None,
+                 etag=None, last_modified=None):
+        if not isinstance(content, str):
+            raise TypeError('RawResponse content must be a byte string')
+        Response.__init__(self, code, content, headers)
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers['Content-Type'] = content_type
+        self.headers['Content-Length'] = len(content)
+
+
+class FileResponse(RawResponse):
+    """ Response with the content of a file.
+
+    The file is never read into memory as a whole. It's written in
+    chunks by a producer as the transport asks for more data. Requests
+    for a single byte range (``Range: bytes=...``) are answered with
+    ``206 Partial Content`` or ``416`` if the range is outside the file.
+    Conditional GET is handled like with ``RawResponse``.
+
+    ``file`` is either a path or a file-like object with ``read()``,
+    ``seek()`` and ``tell()`` (e.g. a blob from storage). The whole file
+    is served and it's closed once the response has been written. For a
+    path, ``last_modified`` defaults to the modification time of the file.
+
+    If ``filename`` is given, the client is asked to save the content
+    with that name (Content-Disposition). Control characters are removed
+    from the name and non-ascii names are sent as ``filename*`` (RFC
+    5987) with an ascii fallback.
+    """
+
+    __slots__ = ('file', 'size')
+
+    def __init__(self, file, content_type='application/octet-stream',
+                 code=http.OK, headers=None, etag=None, last_modified=None,
+                 filename=None):
+        Response.__init__(self, code, '', headers)
+        if isinstance(file, basestring):
+            file = open(file, 'rb')
+            if last_modified is None:
+                last_modified = int(os.fstat(file.fileno()).st_mtime)
+        file.seek(0, os.SEEK_END)
+        self.size = file.tell()
+        file.seek(0)
+        self.file = file
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers['Content-Type'] = content_type
+        self.headers['Content-Length'] = self.size
+        if filename:
+            self.headers['Content-Disposition'] = _content_disposition(filename)
+
+    def __repr__(self):
+        return '%s: code[%d], file[%r], size[%d]' % (
+            self.__class__.__name__,
+            self.code,
+            self.file,
+            self.size)
+
+
+def _content_disposition(filename):
+    """ Build the Content-Disposition header for saving as filename.
+
+    :param filename: unicode or utf-8 encoded byte string
+    """
+
+    if not isinstance(filename, unicode):
+        filename = filename.decode('utf-8', 'replace')
+    filename = _control_chars.sub(u'', filename)
+    fallback = filename.encode('ascii', 'replace')
+    header = 'attachment; filename="%s"' % (
+        fallback.replace('\\', '\\\\').replace('"', '\\"'),)
+    if fallback != filename:
+        header += "; filename*=UTF-8''" + urllib.quote(
+            filename.encode('utf-8'), safe="!#$&+^`|~")
+    return header
 
 
 #
@@ -3,14 +3,26 @@
 #  created: 2012-04-08 13:43:27
 #
 
+from csvmapper import CsvMapper, TsvMapper
 from jsonmapper import JsonMapper
+from msgpackmapper import MsgPackMapper
+from multipartmapper import MultipartMapper
+from ndjsonmapper import NdJsonMapper
+from patchmapper import JsonPatchMapper, MergePatchMapper
 from xmlmapper import XmlMapper
 from xmlrpcmapper import XmlRpcMapper
 from yamlmapper import YamlMapper
 
 
 __all__ = (
+    CsvMapper,
     JsonMapper,
+    JsonPatchMapper,
+    MergePatchMapper,
+    MsgPackMapper,
+    MultipartMapper,
+    NdJsonMapper,
+    TsvMapper,
     XmlMapper,
     XmlRpcMapper,
     YamlMapper
@@ -0,0 +1,230 @@
+#  -*- coding: utf-8 -*-
+#  csvmapper.py ---
+#
+#  CSV and TSV mappers for tabular data
+#
+
+
+import csv
+from itertools import chain, islice, izip
+from operator import itemgetter
+
+from diablo.datamapper import DataMapper
+from diablo.http import BadRequest
+from diablo.util import is_iterator, join_chunks
+
+
+class _Lines(list):
+    """ File-like target for ``csv.writer`` that collects the lines. """
+    write = list.append
+
+
+class CsvMapper(DataMapper):
+    """ CSV mapper.
+
+    Formats a list (or an iterator) of rows. Rows are dicts or sequences.
+    The header row is written once, followed by the rows. Iterators are
+    streamed a batch of rows at a time.
+
+    The columns (and their order) are taken from the ``csv_columns``
+    attribute of the resource, if it has one, otherwise from the sorted
+    keys of the first row. Sequence rows are written as they are and
+    get a header row only if the columns are declared.
+
+    Parsing returns a ``CsvReader`` which yields each row as a dict keyed
+    by the header row.
+
+    Example::
+
+        class Report(Resource):
+            csv_columns = ('date', 'product', 'amount')
+    """
+
+    content_type = 'text/csv'
+    dialect = 'excel'
+
+    """ Number of rows encoded at a time when streaming. """
+    batch_size = 500
+
+    def __init__(self, columns=None):
+        """ Initialize the mapper.
+
+        :param columns: default column order
+        """
+
+        self.columns = tuple(columns) if columns else None
+        self._variants = {}
+
+    def for_request(self, request, resource):
+        """ Return a mapper using the column order of the resource. """
+
+        columns = getattr(resource, 'csv_columns', None)
+        if not columns:
+            return self
+        columns = tuple(columns)
+        mapper = self._variants.get(columns)
+        if mapper is None:
+            mapper = self._variants[columns] = self.__class__(columns)
+        return mapper
+
+    def iterencode(self, data):
+        """ Encode the data a batch of rows at a time.
+
+        :returns: generator of byte strings
+        """
+
+        if data is None or data == '':
+            return
+        if isinstance(data, dict):
+            data = (data,)
+        rows = iter(data)
+        try:
+            first = rows.next()
+        except StopIteration:
+            if self.columns:
+                yield self._encode_rows([self.columns])
+            return
+
+        columns = self.columns
+        if columns is None and isinstance(first, dict):
+            columns = sorted(first)
+        if columns is not None:
+            yield self._encode_rows([columns])
+        if isinstance(first, dict):
+            rows = self._project(first, rows, columns)
+        else:
+            rows = chain((first,), rows)
+
+        batch_size = self.batch_size
+        while True:
+            chunk = self._encode_rows(list(islice(rows, batch_size)))
+            if not chunk:
+                break
+            yield chunk
+
+    def decode_stream(self, stream, charset=None):
+        """ Read the rows straight from the file-like object. """
+        return CsvReader(stream, charset or self.charset, self.dialect)
+
+    def _format_data(self, data, charset):
+        if is_iterator(data):
+            return join_chunks(self.iterencode(data))
+        return ''.join(self.iterencode(data))
+
+    def _parse_data(self, data, charset):
+        return CsvReader(data.splitlines(True), charset, self.dialect)
+
+    def _encode_rows(self, rows):
+        """ Write the rows with the C writer.
+
+        The writer accepts byte strings, numbers and ascii unicode as
+        they are. Only if there is other unicode, the unicode values of
+        the rows are encoded and the rows written again.
+
+        :returns: byte string
+        """
+
+        lines = _Lines()
+        try:
+            csv.writer(lines, dialect=self.dialect).writerows(rows)
+        except UnicodeEncodeError:
+            lines = _Lines()
+            csv.writer(lines, dialect=self.dialect).writerows(
+                [self._cell(value) for value in row] for row in rows)
+        return ''.join(lines)
+
+    def _project(self, first, rows, columns):
+        """ Turn dict rows into tuples of values in the column order. """
+
+        if len(columns) == 1:
+            column = columns[0]
+            getter = lambda row: (row[column],)
+        else:
+            getter = itemgetter(*columns)
+        for row in chain((first,), rows):
+            try:
+                yield getter(row)
+            except KeyError:
+                yield tuple(row.get(column) for column in columns)
+
+    def _cell(self, value):
+        """ Convert a value into something the csv writer accepts. """
+
+        if value.__class__ is unicode:
+            return value.encode(self.charset)
+        return value
+
+
+class TsvMapper(CsvMapper):
+    """ Tab separated values mapper. """
+
+    content_type = 'text/tab-separated-values'
+    dialect = 'excel-tab'
+
+
+class CsvReader(object):
+    """ Iterator over the rows of CSV data.
+
+    The first row is the header. Each following row is returned as a
+    dict from the header names to the values (both unicode). Empty lines
+    are skipped. Rows with the wrong number of values raise
+    ``BadRequest``.
+    """
+
+    def __init__(self, lines, charset='utf-8', dialect='excel'):
+        """ Initialize the reader.
+
+        :param lines: iterable of lines (e.g. a file-like object)
+        """
+
+        self.charset = charset
+        self._reader = csv.reader(lines, dialect=dialect)
+        self._header = None
+
+    def __iter__(self):
+        return self
+
+    @property
+    def header(self):
+        """ The column names or ``None`` if there's no data. """
+
+        if self._header is None:
+            row = self._next_row()
+            if row is not None:
+                self._header = self._decode(row)
+        return self._header
+
+    def next(self):
+        """ Return the next row as a dict. """
+
+        header = self.header
+        if header is None:
+            raise StopIteration()
+        row = self._next_row()
+        if row is None:
+            raise StopIteration()
+        if len(row) != len(header):
+            raise BadRequest('line %d: expected %d values, got %d' % (
+                self._reader.line_num, len(header), len(row)))
+        return dict(izip(header, self._decode(row)))
+
+    def _next_row(self):
+        """ Return the next non-empty row or ``None``. """
+
+        try:
+            for row in self._reader:
+                if row:
+                    return row
+        except csv.Error, exc:
+            raise BadRequest('line %d: %s' % (self._reader.line_num, exc))
+        return None
+
+    def _decode(self, row):
+        try:
+            return [value.decode(self.charset) for value in row]
+        except UnicodeDecodeError:
+            raise BadRequest('wrong charset')
+
+
+#
+#  csvmapper.py ends here
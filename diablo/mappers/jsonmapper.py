@@ -6,38 +6,203 @@
 #
 
 
-try: 
+from decimal import Decimal
+
+try:
   import simplejson as json
 except:
   import json
 
+from diablo.adapters import registry as adapters
 from diablo.datamapper import DataMapper
+from diablo.fragment import Fragment
+from diablo.util import is_iterator, join_chunks
 from diablo import http
 
 
+# the json backend is picked once at import time. both simplejson and the
+# standard library json ship a C encoder but they only use it when the
+# output is not indented.
+json_backend = json.__name__
+json_speedups = getattr(json.encoder, 'c_make_encoder', None) is not None
+
+
+class _NestedIterator(TypeError):
+    """ Raised by the encoder when it comes across an iterator. """
+
+
+class _NestedFragment(TypeError):
+    """ Raised by the encoder when it comes across a ``Fragment``. """
+
+
 class JsonMapper(DataMapper):
     content_type = 'application/json'
+    stream_chunk_size = 65536
 
-    def __init__(self, use_decimal=False):
+    def __init__(self, use_decimal=False, pretty=False, ensure_ascii=True):
         """ Initialize JSON mapper with appropriate use of numbers.
 
         :param use_decimal: ``True`` if numbers should be converted
                             into ``Decimal``s.
+        :param pretty: ``True`` if the output should be indented. By
+                       default the output is compact. Clients may also
+                       ask for indented output with ``?pretty=1``.
+        :param ensure_ascii: ``False`` if non-ascii characters should be
+                             written as such (in ``charset``) instead of
+                             ``\\uXXXX`` escapes.
         """
 
         self.use_decimal = use_decimal
+        self.pretty = pretty
+        self.ensure_ascii = ensure_ascii
+        self._encoder = json.JSONEncoder(
+            default=self._default, **self._get_encoder_params())
+        self._pretty_mapper = None
+
+    def for_request(self, request, resource):
+        """ Return the pretty printing twin if ``?pretty=1`` is given. """
+
+        if self.pretty or not self._is_pretty_requested(request):
+            return self
+        if self._pretty_mapper is None:
+            self._pretty_mapper = self.__class__(
+                use_decimal=self.use_decimal,
+                pretty=True,
+                ensure_ascii=self.ensure_ascii)
+        return self._pretty_mapper
+
+    def iterencode(self, data):
+        """ Encode the data incrementally.
+
+        Lists, tuples and dicts that don't contain iterators are encoded
+        in one go using the (C) encoder. Iterators, including the ones
+        nested in other structures, are consumed one item at a time so
+        that only a single item needs to be in memory at a time.
+
+        ``Fragment``s are written as they are.
+
+        Streamed output is never indented.
+
+        :returns: generator of json chunks
+        """
+
+        encode = self._encode
+        if isinstance(data, Fragment):
+            yield data.encoded('json', self, self._encode_fragment)
+            return
+        elif is_iterator(data):
+            yield '['
+            for i, item in enumerate(data):
+                if i:
+                    yield ','
+                for chunk in self.iterencode(item):
+                    yield chunk
+            yield ']'
+            return
+
+        try:
+            yield encode(data)
+            return
+        except (_NestedIterator, _NestedFragment):
+            pass
+
+        # there's an iterator or a fragment somewhere inside the data
+        if isinstance(data, dict):
+            yield '{'
+            for i, (key, value) in enumerate(data.iteritems()):
+                if not isinstance(key, basestring):
+                    key = encode(key)
+                yield (',' if i else '') + encode(key) + ':'
+                for chunk in self.iterencode(value):
+                    yield chunk
+            yield '}'
+        else:
+            yield '['
+            for i, item in enumerate(data):
+                if i:
+                    yield ','
+                if item.__class__ is Fragment:
+                    # shortcut for lists of fragments
+                    yield item.encoded('json', self, self._encode_fragment)
+                    continue
+                for chunk in self.iterencode(item):
+                    yield chunk
+            yield ']'
 
     def _format_data(self, data, charset):
         if data is None or data == '':
-            return u''
+            return ''
+        elif is_iterator(data):
+            return join_chunks(self.iterencode(data))
         else:
-            params = {
-                'indent': 4,
-                'ensure_ascii': True,
-                'encoding': charset,
-                }
-            self._maybe_add_use_decimal(params)
-            return json.dumps(data, **params)
+            try:
+                return self._encode(data)
+            except (_NestedIterator, _NestedFragment):
+                # iterators next to fragments are streamed as well
+                return join_chunks(self.iterencode(data))
+
+    def _encode(self, data):
+        """ Encode the data in one go into a byte string. """
+
+        content = self._encoder.encode(data)
+        if isinstance(content, unicode):
+            # only happens with ensure_ascii=False
+            content = content.encode(self.charset)
+        return content
+
+    def _encode_fragment(self, data):
+        """ Encode the data of a ``Fragment`` that has no json encoding. """
+        return ''.join(self.iterencode(data))
+
+    def _default(self, obj):
+        """ Called by the encoder for objects it doesn't know.
+
+        Custom types are converted by their adapters (see
+        ``diablo.adapters``).
+        """
+
+        adapter = adapters.lookup(obj.__class__)
+        if adapter is not None:
+            return adapter(obj)
+        elif is_iterator(obj):
+            raise _NestedIterator()
+        elif isinstance(obj, Fragment):
+            raise _NestedFragment()
+        raise TypeError(repr(obj) + ' is not JSON serializable')
+
+    def decode_stream(self, stream, charset=None):
+        """ Parse json from a file-like object.
+
+        If the top-level value is an array, returns an iterator that
+        reads the stream in chunks and yields the elements of the array
+        as soon as they are complete. Otherwise the whole stream is read
+        and parsed.
+
+        :returns: the parsed data, an iterator for arrays or ``None`` if
+                  the stream is empty.
+        """
+
+        charset = charset or self.charset
+        head = stream.read(self.stream_chunk_size)
+        start = head.lstrip()[:1]
+        if not start:
+            return None
+        elif start != '[':
+            return self._parse_data(head + stream.read(), charset)
+        else:
+            return self._iterdecode(stream, head, charset)
+
+    def _iterdecode(self, stream, head, charset):
+        """ Generator that feeds the stream into ``JsonArrayDecoder``. """
+
+        decoder = JsonArrayDecoder(charset, self.use_decimal)
+        data = head
+        while data:
+            for item in decoder.feed(data):
+                yield item
+            data = stream.read(self.stream_chunk_size)
+        for item in decoder.close():
+            yield item
 
     def _parse_data(self, data, charset):
         params = {}
@@ -47,6 +212,26 @@ class JsonMapper(DataMapper):
         except ValueError:
             raise http.BadRequest('unable to parse data')
 
+    def _get_encoder_params(self):
+        """ Return the parameters for the (reusable) ``JSONEncoder``. """
+
+        params = {
+            'ensure_ascii': self.ensure_ascii,
+            'encoding': self.charset,
+            }
+        if self.pretty:
+            params['indent'] = 4
+        else:
+            params['separators'] = (',', ':')
+        self._maybe_add_use_decimal(params)
+        return params
+
+    def _is_pretty_requested(self, request):
+        """ Check for the ``pretty`` query parameter. """
+
+        pretty = request.args.get('pretty', None)
+        return bool(pretty) and pretty[0] not in ('', '0', 'false')
+
     def _maybe_add_use_decimal(self, params):
         """ Maybe add ``use_decimal`` to the given parameters
 
@@ -57,5 +242,111 @@ class JsonMapper(DataMapper):
         if self.use_decimal:
             params['use_decimal'] = True
 
+
+class JsonArrayDecoder(object):
+    """ Incremental decoder for a top-level json array.
+
+    Data is given to the decoder in arbitrary pieces with ``feed()``
+    which returns the array elements that have been completed so far.
+    This works both with a file-like request body and with chunks
+    delivered by Twisted as they arrive (``Request.handleContentChunk``).
+
+    An element that spans several pieces is re-parsed only after the
+    amount of pending data has doubled, so large elements don't make
+    parsing quadratic.
+    """
+
+    _whitespace = ' \t\n\r'
+
+    def __init__(self, charset='utf-8', use_decimal=False):
+        params = {'encoding': charset}
+        if use_decimal:
+            params['parse_float'] = Decimal
+        self._decode = json.JSONDecoder(**params).raw_decode
+        self._buffer = ''
+        self._pos = 0
+        self._retry_at = 0
+        # start -> first -> (value -> separator)* -> end
+        self._state = 'start'
+
+    def feed(self, data):
+        """ Add data to the decoder.
+
+        :returns: list of the elements that were completed.
+        :raises: ``BadRequest`` if the data is not a valid json array.
+        """
+
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        if len(self._buffer) < self._retry_at:
+            return []
+        self._retry_at = 0
+        return self._parse(final=False)
+
+    def close(self):
+        """ Signal that all data has been given.
+
+        :returns: list of the remaining elements.
+        :raises: ``BadRequest`` if the array is incomplete.
+        """
+
+        self._retry_at = 0
+        items = self._parse(final=True)
+        if self._state != 'end':
+            raise http.BadRequest('unable to parse data')
+        return items
+
+    def _parse(self, final):
+        """ Parse as far as the buffered data allows. """
+
+        items = []
+        buf = self._buffer
+        end = len(buf)
+        pos = self._pos
+        while True:
+            while pos < end and buf[pos] in self._whitespace:
+                pos += 1
+            if pos == end:
+                break
+            state = self._state
+            char = buf[pos]
+            if state == 'start':
+                if char != '[':
+                    raise http.BadRequest('unable to parse data')
+                self._state = 'first'
+                pos += 1
+            elif state in ('first', 'value'):
+                if state == 'first' and char == ']':
+                    self._state = 'end'
+                    pos += 1
+                    continue
+                try:
+                    item, item_end = self._decode(buf, pos)
+                except ValueError:
+                    item_end = None
+                # a number at the end of the buffer may still continue
+                if item_end is None or (item_end == end and not final):
+                    if final:
+                        raise http.BadRequest('unable to parse data')
+                    self._retry_at = 2 * (end - pos)
+                    break
+                items.append(item)
+                self._state = 'separator'
+                pos = item_end
+            elif state == 'separator':
+                if char == ',':
+                    self._state = 'value'
+                elif char == ']':
+                    self._state = 'end'
+                else:
+                    raise http.BadRequest('unable to parse data')
+                pos += 1
+            else:
+                # only whitespace is allowed after the array
+                raise http.BadRequest('unable to parse data')
+        self._pos = pos
+        return items
+
+
 #
 # jsonmapper.py ends here
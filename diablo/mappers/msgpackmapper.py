@@ -0,0 +1,87 @@
+#  -*- coding: utf-8 -*-
+#  msgpackmapper.py ---
+#
+#  MessagePack mapper (https://msgpack.org/)
+#
+
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from diablo.adapters import registry as adapters
+from diablo.datamapper import DataMapper
+from diablo import http
+from diablo.mappers import pymsgpack
+
+
+if msgpack is not None:
+    def _packb(data, default=None):
+        return msgpack.packb(data, default=default, use_bin_type=False)
+
+    def _unpackb(data):
+        return msgpack.unpackb(data, raw=False)
+
+    _pack_errors = (TypeError, ValueError, OverflowError)
+    _unpack_errors = (ValueError, TypeError, msgpack.UnpackException)
+else:
+    _packb = pymsgpack.packb
+    _unpackb = pymsgpack.unpackb
+    _pack_errors = (TypeError, ValueError)
+    _unpack_errors = (ValueError,)
+
+
+class MsgPackMapper(DataMapper):
+    """ MessagePack mapper.
+
+    Uses the msgpack package (and its C extension) if installed and the
+    bundled pure python codec otherwise. MessagePack is a binary format
+    so the data is never charset encoded or decoded: strings are
+    written as utf-8 and read into unicode.
+    """
+
+    content_type = 'application/msgpack'
+    charset = None
+
+    def __init__(self, use_msgpack=True):
+        """ Initialize the mapper.
+
+        :param use_msgpack: ``False`` to use the bundled codec even if the
+                            msgpack package is available.
+        """
+
+        if use_msgpack:
+            self._packb, self._unpackb = _packb, _unpackb
+            self._pack_errors, self._unpack_errors = _pack_errors, _unpack_errors
+        else:
+            self._packb, self._unpackb = pymsgpack.packb, pymsgpack.unpackb
+            self._pack_errors, self._unpack_errors = (TypeError, ValueError), (ValueError,)
+
+    def _format_data(self, data, charset):
+        try:
+            return self._packb(data, default=self._default)
+        except self._pack_errors:
+            raise http.InternalServerError('unable to encode data')
+
+    def _parse_data(self, data, charset):
+        if not data:
+            return None
+        try:
+            return self._unpackb(data)
+        except self._unpack_errors:
+            raise http.BadRequest('unable to parse data')
+
+    def _default(self, obj):
+        """ Adapt custom types and pack iterators (e.g. generators) as arrays. """
+        adapter = adapters.lookup(obj.__class__)
+        if adapter is not None:
+            return adapter(obj)
+        try:
+            return list(iter(obj))
+        except TypeError:
+            raise TypeError('can not serialize %r' % (obj,))
+
+
+#
+#  msgpackmapper.py ends here
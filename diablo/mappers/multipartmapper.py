@@ -0,0 +1,342 @@
+#  -*- coding: utf-8 -*-
+#  multipartmapper.py ---
+#
+#  Streaming multipart/form-data decoder for file uploads
+#
+
+
+import cgi
+import copy
+from StringIO import StringIO
+from tempfile import SpooledTemporaryFile
+
+from diablo.datamapper import DataMapper
+from diablo.http import BadRequest, NotAcceptable, RequestEntityTooLarge
+
+
+class MultipartMapper(DataMapper):
+    """ Decoder for ``multipart/form-data`` uploads.
+
+    The body is parsed a chunk at a time and each part is written into a
+    ``SpooledTemporaryFile``: small parts stay in memory, parts larger
+    than ``memory_limit`` are spilled to a temporary file. So the size of
+    the upload doesn't decide how much memory the request takes. Use
+    with ``stream_input = True`` in the resource, otherwise the body is
+    read into a string before parsing.
+
+    Parsing returns a ``MultipartForm`` of ``Part``s. The caps raise
+    ``RequestEntityTooLarge`` (413) as soon as they are exceeded.
+
+    The mapper is input only: responses are formatted based on the url or
+    the Accept header, even if the resource uses this mapper.
+
+    Example::
+
+        class Upload(Resource):
+            stream_input = True
+            mapper = MultipartMapper(max_part_size=2 ** 30)
+
+            def post(self, form, request):
+                image = form['image']
+                store(image.filename, image.file)
+    """
+
+    content_type = 'multipart/form-data'
+    charset = 'utf-8'
+    input_only = True
+
+    """ Number of bytes read from the body at a time. """
+    chunk_size = 65536
+
+    """ Maximum size of the headers of a part. """
+    max_header_size = 16384
+
+    def __init__(self, memory_limit=512 * 1024, max_part_size=None,
+                 max_total_size=None):
+        """ Initialize the mapper.
+
+        :param memory_limit: parts larger than this (in bytes) are spilled
+                             to temporary files
+        :param max_part_size: maximum size of a single part or ``None``
+        :param max_total_size: maximum size of the body or ``None``
+        """
+
+        self.memory_limit = memory_limit
+        self.max_part_size = max_part_size
+        self.max_total_size = max_total_size
+        self.boundary = None
+
+    def for_request(self, request, resource):
+        """ Return a mapper bound to the boundary of the request. """
+
+        content_type, params = cgi.parse_header(
+            request.getHeader('content-type') or '')
+        length = request.getHeader('content-length')
+        if self.max_total_size is not None and length and length.isdigit():
+            if int(length) > self.max_total_size:
+                raise RequestEntityTooLarge('request body is too large')
+        mapper = copy.copy(self)
+        mapper.boundary = params.get('boundary')
+        return mapper
+
+    def decode_stream(self, stream, charset=None):
+        """ Parse the parts straight from the file-like object. """
+
+        if not self.boundary:
+            raise BadRequest('multipart boundary missing')
+        parser = MultipartParser(
+            stream, self.boundary, charset or self.charset, self)
+        form = MultipartForm(parser.parse())
+        return form if form.parts else None
+
+    def _format_data(self, data, charset):
+        raise NotAcceptable('multipart output is not supported')
+
+    def _parse_data(self, data, charset):
+        return self.decode_stream(StringIO(data), charset)
+
+
+class Part(object):
+    """ One part of a multipart form.
+
+    The content is in ``file`` (positioned at the start) which is either
+    in memory or a temporary file, depending on the size of the part.
+    """
+
+    __slots__ = ('name', 'filename', 'content_type', 'headers', 'file',
+                 'size', 'charset')
+
+    def __init__(self, headers, file, charset):
+        """ Initialize the part.
+
+        :param headers: dict of the headers of the part (lowercase names)
+        :param file: file object for the content
+        :param charset: charset of the form (for names and text values)
+        """
+
+        disposition, params = cgi.parse_header(
+            headers.get('content-disposition', ''))
+        content_type, type_params = cgi.parse_header(
+            headers.get('content-type', 'text/plain'))
+        self.headers = headers
+        self.name = self._decode(params.get('name'), charset)
+        self.filename = self._decode(params.get('filename'), charset)
+        self.content_type = content_type
+        self.charset = type_params.get('charset', charset)
+        self.file = file
+        self.size = 0
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    @property
+    def value(self):
+        """ The whole content decoded into unicode (for text fields). """
+
+        self.file.seek(0)
+        try:
+            return self.file.read().decode(self.charset)
+        except (UnicodeDecodeError, LookupError):
+            raise BadRequest('wrong charset in field %s' % (self.name,))
+
+    @property
+    def in_memory(self):
+        """ ``False`` if the content has been spilled to a file. """
+        return not self.file._rolled
+
+    def close(self):
+        self.file.close()
+
+    def _decode(self, value, charset):
+        if value is None:
+            return None
+        try:
+            return value.decode(charset)
+        except (UnicodeDecodeError, LookupError):
+            raise BadRequest('wrong charset in part headers')
+
+    def __repr__(self):
+        return '%s: name[%s], filename[%s], size[%d]' % (
+            self.__class__.__name__, self.name, self.filename, self.size)
+
+
+class MultipartForm(object):
+    """ The parts of a multipart form in the order they were sent.
+
+    ``form[name]`` returns the first part with the name and
+    ``form.getall(name)`` all of them. ``close()`` releases the
+    temporary files (they are also removed when garbage collected).
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    def __len__(self):
+        return len(self.parts)
+
+    def __contains__(self, name):
+        return any(part.name == name for part in self.parts)
+
+    def __getitem__(self, name):
+        for part in self.parts:
+            if part.name == name:
+                return part
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def getall(self, name):
+        return [part for part in self.parts if part.name == name]
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+
+
+class MultipartParser(object):
+    """ Incremental parser for a multipart body.
+
+    Only the unparsed tail of the body (at most one chunk plus the length
+    of the delimiter) is kept in memory, the content of the parts goes
+    into their files as it's parsed.
+    """
+
+    def __init__(self, stream, boundary, charset, mapper):
+        """ Initialize the parser.
+
+        :param stream: file-like object holding the body
+        :param boundary: the boundary from the Content-Type
+        :param charset: charset of the form
+        :param mapper: ``MultipartMapper`` giving the limits
+        """
+
+        self.stream = stream
+        self.delimiter = '\r\n--' + boundary
+        self.charset = charset
+        self.mapper = mapper
+        # the body starts with a delimiter without the preceding newline
+        self._buffer = '\r\n'
+        self._total = 0
+
+    def parse(self):
+        """ Parse the whole body.
+
+        :returns: list of ``Part``s
+        :raises: ``BadRequest`` or ``RequestEntityTooLarge``
+        """
+
+        parts = []
+        if not self._read_chunk():
+            # empty body
+            return parts
+        try:
+            # skip the preamble
+            self._read_until_delimiter(None)
+            while self._read_delimiter_end():
+                part = self._read_headers()
+                parts.append(part)
+                self._read_until_delimiter(part)
+                part.file.seek(0)
+        except Exception:
+            for part in parts:
+                part.close()
+            raise
+        return parts
+
+    def _read_chunk(self):
+        """ Read the next chunk into the buffer.
+
+        :returns: the chunk, empty at the end of the body
+        """
+
+        chunk = self.stream.read(self.mapper.chunk_size)
+        self._total += len(chunk)
+        limit = self.mapper.max_total_size
+        if limit is not None and self._total > limit:
+            raise RequestEntityTooLarge('request body is too large')
+        self._buffer += chunk
+        return chunk
+
+    def _fill(self):
+        """ Read the next chunk, the body must not end yet. """
+
+        if not self._read_chunk():
+            raise BadRequest('unexpected end of multipart data')
+
+    def _read_until_delimiter(self, part):
+        """ Write the data up to the next delimiter into the part. """
+
+        delimiter = self.delimiter
+        keep = len(delimiter) - 1
+        while True:
+            index = self._buffer.find(delimiter)
+            if index >= 0:
+                self._write(part, self._buffer[:index])
+                self._buffer = self._buffer[index + len(delimiter):]
+                return
+            # the end of the buffer may be the beginning of a delimiter
+            if len(self._buffer) > keep:
+                self._write(part, self._buffer[:-keep])
+                self._buffer = self._buffer[-keep:]
+            self._fill()
+
+    def _read_delimiter_end(self):
+        """ Consume the rest of the delimiter line.
+
+        :returns: ``False`` if it was the closing delimiter.
+        """
+
+        while len(self._buffer) < 2:
+            self._fill()
+        if self._buffer.startswith('--'):
+            return False
+        while '\r\n' not in self._buffer:
+            if len(self._buffer) > self.mapper.max_header_size:
+                raise BadRequest('invalid multipart delimiter')
+            self._fill()
+        padding, self._buffer = self._buffer.split('\r\n', 1)
+        if padding.strip(' \t'):
+            raise BadRequest('invalid multipart delimiter')
+        return True
+
+    def _read_headers(self):
+        """ Parse the headers of a part and create the part. """
+
+        while not self._buffer.startswith('\r\n') and '\r\n\r\n' not in self._buffer:
+            if len(self._buffer) > self.mapper.max_header_size:
+                raise BadRequest('multipart headers are too large')
+            self._fill()
+        if self._buffer.startswith('\r\n'):
+            head, self._buffer = '', self._buffer[2:]
+        else:
+            head, self._buffer = self._buffer.split('\r\n\r\n', 1)
+        headers = {}
+        for line in head.split('\r\n') if head else ():
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise BadRequest('invalid multipart header')
+            headers[name.strip().lower()] = value.strip()
+        return Part(headers, SpooledTemporaryFile(self.mapper.memory_limit),
+                    self.charset)
+
+    def _write(self, part, data):
+        """ Write data into the part and check its size. """
+
+        if part is None or not data:
+            return
+        part.size += len(data)
+        limit = self.mapper.max_part_size
+        if limit is not None and part.size > limit:
+            raise RequestEntityTooLarge('part %s is too large' % (part.name,))
+        part.file.write(data)
+
+
+#
+#  multipartmapper.py ends here
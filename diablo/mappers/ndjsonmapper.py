@@ -0,0 +1,103 @@
+#  -*- coding: utf-8 -*-
+#  ndjsonmapper.py ---
+#
+#  Newline delimited json (http://ndjson.org/)
+#
+
+
+from decimal import Decimal
+
+from diablo.mappers.jsonmapper import JsonMapper, json
+from diablo.util import is_iterator, join_chunks
+
+
+class NdJsonMapper(JsonMapper):
+    """ Newline delimited json mapper.
+
+    Each line holds one json document. When formatting, lists, tuples and
+    iterators are written one item per line (iterators are streamed),
+    anything else becomes a single line.
+
+    Parsing always returns an ``NdJsonReader`` which yields the documents
+    one by one. Lines that can't be parsed are skipped and reported in
+    the ``errors`` of the reader, so that one bad record doesn't fail the
+    whole upload.
+    """
+
+    content_type = 'application/x-ndjson'
+
+    def __init__(self, use_decimal=False, ensure_ascii=True):
+        JsonMapper.__init__(
+            self, use_decimal=use_decimal, ensure_ascii=ensure_ascii)
+
+    def for_request(self, request, resource):
+        """ There is no pretty printed ndjson. """
+        return self
+
+    def iterencode(self, data):
+        """ Encode the data one line at a time.
+
+        :returns: generator of lines
+        """
+
+        if not isinstance(data, (list, tuple)) and not is_iterator(data):
+            data = (data,)
+        for item in data:
+            yield ''.join(JsonMapper.iterencode(self, item)) + '\n'
+
+    def decode_stream(self, stream, charset=None):
+        """ Parse the lines straight from the file-like object. """
+        return NdJsonReader(stream, charset or self.charset, self.use_decimal)
+
+    def _format_data(self, data, charset):
+        if data is None or data == '':
+            return ''
+        elif is_iterator(data):
+            return join_chunks(self.iterencode(data))
+        else:
+            return ''.join(self.iterencode(data))
+
+    def _parse_data(self, data, charset):
+        return NdJsonReader(data.splitlines(), charset, self.use_decimal)
+
+
+class NdJsonReader(object):
+    """ Iterator over the documents of newline delimited json.
+
+    Empty lines are ignored. Lines that fail to parse are skipped and
+    recorded in ``errors`` as ``(line number, error message)`` pairs.
+    Line numbers start from 1.
+    """
+
+    def __init__(self, lines, charset='utf-8', use_decimal=False):
+        """ Initialize the reader.
+
+        :param lines: iterable of lines (e.g. a file-like object)
+        """
+
+        params = {'encoding': charset}
+        if use_decimal:
+            params['parse_float'] = Decimal
+        self.errors = []
+        self._decode = json.JSONDecoder(**params).decode
+        self._lines = enumerate(lines, 1)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """ Return the next parsed document. """
+
+        decode = self._decode
+        for lineno, line in self._lines:
+            if not line.strip():
+                continue
+            try:
+                return decode(line)
+            except ValueError, exc:
+                self.errors.append((lineno, str(exc)))
+        raise StopIteration()
+
+
+#
+#  ndjsonmapper.py ends here
@@ -0,0 +1,56 @@
+#  -*- coding: utf-8 -*-
+#  patchmapper.py ---
+#
+#  Decoders for PATCH bodies: JSON Patch and JSON Merge Patch
+#
+
+
+from diablo.mappers.jsonmapper import JsonMapper
+from diablo.patch import JsonPatch, MergePatch
+from diablo.http import BadRequest
+
+
+class JsonPatchMapper(JsonMapper):
+    """ Decoder for ``application/json-patch+json`` (RFC 6902).
+
+    Parsing returns a validated ``JsonPatch``. The mapper is input only,
+    responses are formatted based on the url or the Accept header and
+    are json by default.
+    """
+
+    content_type = 'application/json-patch+json'
+    input_only = True
+    output_content_type = 'application/json'
+
+    def decode_stream(self, stream, charset=None):
+        """ A patch is applied as a whole, no need to iterate it. """
+        return self._parse_data(stream.read(), charset or self.charset)
+
+    def _parse_data(self, data, charset):
+        return JsonPatch(JsonMapper._parse_data(self, data, charset))
+
+
+class MergePatchMapper(JsonMapper):
+    """ Decoder for ``application/merge-patch+json`` (RFC 7396).
+
+    Parsing returns a ``MergePatch``. The mapper is input only and
+    responses are json by default.
+    """
+
+    content_type = 'application/merge-patch+json'
+    input_only = True
+    output_content_type = 'application/json'
+
+    def decode_stream(self, stream, charset=None):
+        """ A patch is applied as a whole, no need to iterate it. """
+        return self._parse_data(stream.read(), charset or self.charset)
+
+    def _parse_data(self, data, charset):
+        patch = JsonMapper._parse_data(self, data, charset)
+        if not isinstance(patch, dict):
+            raise BadRequest('merge patch must be an object')
+        return MergePatch(patch)
+
+
+#
+#  patchmapper.py ends here
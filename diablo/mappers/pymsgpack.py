@@ -0,0 +1,277 @@
+#  -*- coding: utf-8 -*-
+#  pymsgpack.py ---
+#
+#  Pure python MessagePack codec (https://msgpack.org/)
+#
+#  Used by MsgPackMapper when the msgpack package is not installed.
+#  Supports the same types as ``msgpack.packb(use_bin_type=False)`` and
+#  ``msgpack.unpackb(raw=False)``: byte strings, bytearrays and unicode are
+#  packed as the str type and str type is unpacked into unicode. The bin
+#  type is unpacked into byte strings. Extension types are not supported.
+#
+
+
+import struct
+
+
+class PackValueError(ValueError):
+    """ The value can't be packed (e.g. an integer is too big). """
+
+
+class UnpackValueError(ValueError):
+    """ The data is not valid MessagePack. """
+
+
+# maximum nesting of arrays and maps, the unpacker is recursive
+_max_depth = 256
+
+
+_float = struct.Struct('>d').pack
+_uint8 = struct.Struct('>B').pack
+_uint16 = struct.Struct('>H').pack
+_uint32 = struct.Struct('>I').pack
+_uint64 = struct.Struct('>Q').pack
+_int8 = struct.Struct('>b').pack
+_int16 = struct.Struct('>h').pack
+_int32 = struct.Struct('>i').pack
+_int64 = struct.Struct('>q').pack
+
+
+def packb(obj, default=None):
+    """ Pack the object into MessagePack.
+
+    :param default: function called with objects that can't be packed.
+                    Should return an object that can be packed.
+    :returns: byte string
+    :raises: ``TypeError`` for unsupported types and ``PackValueError``
+             for values out of range.
+    """
+
+    out = []
+    _pack(obj, out.append, default)
+    return ''.join(out)
+
+
+def _pack(obj, write, default):
+    """ Recursively write the packed object. """
+
+    t = type(obj)
+    if obj is None:
+        write('\xc0')
+    elif t is bool:
+        write('\xc3' if obj else '\xc2')
+    elif t is int or t is long:
+        _pack_int(obj, write)
+    elif t is float:
+        write('\xcb' + _float(obj))
+    elif t is unicode:
+        _pack_str(obj.encode('utf-8'), write)
+    elif t is str:
+        _pack_str(obj, write)
+    elif t is list or t is tuple:
+        _pack_header(len(obj), 0x90, 16, '\xdc', '\xdd', write)
+        for item in obj:
+            _pack(item, write, default)
+    elif t is dict:
+        _pack_header(len(obj), 0x80, 16, '\xde', '\xdf', write)
+        for key, value in obj.iteritems():
+            _pack(key, write, default)
+            _pack(value, write, default)
+    elif t is bytearray:
+        _pack_str(str(obj), write)
+    else:
+        # subclasses of the basic types are packed as their base type
+        for base in _base_types:
+            if isinstance(obj, base):
+                return _pack(base(obj), write, default)
+        if default is None:
+            raise TypeError('can not serialize %r' % (obj,))
+        _pack(default(obj), write, None)
+
+
+# order matters: bool is a subclass of int
+_base_types = (bool, int, long, float, unicode, str, list, tuple, dict)
+
+
+def _pack_int(obj, write):
+    if 0 <= obj < 0x80:
+        write(chr(obj))
+    elif -0x20 <= obj < 0:
+        write(chr(obj & 0xff))
+    elif obj >= 0:
+        if obj <= 0xff:
+            write('\xcc' + _uint8(obj))
+        elif obj <= 0xffff:
+            write('\xcd' + _uint16(obj))
+        elif obj <= 0xffffffff:
+            write('\xce' + _uint32(obj))
+        elif obj <= 0xffffffffffffffff:
+            write('\xcf' + _uint64(obj))
+        else:
+            raise PackValueError('integer out of range')
+    else:
+        if obj >= -0x80:
+            write('\xd0' + _int8(obj))
+        elif obj >= -0x8000:
+            write('\xd1' + _int16(obj))
+        elif obj >= -0x80000000:
+            write('\xd2' + _int32(obj))
+        elif obj >= -0x8000000000000000:
+            write('\xd3' + _int64(obj))
+        else:
+            raise PackValueError('integer out of range')
+
+
+def _pack_str(data, write):
+    # str 8 is not used so that old (raw only) unpackers can read the data
+    n = len(data)
+    if n < 32:
+        write(chr(0xa0 | n))
+    elif n <= 0xffff:
+        write('\xda' + _uint16(n))
+    elif n <= 0xffffffff:
+        write('\xdb' + _uint32(n))
+    else:
+        raise PackValueError('string too long')
+    write(data)
+
+
+def _pack_header(n, fix, fixlimit, code16, code32, write):
+    """ Write array or map header. """
+    if n < fixlimit:
+        write(chr(fix | n))
+    elif n <= 0xffff:
+        write(code16 + _uint16(n))
+    elif n <= 0xffffffff:
+        write(code32 + _uint32(n))
+    else:
+        raise PackValueError('too many items')
+
+
+def unpackb(data):
+    """ Unpack one MessagePack object from the byte string.
+
+    :raises: ``UnpackValueError`` if the data is invalid, nested too
+             deeply or there's extra data after the object.
+    """
+
+    try:
+        obj, pos = _unpack(data, 0, 0)
+    except (IndexError, struct.error):
+        raise UnpackValueError('truncated data')
+    if pos != len(data):
+        raise UnpackValueError('extra data')
+    return obj
+
+
+# fixed size formats: code -> (struct, size)
+_fixed = {
+    0xca: (struct.Struct('>f'), 4),
+    0xcb: (struct.Struct('>d'), 8),
+    0xcc: (struct.Struct('>B'), 1),
+    0xcd: (struct.Struct('>H'), 2),
+    0xce: (struct.Struct('>I'), 4),
+    0xcf: (struct.Struct('>Q'), 8),
+    0xd0: (struct.Struct('>b'), 1),
+    0xd1: (struct.Struct('>h'), 2),
+    0xd2: (struct.Struct('>i'), 4),
+    0xd3: (struct.Struct('>q'), 8),
+    }
+
+# formats with a length: code -> (length struct, length size)
+_lengths = {
+    0xc4: (struct.Struct('>B'), 1), 0xc5: (struct.Struct('>H'), 2), 0xc6: (struct.Struct('>I'), 4),
+    0xd9: (struct.Struct('>B'), 1), 0xda: (struct.Struct('>H'), 2), 0xdb: (struct.Struct('>I'), 4),
+    0xdc: (struct.Struct('>H'), 2), 0xdd: (struct.Struct('>I'), 4),
+    0xde: (struct.Struct('>H'), 2), 0xdf: (struct.Struct('>I'), 4),
+    }
+
+
+def _unpack(data, pos, depth):
+    """ Unpack the object starting at ``pos``.
+
+    :param depth: number of arrays and maps the object is in
+    :returns: tuple of (object, position after the object)
+    """
+
+    code = ord(data[pos])
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    elif code >= 0xe0:
+        return code - 0x100, pos
+    elif code < 0x90:
+        return _unpack_map(data, pos, code & 0x0f, depth)
+    elif code < 0xa0:
+        return _unpack_array(data, pos, code & 0x0f, depth)
+    elif code < 0xc0:
+        return _unpack_str(data, pos, code & 0x1f)
+    elif code == 0xc0:
+        return None, pos
+    elif code == 0xc2:
+        return False, pos
+    elif code == 0xc3:
+        return True, pos
+    elif code in _fixed:
+        fmt, size = _fixed[code]
+        return fmt.unpack_from(data, pos)[0], pos + size
+    elif code in _lengths:
+        fmt, size = _lengths[code]
+        n = fmt.unpack_from(data, pos)[0]
+        pos += size
+        if code <= 0xc6:
+            return _unpack_bytes(data, pos, n)
+        elif code <= 0xdb:
+            return _unpack_str(data, pos, n)
+        elif code <= 0xdd:
+            return _unpack_array(data, pos, n, depth)
+        else:
+            return _unpack_map(data, pos, n, depth)
+    raise UnpackValueError('unsupported type 0x%02x' % (code,))
+
+
+def _unpack_bytes(data, pos, n):
+    end = pos + n
+    if end > len(data):
+        raise UnpackValueError('truncated data')
+    return data[pos:end], end
+
+
+def _unpack_str(data, pos, n):
+    raw, end = _unpack_bytes(data, pos, n)
+    try:
+        return raw.decode('utf-8'), end
+    except UnicodeDecodeError:
+        raise UnpackValueError('invalid utf-8 in str')
+
+
+def _check_depth(depth):
+    if depth >= _max_depth:
+        raise UnpackValueError('too deeply nested')
+
+
+def _unpack_array(data, pos, n, depth):
+    _check_depth(depth)
+    items = []
+    append = items.append
+    for i in xrange(n):
+        item, pos = _unpack(data, pos, depth + 1)
+        append(item)
+    return items, pos
+
+
+def _unpack_map(data, pos, n, depth):
+    _check_depth(depth)
+    obj = {}
+    for i in xrange(n):
+        key, pos = _unpack(data, pos, depth + 1)
+        value, pos = _unpack(data, pos, depth + 1)
+        try:
+            obj[key] = value
+        except TypeError:
+            raise UnpackValueError('unhashable map key')
+    return obj, pos
+
+
+#
+#  pymsgpack.py ends here
@@ -10,8 +10,11 @@ import types
 from decimal import Decimal, InvalidOperation
 import xml.sax.handler
 
+from diablo.adapters import registry as adapters
 from diablo.datamapper import DataMapper
-from diablo.util import SimplerXMLGenerator, force_unicode
+from diablo.fragment import Fragment
+from diablo.util import SimplerXMLGenerator, force_unicode, is_iterator, join_chunks
+from diablo import http
 
 
 try:
@@ -19,6 +22,11 @@ try:
 except ImportError:
     import StringIO
 
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
 
 class XmlMapper(DataMapper):
     """ Naïve XML mapper.
@@ -54,21 +62,36 @@ class XmlMapper(DataMapper):
       * When parsing, numbers can be left as strings, or they can be mapped
         to basic types ``int`` and ``float`` or alternatively to ``Decimal``.
         This can be controlled with the constructor parameter of this class.
+      * By default, xml is parsed with (c)ElementTree's ``iterparse``. The
+        original SAX based ``TreeBuilder`` is still available with
+        ``parser='sax'``. Unlike ``TreeBuilder``, the ``iterparse`` parser
+        keeps the elements of a list in document order.
     """
 
     content_type = 'text/xml'
 
-    def __init__(self, numbermode=None):
+    def __init__(self, numbermode=None, parser='etree'):
         """ Initialize the parser.
 
         :param numbermode: supported values are ``None``, 'basic' or 'decimal'
+        :param parser: supported values are 'etree' and 'sax'
         """
 
         self._numbermode = numbermode
+        self._parser = parser
+        self._convert = _number_converters[numbermode]
 
     def _parse_data(self, data, charset):
         """ Parse the xml data into dictionary. """
 
+        if self._parser == 'sax':
+            return self._parse_sax(data)
+        else:
+            return self._parse_etree(data)
+
+    def _parse_sax(self, data):
+        """ Parse the xml data using ``TreeBuilder``. """
+
         builder = TreeBuilder(numbermode=self._numbermode)
         if isinstance(data, basestring):
             xml.sax.parseString(data, builder)
@@ -76,11 +99,60 @@ class XmlMapper(DataMapper):
             xml.sax.parse(data, builder)
         return builder.root[self._root_element_name()]
 
+    def _parse_etree(self, data):
+        """ Parse the xml data using ``iterparse``.
+
+        Every element is turned into a value when it ends, using the
+        values of its children. The element is cleared right away so the
+        whole element tree is never built.
+        """
+
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if isinstance(data, str):
+            data = StringIO.StringIO(data)
+
+        convert = self._convert
+        tags = {}
+        # (tag, value) pairs of the elements whose parent hasn't ended yet
+        stack = []
+        try:
+            for event, elem in ElementTree.iterparse(data):
+                count = len(elem)
+                if not count:
+                    # text only node
+                    value = convert(unicode(elem.text or '').strip())
+                else:
+                    children = stack[-count:]
+                    del stack[-count:]
+                    value = dict(children)
+                    if len(value) != count:
+                        # repeated element names -> list
+                        value = [child[1] for child in children]
+                tag = tags.get(elem.tag)
+                if tag is None:
+                    tag = tags[elem.tag] = unicode(elem.tag)
+                stack.append((tag, value))
+                elem.clear()
+        except SyntaxError:
+            # ParseError is a subclass of SyntaxError
+            raise http.BadRequest('unable to parse data')
+
+        if not stack or stack[0][0] != self._root_element_name():
+            raise http.BadRequest('unexpected root element')
+        return stack[0][1]
+
     def _format_data(self, data, charset):
         """ Format data into XML. """
 
         if data is None or data == '':
-            return u''
+            return ''
+
+        encoder = self._get_encoder(charset)
+        if encoder is not None:
+            if encoder.is_streamable(data):
+                return join_chunks(encoder.iterencode(data, self._root_element_name()))
+            return encoder.encode(data, self._root_element_name())
 
         stream = StringIO.StringIO()
         xml = SimplerXMLGenerator(stream, charset)
@@ -104,7 +176,7 @@ class XmlMapper(DataMapper):
         :param key: name of the parent element (for root this is ``None``)
         """
 
-        if isinstance(data, (list, tuple)):
+        if isinstance(data, (list, tuple)) or is_iterator(data):
             for item in data:
                 elemname = self._list_item_element_name(key)
                 xml.startElement(elemname, {})
@@ -115,8 +187,49 @@ class XmlMapper(DataMapper):
                 xml.startElement(key, {})
                 self._to_xml(xml, value, key)
                 xml.endElement(key)
+        elif isinstance(data, Fragment):
+            # the encodings are in the charset of the mapper, the generator
+            # writes them in the charset of the response
+            content = self._get_fragment_encoder().encode_fragment(data, key)
+            xml.ignorableWhitespace(content.decode(self.charset))
+        else:
+            adapter = adapters.lookup(data.__class__)
+            if adapter is not None:
+                self._to_xml(xml, adapter(data), key)
+            else:
+                xml.characters(force_unicode(data))
+
+    def _get_encoder(self, charset):
+        """ Return ``XmlEncoder`` for the charset.
+
+        Returns ``None`` if the (slower) ``SimplerXMLGenerator`` must be
+        used instead. That is, if ``_to_xml()`` has been overridden or
+        the charset is not ascii compatible.
+        """
+
+        try:
+            return self._encoders[charset]
+        except AttributeError:
+            self._encoders = {}
+        except KeyError:
+            pass
+        if getattr(self._to_xml, 'im_func', None) is not XmlMapper._to_xml.im_func:
+            encoder = None
+        elif u'<a>'.encode(charset) != '<a>':
+            encoder = None
         else:
-            xml.characters(force_unicode(data))
+            encoder = XmlEncoder(charset, self._list_item_element_name)
+        self._encoders[charset] = encoder
+        return encoder
+
+    def _get_fragment_encoder(self):
+        """ Return the ``XmlEncoder`` for fragments in ``_to_xml()``. """
+
+        try:
+            return self._fragment_encoder
+        except AttributeError:
+            self._fragment_encoder = XmlEncoder(self.charset, self._list_item_element_name)
+            return self._fragment_encoder
 
     def _root_element_name(self):
         """ Return the name of the xml root element.
@@ -139,13 +252,212 @@ class XmlMapper(DataMapper):
                 <volume_item>56</volume_item>
             </volumes>
 
-        @todo memoize perhaps..
+        ``XmlEncoder`` calls this only once per key.
         """
 
         key = key or ''
         return '%s_item' % (key,)
 
 
+class XmlEncoder(object):
+    """ Fast xml encoder for ``XmlMapper``.
+
+    Produces exactly the same output as ``XmlMapper._to_xml()`` with
+    ``SimplerXMLGenerator`` but appends encoded pieces into a list
+    instead of writing every piece through the generator. Tags are
+    encoded only once per element name and scalars are converted using
+    a dispatch table on their exact type. Other types go through their
+    adapters (``diablo.adapters``).
+
+    Iterators are encoded like lists. ``iterencode()`` yields the
+    output incrementally as the iterators produce items. ``Fragment``s
+    are written as they are.
+
+    Only works with ascii compatible charsets.
+    """
+
+    """ Maximum number of element names whose encoded tags are cached.
+    The names come from the data, so the caches are cleared when full. """
+    _max_tags = 1024
+
+    def __init__(self, charset, item_name):
+        """ Initialize the encoder.
+
+        :param charset: charset of the output
+        :param item_name: function returning the name of a list item
+                          element given the name of the list element.
+        """
+
+        self.charset = charset
+        self._item_name = item_name
+        self._tags = {}
+        self._item_tags = {}
+        self._header = (u'<?xml version="1.0" encoding="%s"?>\n' % (charset,)).encode(charset)
+        self._scalars = {
+            unicode: self._escape,
+            str: self._escape_str,
+            int: str,
+            long: str,
+            float: str,
+            bool: str,
+            types.NoneType: str,
+            }
+
+    def encode(self, data, root):
+        """ Encode the data inside the ``root`` element.
+
+        :returns: the xml document as a byte string
+        """
+
+        start, end = self._tag(root)
+        out = [self._header, start]
+        self._write(out, data, None)
+        out.append(end)
+        return ''.join(out)
+
+    def iterencode(self, data, root):
+        """ Encode the data incrementally inside the ``root`` element.
+
+        Each item of an iterator is encoded (and yielded) separately. This
+        applies to the iterators found directly in the data or as values
+        of (nested) dicts. Iterators deeper inside the items are consumed
+        along with their item.
+
+        :returns: generator of byte strings
+        """
+
+        start, end = self._tag(root)
+        yield self._header + start
+        for chunk in self._iterwrite(data, None):
+            yield chunk
+        yield end
+
+    def is_streamable(self, data):
+        """ Check whether the data has iterators that ``iterencode()`` streams. """
+
+        if is_iterator(data):
+            return True
+        elif isinstance(data, dict):
+            return any(self.is_streamable(value) for value in data.itervalues())
+        return False
+
+    def _iterwrite(self, data, key):
+        """ Generator version of ``_write()`` for ``iterencode()``. """
+
+        if is_iterator(data):
+            start, end = self._item_tag(key)
+            for item in data:
+                out = [start]
+                self._write(out, item, None)
+                out.append(end)
+                yield ''.join(out)
+        elif isinstance(data, dict) and self.is_streamable(data):
+            for key, value in data.iteritems():
+                start, end = self._tag(key)
+                yield start
+                for chunk in self._iterwrite(value, key):
+                    yield chunk
+                yield end
+        else:
+            out = []
+            self._write(out, data, key)
+            yield ''.join(out)
+
+    def _write(self, out, data, key):
+        """ Recursively append the encoded data into ``out``. """
+
+        scalar = self._scalars.get(type(data))
+        if scalar is not None:
+            out.append(scalar(data))
+        elif isinstance(data, (list, tuple)):
+            start, end = self._item_tag(key)
+            for item in data:
+                out.append(start)
+                self._write(out, item, None)
+                out.append(end)
+        elif isinstance(data, dict):
+            for key, value in data.iteritems():
+                start, end = self._tag(key)
+                out.append(start)
+                self._write(out, value, key)
+                out.append(end)
+        else:
+            self._write_other(out, data, key)
+
+    def _write_other(self, out, data, key):
+        """ Append custom types, iterators and fragments into ``out``. """
+
+        adapter = adapters.lookup(data.__class__)
+        if adapter is not None:
+            data = adapter(data)
+            # adapters mostly return scalars
+            scalar = self._scalars.get(type(data))
+            if scalar is not None:
+                out.append(scalar(data))
+            else:
+                self._write(out, data, key)
+        elif is_iterator(data):
+            start, end = self._item_tag(key)
+            for item in data:
+                out.append(start)
+                self._write(out, item, None)
+                out.append(end)
+        elif isinstance(data, Fragment):
+            out.append(self.encode_fragment(data, key))
+        else:
+            out.append(self._escape(force_unicode(data)))
+
+    def encode_fragment(self, fragment, key):
+        """ Return the encoded content of the fragment.
+
+        :param key: name of the element the fragment is in (the names of
+                    list items depend on it).
+        """
+
+        def encode(data):
+            out = []
+            self._write(out, data, key)
+            return ''.join(out)
+
+        return fragment.encoded('xml', (self, key), encode)
+
+    def _escape(self, text):
+        """ Escape and encode unicode text. """
+
+        text = text.replace(u'&', u'&amp;').replace(u'>', u'&gt;').replace(u'<', u'&lt;')
+        return text.encode(self.charset, 'xmlcharrefreplace')
+
+    def _escape_str(self, text):
+        """ Escape and encode utf-8 encoded byte string. """
+
+        return self._escape(text.decode('utf-8'))
+
+    def _tag(self, name):
+        """ Return encoded start and end tags for the element name. """
+
+        try:
+            return self._tags[name]
+        except KeyError:
+            tags = ((u'<' + name + u'>').encode(self.charset, 'xmlcharrefreplace'),
+                    (u'</%s>' % name).encode(self.charset, 'xmlcharrefreplace'))
+            if len(self._tags) >= self._max_tags:
+                self._tags.clear()
+            self._tags[name] = tags
+            return tags
+
+    def _item_tag(self, key):
+        """ Return encoded start and end tags for list items under ``key``. """
+
+        try:
+            return self._item_tags[key]
+        except KeyError:
+            tags = self._tag(self._item_name(key))
+            if len(self._item_tags) >= self._max_tags:
+                self._item_tags.clear()
+            self._item_tags[key] = tags
+            return tags
+
+
 class TreeBuilder(xml.sax.handler.ContentHandler):
     """ SAX builder to parse the xml data """
 
@@ -199,18 +511,7 @@ class TreeBuilder(xml.sax.handler.ContentHandler):
         :returns: ``Decimal`` or ``data`` if conversion fails.
         """
 
-        # try int first
-        try:
-            return int(data)
-        except ValueError:
-            pass
-        # try float next
-        try:
-            return float(data)
-        except ValueError:
-            pass
-        # no luck, return data as it is
-        return data
+        return _try_parse_basic_number(data)
 
     def _try_parse_decimal(self, data):
         """ Try to convert the data into decimal.
@@ -218,10 +519,7 @@ class TreeBuilder(xml.sax.handler.ContentHandler):
         :returns: ``Decimal`` or ``data`` if conversion fails.
         """
 
-        try:
-            return Decimal(data)
-        except InvalidOperation:
-            return data
+        return _try_parse_decimal(data)
 
     def _element_to_node(self, node, name, value):
         """ Insert the parsed element (``name``, ``value`` pair) into the node.
@@ -250,5 +548,60 @@ class TreeBuilder(xml.sax.handler.ContentHandler):
             node[name] = value
         return node
 
+
+# first characters that int(), float() or Decimal() may accept (besides
+# digits). checking these first saves raising exceptions for most text.
+_number_start_chars = frozenset(u'+-.iInNsS')
+
+
+def _may_be_number(data):
+    """ Quick check that rules out most strings that aren't numbers. """
+    first = data[:1]
+    return first.isdigit() or first.isspace() or first in _number_start_chars
+
+
+def _try_parse_basic_number(data):
+    """ Try to convert the data into ``int`` or ``float``.
+
+    :returns: number or ``data`` if conversion fails.
+    """
+
+    if not _may_be_number(data):
+        return data
+    # try int first
+    try:
+        return int(data)
+    except ValueError:
+        pass
+    # try float next
+    try:
+        return float(data)
+    except ValueError:
+        pass
+    # no luck, return data as it is
+    return data
+
+
+def _try_parse_decimal(data):
+    """ Try to convert the data into decimal.
+
+    :returns: ``Decimal`` or ``data`` if conversion fails.
+    """
+
+    if not _may_be_number(data):
+        return data
+    try:
+        return Decimal(data)
+    except InvalidOperation:
+        return data
+
+
+# number conversion function for each numbermode
+_number_converters = {
+    None: lambda data: data,
+    'basic': _try_parse_basic_number,
+    'decimal': _try_parse_decimal,
+    }
+
 #
 # xml.py ends here
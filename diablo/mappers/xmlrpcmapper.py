@@ -6,6 +6,7 @@
 #
 
 import xmlrpclib
+from xml.parsers.expat import ExpatError
 
 from diablo.datamapper import DataMapper
 from diablo import http
@@ -15,6 +16,9 @@ class XmlRpcMapper(DataMapper):
 
     The mapper must be set using the format arg or explicitly in the 
     resource, otherwise XmlMapper will be used for content-type text/xml.
+
+    Parsing returns a ``(params, methodname)`` tuple. ``xmlrpclib.Fault``
+    is formatted as a fault response.
     """
     content_type = 'text/xml'
 
@@ -23,8 +27,10 @@ class XmlRpcMapper(DataMapper):
         self.allow_none = allow_none
 
     def _format_data(self, data, charset):
+        if not isinstance(data, xmlrpclib.Fault):
+            data = (data,)
         try:
-            return xmlrpclib.dumps((data,), 
+            return xmlrpclib.dumps(data, 
                       methodresponse=self.methodresponse,
                       allow_none=self.allow_none,
                       encoding=charset)
@@ -34,7 +40,7 @@ class XmlRpcMapper(DataMapper):
     def _parse_data(self, data, charset):
         try:
             return xmlrpclib.loads(data)
-        except ValueError:
+        except (ValueError, ExpatError, xmlrpclib.ResponseError):
             raise http.BadRequest('unable to parse data')
     
     
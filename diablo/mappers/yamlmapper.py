@@ -5,26 +5,90 @@
 # Author: Patrick Hull
 #
 
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from diablo.adapters import registry as adapters
 from diablo.datamapper import DataMapper
+from diablo.util import is_iterator
 from diablo import http
 
+
+def _represent_adapted(dumper, data):
+    """ Represent custom types using their adapters and iterators as lists. """
+
+    adapter = adapters.lookup(data.__class__)
+    if adapter is not None:
+        return dumper.represent_data(adapter(data))
+    elif is_iterator(data):
+        return dumper.represent_list(list(data))
+    return dumper.represent_undefined(data)
+
+
+if yaml is not None:
+    class SafeDumper(yaml.SafeDumper):
+        """ Safe dumper that writes tuples as lists. """
+    SafeDumper.add_representer(tuple, SafeDumper.represent_list)
+    SafeDumper.add_multi_representer(object, _represent_adapted)
+
+    if yaml.__with_libyaml__:
+        class CSafeDumper(yaml.CSafeDumper):
+            """ LibYAML based safe dumper that writes tuples as lists. """
+        CSafeDumper.add_representer(tuple, CSafeDumper.represent_list)
+        CSafeDumper.add_multi_representer(object, _represent_adapted)
+
+
 class YamlMapper(DataMapper):
     """YAML mapper
+
+    Uses the LibYAML based loader and dumper if they are available. Only
+    standard YAML tags are loaded and dumped (i.e. no ``!!python/...``
+    tags).
     """
     content_type = 'application/yaml'
 
-    def __init__(self, default_flow_style=True):
+    def __init__(self, default_flow_style=True, use_libyaml=True):
+        """ Initialize the mapper.
+
+        :param default_flow_style: passed on to ``yaml.dump()``
+        :param use_libyaml: ``False`` to use the pure python loader and
+                            dumper even if LibYAML is available.
+        """
+
         self.default_flow_style = default_flow_style
+        self._loader = self._dumper = None
+        if yaml is not None:
+            if use_libyaml and yaml.__with_libyaml__:
+                self._loader, self._dumper = yaml.CSafeLoader, CSafeDumper
+            else:
+                self._loader, self._dumper = yaml.SafeLoader, SafeDumper
 
     def _format_data(self, data, charset):
-        import yaml
+        self._check_yaml()
         try:
-            return yaml.dump(data)
-        except TypeError:
+            return yaml.dump(
+                data,
+                Dumper=self._dumper,
+                default_flow_style=self.default_flow_style,
+                allow_unicode=True,
+                encoding=charset)
+        except (TypeError, yaml.YAMLError):
             raise http.InternalServerError('unable to encode data')
 
     def _parse_data(self, data, charset):
-        import yaml
-        return yaml.load(data)
+        self._check_yaml()
+        try:
+            return yaml.load(data, Loader=self._loader)
+        except yaml.YAMLError:
+            raise http.BadRequest('unable to parse data')
+
+    def _check_yaml(self):
+        """ Make sure that PyYAML is installed. """
+        if yaml is None:
+            raise http.InternalServerError('yaml is not supported')
 
 
+#
+# yamlmapper.py ends here
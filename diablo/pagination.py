@@ -0,0 +1,127 @@
+#  -*- coding: utf-8 -*-
+#  pagination.py ---
+#
+#  Cursor pagination: ?limit=50&cursor=...
+#
+
+
+import base64
+import binascii
+import json
+from itertools import islice
+
+from diablo.http import BadRequest
+
+
+def encode_cursor(value):
+    """ Turn a cursor value into an opaque url safe string.
+
+    :param value: json compatible value (e.g. an offset or a key)
+    """
+
+    return base64.urlsafe_b64encode(json.dumps(value, separators=(',', ':'))).rstrip('=')
+
+
+def decode_cursor(cursor):
+    """ Turn a string from ``encode_cursor()`` back into the value.
+
+    :raises: ``BadRequest`` if the cursor is invalid
+    """
+
+    try:
+        return json.loads(base64.urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError, binascii.Error, UnicodeEncodeError):
+        raise BadRequest('invalid cursor')
+
+
+class Paginated(object):
+    """ Pageable source of items returned by a handler.
+
+    Diablo reads the ``limit`` and ``cursor`` query arguments, pulls one
+    page of items from the source and tells the client where the next
+    page starts (see ``Resource.page_metadata``). Items after the page are
+    never pulled, apart from a single lookahead item that tells whether
+    there is a next page at all.
+
+    The source is either
+
+    - an iterable: the cursor is an offset. The items before the offset
+      are skipped (i.e. still pulled), so this suits generators over
+      cheap rows, e.g. a server side database cursor.
+    - a callable ``source(after, limit)`` that returns an iterable of at
+      most ``limit`` items: ``after`` is ``None`` for the first page and
+      then the cursor of the previous page. If ``key`` is given, the
+      cursor is ``key(item)`` of the last item of the previous page
+      (keyset pagination, e.g. ``WHERE id > after ORDER BY id``).
+      Otherwise the cursor is the offset of the page.
+
+    Example::
+
+        def get(self, request):
+            return Paginated(
+                lambda after, limit: Product.objects.filter(id__gt=after or 0)[:limit],
+                key=lambda product: product.id)
+    """
+
+    """ Largest offset a client may ask for. Skipping is paid for by
+    the server, so clients can't make it pull arbitrarily many items.
+    The pages after it have no next cursor. ``None`` for no limit. """
+    max_offset = 10000
+
+    def __init__(self, source, key=None, max_offset=None):
+        """ Initialize the source.
+
+        :param source: iterable or callable (see above)
+        :param key: function that returns the cursor value of an item
+                    (json compatible), for callable sources only
+        :param max_offset: overrides ``Paginated.max_offset``
+        """
+
+        self.source = source
+        self.key = key
+        if max_offset is not None:
+            self.max_offset = max_offset
+
+    def page(self, cursor, limit):
+        """ Pull one page of items.
+
+        :param cursor: decoded cursor of the page or ``None``
+        :param limit: maximum number of items on the page
+        :returns: tuple of (``list of items``, ``next cursor or None``)
+        """
+
+        keyset = self.key is not None and callable(self.source)
+        offset = 0
+        if cursor is not None and not keyset:
+            if cursor.__class__ not in (int, long) or cursor < 0:
+                raise BadRequest('invalid cursor')
+            if self.max_offset is not None and cursor > self.max_offset:
+                raise BadRequest('invalid cursor')
+            offset = cursor
+        if callable(self.source):
+            # ask for one more to see if there is a next page
+            items = self.source(cursor if keyset else offset or None, limit + 1)
+            skip = 0
+        else:
+            items = self.source
+            skip = offset
+        items = iter(items)
+        try:
+            page = list(islice(items, skip, skip + limit + 1))
+        finally:
+            if hasattr(items, 'close'):
+                # e.g. releases the database cursor of a generator
+                items.close()
+        if len(page) <= limit:
+            return page, None
+        del page[limit:]
+        if keyset:
+            return page, self.key(page[-1])
+        offset += limit
+        if self.max_offset is not None and offset > self.max_offset:
+            return page, None
+        return page, offset
+
+
+#
+#  pagination.py ends here
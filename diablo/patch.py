@@ -0,0 +1,276 @@
+#  -*- coding: utf-8 -*-
+#  patch.py ---
+#
+#  JSON Patch (RFC 6902) and JSON Merge Patch (RFC 7396).
+#
+
+
+import copy
+
+from diablo.http import BadRequest, Conflict
+
+
+_operations = {
+    # operation: (needs value, needs from)
+    'add': (True, False),
+    'remove': (False, False),
+    'replace': (True, False),
+    'move': (False, True),
+    'copy': (False, True),
+    'test': (True, False),
+    }
+
+
+def parse_pointer(pointer):
+    """ Parse a JSON Pointer (RFC 6901) into a tuple of reference tokens.
+
+    E.g.  /tags/0/a~1b  ->  ('tags', '0', 'a/b')
+
+    :raises: ``BadRequest`` if the pointer is malformed
+    """
+
+    if not isinstance(pointer, basestring):
+        raise BadRequest('invalid pointer: %r' % (pointer,))
+    if not pointer:
+        return ()
+    if pointer[0] != '/':
+        raise BadRequest('invalid pointer: %s' % (pointer,))
+    tokens = pointer[1:].split('/')
+    if '~' in pointer:
+        tokens = [token.replace('~1', '/').replace('~0', '~') for token in tokens]
+    return tuple(tokens)
+
+
+def apply_patch(doc, patch):
+    """ Apply the body of a PATCH request to the document.
+
+    ``JsonPatch``es and lists (i.e. patches decoded by a plain json
+    mapper) are applied as JSON Patch, anything else as merge patch.
+    The document is not modified.
+
+    :returns: the patched document
+    :raises: ``BadRequest`` if the patch is malformed, ``Conflict`` if it
+             can't be applied to the document
+    """
+
+    if isinstance(patch, JsonPatch):
+        return patch.apply(doc)
+    elif isinstance(patch, (list, tuple)):
+        return JsonPatch(patch).apply(doc)
+    return merge_patch(doc, patch)
+
+
+def merge_patch(target, patch):
+    """ Apply a merge patch (RFC 7396) to the target.
+
+    Only the objects on the changed paths are copied, the target itself
+    is not modified.
+
+    :returns: the patched document
+    """
+
+    if not isinstance(patch, dict):
+        return patch
+    target = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.iteritems():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = merge_patch(target.get(key), value)
+    return target
+
+
+class MergePatch(dict):
+    """ Decoded ``application/merge-patch+json`` body.
+
+    The keys of the patch are the fields that change (``None`` values
+    are removed), so handlers can write only those.
+    """
+
+    def apply(self, doc):
+        """ Return the patched copy of the document. """
+        return merge_patch(doc, self)
+
+
+class JsonPatch(list):
+    """ Decoded ``application/json-patch+json`` body.
+
+    The operations are validated and their pointers parsed when the
+    patch is created, so it can be applied to any number of documents.
+    Each item is a tuple of ``(op, path, value, from)`` where ``path``
+    and ``from`` are tuples of reference tokens.
+
+    Applying is atomic: either all the operations succeed or the
+    document is left as it was. Instead of copying the whole document
+    only the containers on the changed paths are copied.
+    """
+
+    def __init__(self, operations=()):
+        """ Validate the operations.
+
+        :param operations: list of operation objects, e.g.
+                           ``[{'op': 'replace', 'path': '/a', 'value': 1}]``
+        :raises: ``BadRequest`` if the patch is malformed
+        """
+
+        if not isinstance(operations, (list, tuple)):
+            raise BadRequest('json patch must be a list of operations')
+        list.__init__(self, map(self._parse_operation, operations))
+
+    def apply(self, doc):
+        """ Return the patched copy of the document.
+
+        :raises: ``Conflict`` if an operation fails
+        """
+
+        root = [doc]
+        copied = set([id(root)])
+        for op, path, value, from_ in self:
+            getattr(self, '_' + op)(root, (0,) + path, value, (0,) + from_, copied)
+        return root[0]
+
+    @property
+    def paths(self):
+        """ The paths (pointer strings) that the patch changes. """
+
+        paths = []
+        for op, path, value, from_ in self:
+            if op == 'move':
+                paths.append(_format_pointer((0,) + from_))
+            if op != 'test':
+                paths.append(_format_pointer((0,) + path))
+        return paths
+
+    def _parse_operation(self, operation):
+        if not isinstance(operation, dict):
+            raise BadRequest('json patch operation must be an object')
+        op = operation.get('op')
+        try:
+            needs_value, needs_from = _operations[op]
+        except (KeyError, TypeError):
+            raise BadRequest('invalid json patch operation: %r' % (op,))
+        if 'path' not in operation:
+            raise BadRequest('missing path in json patch operation')
+        if needs_value and 'value' not in operation:
+            raise BadRequest('missing value in json patch operation')
+        if needs_from and 'from' not in operation:
+            raise BadRequest('missing from in json patch operation')
+        path = parse_pointer(operation['path'])
+        from_ = parse_pointer(operation['from']) if needs_from else ()
+        if op == 'move' and path[:len(from_)] == from_ and path != from_:
+            raise BadRequest('cannot move a value into itself')
+        return op, path, operation.get('value'), from_
+
+    def _add(self, root, path, value, from_, copied):
+        container = _container(root, path, copied)
+        key = path[-1]
+        if len(path) == 1:
+            root[0] = value
+        elif isinstance(container, list):
+            if key == '-':
+                container.append(value)
+            else:
+                container.insert(_index(container, key, len(container) + 1), value)
+        elif isinstance(container, dict):
+            container[key] = value
+        else:
+            raise Conflict('cannot add to %s' % (_format_pointer(path),))
+
+    def _remove(self, root, path, value, from_, copied):
+        if len(path) == 1:
+            raise Conflict('cannot remove the whole document')
+        container = _container(root, path, copied)
+        key = _key(container, path)
+        value = container[key]
+        del container[key]
+        return value
+
+    def _replace(self, root, path, value, from_, copied):
+        container = _container(root, path, copied)
+        container[_key(container, path)] = value
+
+    def _move(self, root, path, value, from_, copied):
+        if path == from_:
+            return
+        value = self._remove(root, from_, None, (), copied)
+        self._add(root, path, value, (), copied)
+
+    def _copy(self, root, path, value, from_, copied):
+        value = _get(root, from_)
+        # the copy must not share containers with the original
+        self._add(root, path, copy.deepcopy(value), (), copied)
+
+    def _test(self, root, path, value, from_, copied):
+        if _get(root, path) != value:
+            raise Conflict('test failed: %s' % (_format_pointer(path),))
+
+
+def _index(container, token, size):
+    """ Return the list index of the token, must be smaller than size. """
+
+    if not token.isdigit() or (token[0] == '0' and len(token) > 1):
+        raise Conflict('invalid array index: %s' % (token,))
+    index = int(token)
+    if index >= size:
+        raise Conflict('array index out of range: %s' % (token,))
+    return index
+
+
+def _key(container, path):
+    """ Return the key/index of the last token of an existing value. """
+
+    token = path[-1]
+    if len(path) == 1:
+        # the document itself
+        return 0
+    elif isinstance(container, list):
+        return _index(container, token, len(container))
+    elif isinstance(container, dict):
+        if token not in container:
+            raise Conflict('no such path: %s' % (_format_pointer(path),))
+        return token
+    raise Conflict('no such path: %s' % (_format_pointer(path),))
+
+
+def _container(root, path, copied):
+    """ Return the parent of the last token of the path.
+
+    The containers along the path are copied (once per ``apply()``) so
+    that the original document is never modified.
+    """
+
+    container = root
+    for i in xrange(len(path) - 1):
+        key = _key(container, path[:i + 1])
+        child = container[key]
+        if id(child) not in copied:
+            if isinstance(child, dict):
+                child = dict(child)
+            elif isinstance(child, list):
+                child = list(child)
+            else:
+                raise Conflict('no such path: %s' % (_format_pointer(path[:i + 2]),))
+            copied.add(id(child))
+            container[key] = child
+        container = child
+    return container
+
+
+def _get(root, path):
+    """ Return the value at the path. """
+
+    value = root
+    for i in xrange(len(path)):
+        value = value[_key(value, path[:i + 1])]
+    return value
+
+
+def _format_pointer(path):
+    """ Turn the tokens (without the root) back into a pointer string. """
+
+    return ''.join('/' + token.replace('~', '~0').replace('/', '~1')
+                   for token in path[1:])
+
+
+#
+#  patch.py ends here
@@ -0,0 +1,110 @@
+#  -*- coding: utf-8 -*-
+#  producers.py ---
+#
+#  Producers for writing response bodies that are not available as a
+#  single string.
+#
+
+
+import logging
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+from twisted.web import http
+
+
+class ChunkProducer(object):
+    """ Pull producer that writes an iterable of chunks into the request.
+
+    The next chunk is pulled from the iterable only when the transport
+    asks for more data, so a slow client doesn't make us buffer the
+    whole response in memory. Twisted uses chunked transfer encoding for
+    the body since there is no ``Content-Length``.
+    """
+
+    log = logging.getLogger('diablo')
+
+    def __init__(self, request, chunks):
+        """ Initialize the producer.
+
+        :param request: the HTTP request to write into
+        :param chunks: iterable of byte strings
+        """
+
+        self.request = request
+        self.chunks = iter(chunks)
+        self.deferred = defer.Deferred()
+
+    def start(self):
+        """ Start writing the chunks.
+
+        :returns: deferred that fires when all chunks have been written
+                  and the request is finished.
+        """
+
+        self.request.registerProducer(self, False)
+        return self.deferred
+
+    def resumeProducing(self):
+        """ Write the next non-empty chunk. """
+
+        if self.chunks is None:
+            return
+        try:
+            # empty chunk would terminate chunked encoding prematurely
+            chunk = ''
+            while not chunk:
+                chunk = self.chunks.next()
+        except StopIteration:
+            self._finish()
+        except Exception:
+            self._abort(Failure())
+        else:
+            self.request.write(chunk)
+
+    def stopProducing(self):
+        """ The connection was lost, stop pulling chunks. """
+
+        self._close()
+        if not self.deferred.called:
+            self.deferred.callback(None)
+
+    def _finish(self):
+        """ All chunks written. """
+
+        self.chunks = None
+        self.request.unregisterProducer()
+        self.request.finish()
+        self.deferred.callback(None)
+
+    def _abort(self, failure):
+        """ The chunk iterable failed.
+
+        If nothing has been written yet the client gets a plain 500,
+        otherwise the connection is dropped so that the client can't
+        mistake the truncated body for a complete one.
+        """
+
+        self.log.error(failure.getTraceback())
+        self._close()
+        self.request.unregisterProducer()
+        transport = getattr(self.request, 'transport', None)
+        if not getattr(self.request, 'startedWriting', True):
+            self.request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+            self.request.finish()
+        elif transport is not None:
+            transport.loseConnection()
+        else:
+            self.request.finish()
+        self.deferred.callback(None)
+
+    def _close(self):
+        """ Release the chunk iterable (and close it if it's a generator). """
+
+        chunks, self.chunks = self.chunks, None
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+#
+#  producers.py ends here
@@ -7,12 +7,19 @@
 
 import functools
 import logging
+import urllib
 
 from twisted.internet import defer
 from twisted.web.server import NOT_DONE_YET
 from twisted.web import http
 from twisted.web.resource import Resource as ResourceBase
-from .http import HTTPError, Response, Unauthorized, Forbidden
+from twisted.web.static import NoRangeStaticProducer, SingleRangeStaticProducer
+from .http import HTTPError, Response, RawResponse, FileResponse
+from .http import BadRequest, Unauthorized, Forbidden
+from .producers import ChunkProducer
+from .fields import parse_fields, project
+from .pagination import Paginated, encode_cursor, decode_cursor
+from .util import parse_byte_range
 import datamapper
 
 
@@ -24,6 +31,64 @@ class Resource(ResourceBase):
     authentication = None
     allow_anonymous = True
 
+    """ Give request body to the mapper as a stream.
+
+    If ``True``, the body is not read into memory before parsing and
+    mappers that support it (e.g. ``JsonMapper`` for json arrays) give
+    the handler an iterator instead of fully parsed data.
+    """
+    stream_input = False
+
+    """ ``Schema`` for serializing the objects returned by the handlers.
+
+    See ``diablo.serializer``. Without a schema, the data is formatted as
+    it is.
+    """
+    output_schema = None
+
+    """ ``InputSchema``s for validating the request body, by method.
+
+    E.g. ``{'post': ProductInput, 'put': ProductInput}``. See
+    ``diablo.validation``. Methods without a schema are not validated.
+    """
+    input_schemas = None
+
+    """ Name of the query argument for selecting the fields of the response.
+
+    E.g. ``?fields=id,name,vendor.name``. The parsed selection is given to
+    the handler in ``request.fields`` (``None`` if not given, see
+    ``diablo.fields``) and the response data is projected accordingly.
+    ``None`` disables field selection.
+    """
+    fields_argument = 'fields'
+
+    """ Number of items on a page of a ``Paginated`` response.
+
+    Clients may ask for smaller or larger pages (up to ``max_page_size``)
+    with ``?limit=``. See ``diablo.pagination``.
+    """
+    page_size = 50
+    max_page_size = 1000
+
+    """ Where the cursor of the next page is given to the client.
+
+    ``'link'`` adds a ``Link: <...?cursor=...>; rel="next"`` header and
+    leaves the body a plain list, which works with every mapper.
+    ``'body'`` wraps the page into ``{'items': [...], 'next': cursor}``.
+    """
+    page_metadata = 'link'
+
+    """ Names of the query arguments for the page size and position. """
+    limit_argument = 'limit'
+    cursor_argument = 'cursor'
+
+    """ Encoder factories for compressing the responses.
+
+    E.g. ``[twisted.web.server.GzipEncoderFactory()]``. The first one that
+    accepts the request (based on its Accept-Encoding) is used.
+    """
+    encoders = ()
+
     log = logging.getLogger('diablo')
     datalog = logging.getLogger('diablo.data')
 
@@ -59,17 +124,13 @@ class Resource(ResourceBase):
         try:
             if method:
                 d = defer.maybeDeferred(self._authenticate, request)
-                data = self._getInputData(request)
-                data = self._validateInputData(data, request)
-                data = self._createObject(data, request)
                 d.addCallback(
-                    self._executeHandler,
+                    self._handleRequest,
                     methodname,
                     method,
-                    data,
                     request)
                 d.addCallback(self._processResponse, request)
-                d.addErrback(self._httpError)
+                d.addErrback(self._httpError, request)
                 d.addErrback(self._unknownError)
                 d.addCallback(self._writeResponse, request)
                 return NOT_DONE_YET
@@ -95,6 +156,13 @@ class Resource(ResourceBase):
             if not request.user and not self.allow_anonymous:
                 raise exc_obj
 
+        if (hasattr(request, 'authenticated_with') and
+                request.authenticated_with is self.authentication):
+            # a sub-request of a batch that was authenticated as a whole
+            # with the authentication of this resource
+            if not request.user and not self.allow_anonymous:
+                raise Unauthorized() if self.authentication else Forbidden()
+            return request.user
         request.user = None
         if self.authentication:
             try:
@@ -119,17 +187,39 @@ class Resource(ResourceBase):
         method = getattr(self, methodname, None)
         return methodname, method
 
+    def _handleRequest(self, username, methodname, method, request):
+        """ Read the content data and execute the handler. """
+
+        data = self._getRequestData(username, request)
+        return self._executeHandler(username, methodname, method, data, request)
+
+    def _getRequestData(self, username, request):
+        """ Read, parse and validate the content data.
+
+        This is done within the deferred chain so that parsing errors
+        are turned into proper error responses.
+
+        :returns: the request data or ``None``
+        """
+
+        request.fields = self._getFields(request)
+        data = self._getInputData(request)
+        data = self._validateInputData(data, request)
+        return self._createObject(data, request)
+
     def _executeHandler(self, username, methodname, method, data, request):
         """ Execute handler.
 
-        First, read and parse the content data.
+        Content data is given to ``put``, ``post`` and ``patch`` handlers.
+        A ``patch`` handler gets a ``JsonPatch`` or a ``MergePatch``
+        depending on the content type (see ``diablo.patch``).
         """
 
-        if methodname in ('put', 'post',):
+        if methodname in ('put', 'post', 'patch',):
             method = functools.partial(method, data)
         return method(request, *self.args, **self.kw)
 
-    def _httpError(self, failure):
+    def _httpError(self, failure, request=None):
         """ event: error in ``_executeHandler`` or ``_processResponse``.
 
         Handles ``HTTPError``s and propagates others to next errback.
@@ -137,6 +227,8 @@ class Resource(ResourceBase):
 
         failure.trap(HTTPError)
         res = self._getErrorResponse(failure.value)
+        if request is not None:
+            res = self._formatErrorResponse(res, request)
         self.log.error(str(res))
         return res
 
@@ -154,14 +246,36 @@ class Resource(ResourceBase):
     def _getErrorResponse(self, exc):
         """ Turn ``HTTPError`` into appropriate ``Response``.
 
+        Error content that is not a string (e.g. the validation errors)
+        is left as it is for ``_formatErrorResponse()``.
+
         :returns: ``diablo.Response``
         """
 
         if exc.code == http.UNAUTHORIZED:
             return self._getAuthFailedResponse(exc)
-        else:
-            content = exc.content or ''
-            return Response(code=exc.code, content=content)
+        content = exc.content or ''
+        if content.__class__ is unicode:
+            content = content.encode('utf-8')
+        return Response(code=exc.code, content=content)
+
+    def _formatErrorResponse(self, response, request):
+        """ Format error content that is not a string.
+
+        The content is formatted with the datamapper of the request, or
+        turned into a string if the request has no usable datamapper.
+
+        :returns: ``diablo.Response``
+        """
+
+        content = response.content
+        if content is None or isinstance(content, basestring):
+            return response
+        try:
+            return datamapper.encode(request, response, self)
+        except HTTPError:
+            response.content = str(content)
+            return response
 
     def _getAuthFailedResponse(self, exc):
         """ Return HTTP response for when auth failed. """
@@ -191,10 +305,17 @@ class Resource(ResourceBase):
                 return Response(0, response)
             return response
 
+        if isinstance(response, RawResponse):
+            # already encoded, write as it is
+            return response
+
         diablo_res = coerce_response()
+        if isinstance(diablo_res.content, Paginated):
+            return self._processPage(diablo_res, request)
         if diablo_res.content and diablo_res.code in (0, 200, 201):
             # serialize, format and validate
-            serialized_res = diablo_res.content = self._serializeObject(diablo_res.content, request)
+            serialized_res = self._serializeObject(diablo_res.content, request)
+            serialized_res = diablo_res.content = self._selectFields(serialized_res, request)
             formatted_res = self._formatResponse(request, diablo_res)
             self._validateOutputData(response, serialized_res, formatted_res, request)
         else:
@@ -202,13 +323,79 @@ class Resource(ResourceBase):
             formatted_res = self._formatResponse(request, diablo_res)
         return formatted_res
 
+    def _processPage(self, response, request):
+        """ Process a ``Paginated`` response.
+
+        Pulls one page of items from the source, serializes them and adds
+        the cursor of the next page to the header or the body.
+
+        :returns: ``diablo.Response``
+        """
+
+        items, cursor = self._getPage(response.content, request)
+        items = self._selectFields(self._serializeObject(items, request), request)
+        if cursor is not None:
+            cursor = encode_cursor(cursor)
+        if self.page_metadata == 'body':
+            response.content = {'items': items, 'next': cursor}
+        else:
+            response.content = items
+            if cursor is not None:
+                response.setHeader('link', '<%s>; rel="next"' % (
+                    self._getPageUrl(cursor, request),))
+        formatted_res = self._formatResponse(request, response)
+        self._validateOutputData(response, items, formatted_res, request)
+        return formatted_res
+
+    def _getPage(self, paginated, request):
+        """ Pull the requested page from the source.
+
+        :returns: tuple of (``list of items``, ``next cursor or None``)
+        :raises: ``BadRequest`` if ``limit`` or ``cursor`` is invalid
+        """
+
+        limit = self.page_size
+        value = request.args.get(self.limit_argument)
+        if value:
+            try:
+                limit = int(value[0])
+            except ValueError:
+                raise BadRequest('invalid limit')
+            if limit < 1:
+                raise BadRequest('invalid limit')
+            limit = min(limit, self.max_page_size)
+        cursor = request.args.get(self.cursor_argument)
+        cursor = decode_cursor(cursor[0]) if cursor else None
+        return paginated.page(cursor, limit)
+
+    def _getPageUrl(self, cursor, request):
+        """ Return the url of the page that starts at the cursor. """
+
+        args = dict(request.args)
+        args[self.cursor_argument] = [cursor]
+        return '%s?%s' % (request.path, urllib.urlencode(sorted(args.items()), True))
+
     def _validateInputData(self, data, request):
-        """ todo: implement """
-        return data
+        """ Validate the data using the input schema of the method.
+
+        :raises: ``BadRequest`` listing all the errors
+        """
+
+        schema = self._getInputSchema(request)
+        return schema.validate(data) if schema else data
 
     def _createObject(self, data, request):
-        """ todo: implement """
-        return data
+        """ Create the object for the handler using the input schema. """
+
+        schema = self._getInputSchema(request)
+        return schema.create(data) if schema else data
+
+    def _getInputSchema(self, request):
+        """ Return the ``InputSchema`` of the request method or ``None``. """
+
+        if not self.input_schemas:
+            return None
+        return self.input_schemas.get(request.method.lower())
 
     def _validateOutputData(
         self, original_res, serialized_res, formatted_res, request):
@@ -216,8 +403,38 @@ class Resource(ResourceBase):
         pass
 
     def _serializeObject(self, data, request):
-        """ todo: implement """
-        return data
+        """ Serialize the data using ``output_schema`` if there is one.
+
+        Only the fields selected in the request are serialized.
+        """
+
+        if self.output_schema is None:
+            return data
+        fields = getattr(request, 'fields', None)
+        return self.output_schema.select(fields).serialize(data)
+
+    def _getFields(self, request):
+        """ Parse the field selection of the request.
+
+        :returns: tree of the selected fields or ``None``
+        """
+
+        if not self.fields_argument:
+            return None
+        value = request.args.get(self.fields_argument)
+        return parse_fields(','.join(value)) if value else None
+
+    def _selectFields(self, data, request):
+        """ Project the data to the fields selected in the request.
+
+        Data serialized by ``output_schema`` already has only the
+        selected fields.
+        """
+
+        fields = getattr(request, 'fields', None)
+        if fields is None or self.output_schema is not None:
+            return data
+        return project(data, fields)
 
     def _formatResponse(self, request, response):
         """ Format the response using a datamapper.
@@ -239,20 +456,157 @@ class Resource(ResourceBase):
         """
 
         request.setResponseCode(response.code)
-        for key, value in response.headers.items():
+        for key, value in response.iterheaders():
             request.setHeader(key, value)
-        self.datalog.info('>> "%s"' % ((response.content if response.content else ''),))
-        request.write(response.content)
-        request.finish()
+        if isinstance(response, FileResponse):
+            return self._writeFile(response, request)
+        elif isinstance(response, RawResponse):
+            if self._isNotModified(response, request):
+                request.finish()
+                return NOT_DONE_YET
+            self.datalog.info('>> <raw %d bytes>' % (len(response.content),))
+            self._setEncoder(request)
+            request.write(response.content)
+            request.finish()
+            return NOT_DONE_YET
+        self._setEncoder(request)
+        if isinstance(response.content, basestring):
+            self.datalog.info('>> "%s"' % ((response.content if response.content else ''),))
+            request.write(response.content)
+            request.finish()
+        else:
+            # streamed response body
+            self.datalog.info('>> <streamed>')
+            ChunkProducer(request, response.content).start()
         return NOT_DONE_YET
 
+    def _writeFile(self, response, request):
+        """ Write the content of a ``FileResponse`` using a producer.
+
+        The file is read in chunks only as fast as the client receives
+        them. A single byte range is honored (unless If-Range says that
+        the client's copy is stale), other Range headers are ignored and
+        the whole file is sent.
+        """
+
+        request.setHeader('accept-ranges', 'bytes')
+        if self._isNotModified(response, request):
+            response.file.close()
+            request.finish()
+            return NOT_DONE_YET
+        try:
+            byte_range = self._getByteRange(response, request)
+        except ValueError:
+            response.file.close()
+            request.setResponseCode(http.REQUESTED_RANGE_NOT_SATISFIABLE)
+            request.setHeader('content-range', 'bytes */%d' % (response.size,))
+            request.setHeader('content-length', '0')
+            request.finish()
+            return NOT_DONE_YET
+
+        if byte_range is None:
+            self.datalog.info('>> <file %d bytes>' % (response.size,))
+            self._setEncoder(request)
+            NoRangeStaticProducer(request, response.file).start()
+        else:
+            offset, size = byte_range
+            self.datalog.info('>> <file %d-%d of %d bytes>' % (
+                offset, offset + size - 1, response.size))
+            request.setResponseCode(http.PARTIAL_CONTENT)
+            request.setHeader('content-range', 'bytes %d-%d/%d' % (
+                offset, offset + size - 1, response.size))
+            request.setHeader('content-length', str(size))
+            SingleRangeStaticProducer(request, response.file, offset, size).start()
+        return NOT_DONE_YET
+
+    def _getByteRange(self, response, request):
+        """ Return the requested ``(offset, length)`` of a file or ``None``.
+
+        :raises: ``ValueError`` if the range is not satisfiable.
+        """
+
+        header = request.getHeader('range')
+        if not header or response.code != http.OK:
+            return None
+        if_range = request.getHeader('if-range')
+        if if_range and not self._isSameVersion(response, if_range):
+            return None
+        return parse_byte_range(header, response.size)
+
+    def _isSameVersion(self, response, if_range):
+        """ Check the If-Range header (an ETag or a date) of a request.
+
+        Weak ETags never match.
+        """
+
+        if if_range.startswith('"'):
+            return if_range == response.etag
+        elif response.last_modified is not None:
+            return if_range == http.datetimeToString(response.last_modified)
+        return False
+
+    def _isNotModified(self, response, request):
+        """ Check the conditional GET headers against the response.
+
+        Sets the ETag and Last-Modified headers. If the client's copy is
+        up to date, the response code becomes 304 (or 412).
+
+        :returns: ``True`` if no content should be written.
+        """
+
+        if response.code != http.OK:
+            return False
+        cached = None
+        if response.last_modified is not None:
+            cached = request.setLastModified(response.last_modified)
+        if response.etag is not None:
+            cached = request.setETag(response.etag) or cached
+        return cached == http.CACHED
+
+    def _setEncoder(self, request):
+        """ Compress the response if the client accepts it.
+
+        Uses the first of ``self.encoders`` that gives an encoder for the
+        request. Responses that already have a Content-Encoding (e.g.
+        pre-compressed raw content) are left as they are. Others get
+        ``Vary: Accept-Encoding`` whether they are compressed or not, so
+        that shared caches keep the variants apart.
+        """
+
+        if not self.encoders or getattr(request, '_encoder', True) is not None:
+            # nothing to do or not a twisted.web.server.Request
+            return
+        if request.responseHeaders.hasHeader('content-encoding'):
+            return
+        request.responseHeaders.addRawHeader('vary', 'Accept-Encoding')
+        for factory in self.encoders:
+            encoder = factory.encoderForRequest(request)
+            if encoder is not None:
+                request._encoder = encoder
+                return
+
     def _getInputData(self, request):
         """ If there is data, parse it, otherwise return None. """
-        content = [row for row in request.content.read()] if request.content else None
-        content = ''.join(content) if content else None
+        if self.stream_input:
+            return self._getInputStream(request)
+        content = request.content.read() if request.content else None
         self.datalog.info('<< "%s"' % ((content if content else ''),))
         return self._parseInputData(content, request) if content else None
 
+    def _getInputStream(self, request):
+        """ Parse the data straight from the request body.
+
+        The body is not read into memory first. Depending on the mapper,
+        the result may be lazy (e.g. an iterator over the elements of a
+        json array) in which case parsing errors are raised when the
+        handler consumes it. Empty body results in ``None``.
+        """
+
+        if not request.content:
+            return None
+        self.datalog.info('<< <streamed>')
+        return datamapper.decode_stream(request.content, request, self)
+
     def _parseInputData(self, data, request):
         """ Execute appropriate parser. """
         return datamapper.decode(data, request, self)
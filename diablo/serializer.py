@@ -0,0 +1,245 @@
+#  -*- coding: utf-8 -*-
+#  serializer.py ---
+#
+#  Declarative output schemas compiled into serializer functions.
+#
+
+
+import functools
+import keyword
+import re
+from itertools import imap
+
+from diablo.fields import project
+from diablo.util import is_iterator
+
+
+_identifier = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class Field(object):
+    """ One field of a ``Schema``.
+
+    :param source: where the value comes from. Attribute name (or key if
+                   the schema reads dicts), possibly a dotted path like
+                   ``vendor.name``. Defaults to the name of the field.
+    :param schema: ``Schema`` for serializing a nested object
+    :param many: ``True`` if the value is a list of nested objects
+    :param convert: function for converting the value (e.g. ``str``)
+    """
+
+    # fields keep their declaration order
+    _counter = 0
+
+    def __init__(self, source=None, schema=None, many=False, convert=None):
+        self.source = source
+        self.schema = schema
+        self.many = many
+        self.convert = convert
+        Field._counter += 1
+        self._order = Field._counter
+
+
+class SchemaMeta(type):
+    """ Compiles the fields of a schema when the class is created. """
+
+    def __new__(mcs, name, bases, attrs):
+        fields = []
+        for base in reversed(bases):
+            fields.extend(getattr(base, '_fields', ()))
+        declared = [(key, value) for key, value in attrs.items()
+                    if isinstance(value, Field)]
+        declared.sort(key=lambda item: item[1]._order)
+        names = set(key for key, value in declared)
+        fields = [item for item in fields if item[0] not in names] + declared
+        for key, value in declared:
+            del attrs[key]
+        attrs['_fields'] = tuple(fields)
+        cls = type.__new__(mcs, name, bases, attrs)
+        if fields:
+            cls._compile()
+        return cls
+
+
+class Schema(object):
+    """ Declarative description of the output of a resource.
+
+    The fields are compiled into two functions when the class is
+    defined: ``serialize_one`` for a single object and ``serialize_many``
+    for a list of them. Both are generated python code which reads the
+    sources and builds the dict in a single expression, so there's no
+    reflection when a response is serialized.
+
+    ``None`` as a nested object is serialized as ``None``.
+
+    Example::
+
+        class VendorSchema(Schema):
+            name = Field()
+            country = Field('country_code')
+
+        class ProductSchema(Schema):
+            id = Field()
+            name = Field('title')
+            price = Field(convert=str)
+            vendor = Field(schema=VendorSchema)
+            tags = Field('tag_set', schema=TagSchema, many=True)
+
+        class Products(Resource):
+            output_schema = ProductSchema
+    """
+
+    __metaclass__ = SchemaMeta
+
+    """ ``True`` if the objects are dicts instead of objects. """
+    from_dicts = False
+
+    """ Maximum number of compiled selections kept per schema. """
+    _max_selections = 256
+
+    @classmethod
+    def serialize(cls, data):
+        """ Serialize an object, a list of objects or an iterator.
+
+        Iterators are serialized lazily (one item at a time) so that
+        streamed responses stay streamed.
+        """
+
+        if data is None:
+            return None
+        elif isinstance(data, (list, tuple)):
+            return cls.serialize_many(data)
+        elif is_iterator(data):
+            return imap(cls.serialize_one, data)
+        return cls.serialize_one(data)
+
+    @classmethod
+    def select(cls, fields):
+        """ Return a schema that serializes only the selected fields.
+
+        The schema is compiled the first time a selection is used and
+        cached, so unselected fields are never read. Names that aren't
+        fields of the schema are ignored.
+
+        :param fields: tree returned by ``diablo.fields.parse_fields()``
+        """
+
+        if fields is None:
+            return cls
+        key = cls._selection_key(fields)
+        selections = cls.__dict__.get('_selections')
+        if selections is None:
+            selections = cls._selections = {}
+        try:
+            return selections[key]
+        except KeyError:
+            pass
+        selected = []
+        for name, field in cls._fields:
+            if name not in fields:
+                continue
+            subfields = fields[name]
+            if subfields is not None:
+                field = cls._select_nested(field, subfields)
+            selected.append((name, field))
+        # bypasses SchemaMeta, which would compile all the inherited fields
+        schema = type.__new__(SchemaMeta, cls.__name__, (cls,), {'_fields': tuple(selected)})
+        schema._compile()
+        if len(selections) >= cls._max_selections:
+            selections.clear()
+        selections[key] = schema
+        return schema
+
+    @classmethod
+    def _selection_key(cls, fields):
+        """ Hashable version of the selection, known fields only. """
+
+        key = []
+        for name, field in cls._fields:
+            if name not in fields:
+                continue
+            subfields = fields[name]
+            if subfields is not None:
+                if field.schema is not None:
+                    subfields = field.schema._selection_key(subfields)
+                else:
+                    subfields = _freeze(subfields)
+            key.append((name, subfields))
+        return frozenset(key)
+
+    @classmethod
+    def _select_nested(cls, field, subfields):
+        """ Return a copy of the field that selects from its value. """
+
+        if field.schema is not None:
+            return Field(field.source, field.schema.select(subfields),
+                         field.many, field.convert)
+        convert = functools.partial(_project, subfields, field.convert)
+        return Field(field.source, None, field.many, convert)
+
+    @classmethod
+    def _compile(cls):
+        """ Generate ``serialize_one`` and ``serialize_many``. """
+
+        namespace = {}
+        items = []
+        for i, (name, field) in enumerate(cls._fields):
+            value = cls._source_expression(name, field)
+            if field.schema is not None:
+                helper = '_s%d' % (i,)
+                if field.many:
+                    namespace[helper] = field.schema.serialize_many
+                else:
+                    namespace[helper] = field.schema.serialize_one
+                value = '%s(%s)' % (helper, value)
+            if field.convert is not None:
+                helper = '_c%d' % (i,)
+                namespace[helper] = field.convert
+                value = '%s(%s)' % (helper, value)
+            items.append('%r: %s' % (name, value))
+        body = '{%s}' % (', '.join(items),)
+        source = (
+            'def serialize_one(obj):\n'
+            '    if obj is None:\n'
+            '        return None\n'
+            '    return %s\n'
+            '\n'
+            'def serialize_many(objs):\n'
+            '    if objs is None:\n'
+            '        return None\n'
+            '    return [%s for obj in objs]\n') % (body, body)
+        code = compile(source, '<schema %s>' % (cls.__name__,), 'exec')
+        exec code in namespace
+        cls.serialize_one = staticmethod(namespace['serialize_one'])
+        cls.serialize_many = staticmethod(namespace['serialize_many'])
+        cls._source = source
+
+    @classmethod
+    def _source_expression(cls, name, field):
+        """ Python expression that reads the source of the field. """
+
+        path = (field.source or name).split('.')
+        if cls.from_dicts:
+            return 'obj' + ''.join('[%r]' % (part,) for part in path)
+        for part in path:
+            if not _identifier.match(part) or keyword.iskeyword(part):
+                raise ValueError('invalid source for field %s: %r' % (
+                    name, field.source))
+        return 'obj.' + '.'.join(path)
+
+
+def _freeze(fields):
+    """ Hashable version of a field selection tree. """
+
+    return frozenset((name, None if subfields is None else _freeze(subfields))
+                     for name, subfields in fields.iteritems())
+
+
+def _project(fields, convert, value):
+    if convert is not None:
+        value = convert(value)
+    return project(value, fields)
+
+
+#
+#  serializer.py ends here
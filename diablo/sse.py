@@ -0,0 +1,267 @@
+#  -*- coding: utf-8 -*-
+#  sse.py ---
+#
+#  Server-Sent Events (text/event-stream) and a pub/sub channel for them.
+#
+
+
+import codecs
+from collections import deque
+
+from twisted.internet import reactor, task
+from twisted.web.server import NOT_DONE_YET
+
+from diablo import datamapper
+from diablo.http import NotAcceptable, NotFound
+from diablo.resource import Resource
+
+
+class Event(object):
+    """ Event published to a ``Channel``.
+
+    The frame of the event is built once per mapper and cached, so the
+    same bytes are written to every subscriber that uses the mapper.
+    """
+
+    __slots__ = ('data', 'event', 'id', '_frames')
+
+    def __init__(self, data, event=None, id=None):
+        """ Initialize the event.
+
+        :param data: the data, encoded with the mapper of the subscriber
+        :param event: name of the event (``addEventListener`` in the
+                      browser) or ``None`` for ``message``
+        :param id: id of the event, sent back in ``Last-Event-ID`` when
+                   the client reconnects
+        """
+
+        if id is not None:
+            id = str(id)
+        for value in (event, id):
+            if value is not None and ('\n' in value or '\r' in value):
+                raise ValueError('event names and ids must be single lines')
+        self.data = data
+        self.event = event
+        self.id = id
+        self._frames = {}
+
+    def frame(self, mapper):
+        """ Return the event encoded for the stream.
+
+        :param mapper: the ``DataMapper`` that encodes the data
+        :returns: byte string
+        """
+
+        try:
+            return self._frames[mapper]
+        except KeyError:
+            frame = self._frames[mapper] = self._encode(mapper)
+            return frame
+
+    def _encode(self, mapper):
+        content = mapper.encode(self.data).content
+        if not isinstance(content, str):
+            content = ''.join(content)
+        lines = []
+        if self.id is not None:
+            lines.append('id: ' + self.id)
+        if self.event is not None:
+            lines.append('event: ' + self.event)
+        lines.extend('data: ' + line for line in content.replace('\r\n', '\n').split('\n'))
+        return '\n'.join(lines) + '\n\n'
+
+
+class Channel(object):
+    """ Fans out published events to the connected ``EventSource`` clients.
+
+    Subscribers are grouped by their mapper, so each event is encoded
+    once per mapper no matter how many clients are connected. An idle
+    connection is just an entry in a set: the channel has one heartbeat
+    timer for all its subscribers (running only while there are any).
+    The latest ``history`` events are kept for clients that reconnect
+    with ``Last-Event-ID``.
+
+    Example::
+
+        prices = Channel()
+
+        class Prices(EventSource):
+            channel = prices
+
+        prices.publish({'product': 1, 'price': '9.90'}, event='price')
+    """
+
+    """ Seconds between the heartbeat comments that keep proxies from
+    closing idle connections. """
+    heartbeat_interval = 15
+
+    heartbeat = ':\n\n'
+
+    def __init__(self, history=100, clock=reactor):
+        """ Initialize the channel.
+
+        :param history: number of events to keep for replaying
+        :param clock: the reactor (or a ``task.Clock`` in tests)
+        """
+
+        self.history = deque(maxlen=history)
+        self.clock = clock
+        self._subscribers = {}
+        self._heartbeat = None
+        self._next_id = 1
+
+    def __len__(self):
+        """ Number of subscribers. """
+        return sum(len(requests) for requests in self._subscribers.itervalues())
+
+    def subscribe(self, request, mapper, last_event_id=None):
+        """ Start sending events to the request.
+
+        The request is unsubscribed when the connection is closed.
+
+        :param mapper: the ``DataMapper`` for encoding the events
+        :param last_event_id: id of the last event the client has seen.
+                              The events after it are sent right away if
+                              it's still in the history.
+        """
+
+        if last_event_id is not None:
+            for event in self._getEventsAfter(last_event_id):
+                request.write(event.frame(mapper))
+        self._subscribers.setdefault(mapper, set()).add(request)
+        request.notifyFinish().addBoth(self._finished, request, mapper)
+        if self._heartbeat is None:
+            self._heartbeat = task.LoopingCall(self._sendHeartbeat)
+            self._heartbeat.clock = self.clock
+            self._heartbeat.start(self.heartbeat_interval, now=False)
+
+    def unsubscribe(self, request, mapper):
+        """ Stop sending events to the request. """
+
+        requests = self._subscribers.get(mapper)
+        if requests is None:
+            return
+        requests.discard(request)
+        if not requests:
+            del self._subscribers[mapper]
+            if not self._subscribers:
+                self._stopHeartbeat()
+
+    def publish(self, data, event=None, id=None):
+        """ Send an event to all the subscribers.
+
+        :param data: the data of the event
+        :param event: name of the event
+        :param id: id of the event, by default a running number
+        :returns: the ``Event``
+        """
+
+        if id is None:
+            id = str(self._next_id)
+            self._next_id += 1
+        event = Event(data, event, id)
+        self.history.append(event)
+        for mapper, requests in self._subscribers.items():
+            frame = event.frame(mapper)
+            for request in list(requests):
+                request.write(frame)
+        return event
+
+    def close(self):
+        """ Finish all the requests (the clients will reconnect). """
+
+        subscribers, self._subscribers = self._subscribers, {}
+        self._stopHeartbeat()
+        for requests in subscribers.itervalues():
+            for request in requests:
+                request.finish()
+
+    def _getEventsAfter(self, event_id):
+        events = list(self.history)
+        for i, event in enumerate(events):
+            if event.id == event_id:
+                return events[i + 1:]
+        return ()
+
+    def _sendHeartbeat(self):
+        heartbeat = self.heartbeat
+        for requests in self._subscribers.values():
+            for request in list(requests):
+                request.write(heartbeat)
+
+    def _stopHeartbeat(self):
+        if self._heartbeat is not None:
+            self._heartbeat.stop()
+            self._heartbeat = None
+
+    def _finished(self, result, request, mapper):
+        """ The request was finished or the connection was lost. """
+        self.unsubscribe(request, mapper)
+
+
+class _Subscription(object):
+    """ Result of an ``EventSource`` handler on its way to the writer. """
+
+    __slots__ = ('channel', 'mapper')
+
+    def __init__(self, channel, mapper):
+        self.channel = channel
+        self.mapper = mapper
+
+
+class EventSource(Resource):
+    """ Resource that streams the events of a ``Channel`` to the client.
+
+    The request is kept open and the events are written as they are
+    published. The data of the events is encoded with the mapper that
+    the request negotiates (the resource's ``mapper``, ``?format=`` or
+    the default), the Accept header being ``text/event-stream``. The
+    stream is utf-8, so binary formats (e.g. msgpack) are not acceptable.
+
+    By default ``get()`` returns ``channel``. Override it to pick the
+    channel based on the request (after authentication, as usual).
+    """
+
+    """ The ``Channel`` of the resource. """
+    channel = None
+
+    """ Reconnection delay for the client in milliseconds or ``None``. """
+    retry = None
+
+    def get(self, request, *args, **kw):
+        if self.channel is None:
+            raise NotFound()
+        return self.channel
+
+    def _processResponse(self, response, request):
+        """ Negotiate the mapper for the events of a channel. """
+
+        if isinstance(response, Channel):
+            mapper = datamapper.get_encoder(request, self, accept=False)
+            if mapper.charset is None or codecs.lookup(mapper.charset).name not in ('utf-8', 'ascii'):
+                raise NotAcceptable('events can only be sent in a utf-8 format')
+            return _Subscription(response, mapper)
+        return Resource._processResponse(self, response, request)
+
+    def _writeResponse(self, response, request):
+        """ Start the event stream. """
+
+        if not isinstance(response, _Subscription):
+            return Resource._writeResponse(self, response, request)
+        request.setResponseCode(200)
+        request.setHeader('content-type', 'text/event-stream; charset=utf-8')
+        request.setHeader('cache-control', 'no-cache')
+        # e.g. nginx would buffer the events otherwise
+        request.setHeader('x-accel-buffering', 'no')
+        # sends the headers so that the client knows the stream is open
+        request.write('retry: %d\n\n' % (self.retry,) if self.retry is not None else ':\n\n')
+        last_event_id = request.getHeader('last-event-id')
+        if last_event_id is None and 'lastEventId' in request.args:
+            # EventSource polyfills can't send headers
+            last_event_id = request.args['lastEventId'][0]
+        response.channel.subscribe(request, response.mapper, last_event_id)
+        return NOT_DONE_YET
+
+
+#
+#  sse.py ends here
@@ -9,6 +9,7 @@
 import re
 import types
 import datetime
+import collections
 from decimal import Decimal
 from xml.sax.saxutils import XMLGenerator
 
@@ -115,6 +116,79 @@ def parse_accept_header(accept):
     return result
 
 
+def parse_byte_range(header, size):
+    """ Parse the Range header of a request for a single byte range.
+
+    E.g. with ``size`` 1000:  bytes=0-99  ->  (0, 100)
+    and  bytes=-100  ->  (900, 100)
+
+    :param header: value of the Range header
+    :param size: size of the entity in bytes
+    :returns: ``(offset, length)`` of the range or ``None`` if the
+              header should be ignored (not a byte range, malformed or
+              several ranges).
+    :raises: ``ValueError`` if the range is not satisfiable.
+    """
+
+    unit, sep, spec = header.partition('=')
+    first, sep, last = spec.strip().partition('-')
+    first, last = first.strip(), last.strip()
+    if unit.strip().lower() != 'bytes' or ',' in spec or not sep:
+        return None
+    elif (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if not first:
+        if not last:
+            return None
+        # suffix range, the last n bytes
+        if int(last) == 0:
+            raise ValueError('empty suffix range')
+        first, last = max(size - int(last), 0), size - 1
+    else:
+        if last and int(last) < int(first):
+            return None
+        first, last = int(first), int(last) if last else size - 1
+    if first >= size:
+        raise ValueError('range starts after the end of the entity')
+    return first, min(last, size - 1) - first + 1
+
+
+def is_iterator(obj):
+    """ Check whether ``obj`` is a lazy iterator (e.g. a generator).
+
+    Lists, tuples, dicts and strings are iterable but they are not
+    iterators.
+    """
+
+    return isinstance(obj, collections.Iterator)
+
+
+def join_chunks(chunks, size=65536):
+    """ Coalesce small chunks into chunks of at least ``size`` bytes.
+
+    Streaming encoders produce lots of tiny chunks (separators, single
+    records). Writing each of those separately to the transport would be
+    wasteful so they are joined here. At most one chunk beyond ``size``
+    is buffered.
+
+    :param chunks: iterable of byte strings
+    :returns: generator of byte strings
+    """
+
+    buf = []
+    buffered = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buf)
+            buf = []
+            buffered = 0
+    if buf:
+        yield ''.join(buf)
+
+
 # removing the dependency on django's encoding util
 # for now this is pretty much just ripped straight from django
 # removing any django specific elements
@@ -0,0 +1,308 @@
+#  -*- coding: utf-8 -*-
+#  validation.py ---
+#
+#  Declarative input schemas compiled into validator functions.
+#
+
+
+from decimal import Decimal
+
+from diablo.http import BadRequest
+from diablo.util import is_iterator
+
+
+_missing = object()
+
+# accepted python types and their names in the error messages
+_types = {
+    str: ((basestring,), 'string'),
+    unicode: ((basestring,), 'string'),
+    int: ((int, long), 'integer'),
+    long: ((int, long), 'integer'),
+    float: ((int, long, float, Decimal), 'number'),
+    Decimal: ((int, long, float, Decimal), 'number'),
+    bool: ((bool,), 'boolean'),
+    list: ((list, tuple), 'list'),
+    dict: ((dict,), 'object'),
+    }
+
+
+def _prefix_errors(errors, count, prefix):
+    """ Prepend ``prefix`` to the paths of the last ``count`` errors. """
+
+    for i in xrange(len(errors) - count, len(errors)):
+        path, message = errors[i]
+        errors[i] = (prefix + '.' + path if path else prefix, message)
+
+
+class Rule(object):
+    """ Constraints for one field of an ``InputSchema``.
+
+    :param type: python type of the value (``str``, ``int``, ``float``,
+                 ``bool``, ``list``, ``dict`` or any class). ``str``
+                 accepts unicode too and ``float`` accepts all numbers.
+                 Booleans are not accepted as numbers.
+    :param required: ``False`` if the field may be left out
+    :param default: value to fill in for an optional field that is left out
+    :param null: ``True`` if the value may be ``null``
+    :param min: minimum value (inclusive)
+    :param max: maximum value (inclusive)
+    :param min_length: minimum length of a string or a list
+    :param max_length: maximum length of a string or a list
+    :param choices: the allowed values
+    :param schema: ``InputSchema`` of a nested object
+    :param many: ``True`` if the value is a list of nested objects
+    """
+
+    # rules keep their declaration order
+    _counter = 0
+
+    def __init__(self, type=None, required=True, default=None, null=False,
+                 min=None, max=None, min_length=None, max_length=None,
+                 choices=None, schema=None, many=False):
+        self.type = type
+        self.required = required
+        self.default = default
+        self.null = null
+        self.min = min
+        self.max = max
+        self.min_length = min_length
+        self.max_length = max_length
+        self.choices = choices
+        self.schema = schema
+        self.many = many
+        Rule._counter += 1
+        self._order = Rule._counter
+
+
+class InputSchemaMeta(type):
+    """ Compiles the rules of a schema when the class is created. """
+
+    def __new__(mcs, name, bases, attrs):
+        rules = []
+        for base in reversed(bases):
+            rules.extend(getattr(base, '_rules', ()))
+        declared = [(key, value) for key, value in attrs.items()
+                    if isinstance(value, Rule)]
+        declared.sort(key=lambda item: item[1]._order)
+        names = set(key for key, value in declared)
+        rules = [item for item in rules if item[0] not in names] + declared
+        for key, value in declared:
+            del attrs[key]
+        attrs['_rules'] = tuple(rules)
+        cls = type.__new__(mcs, name, bases, attrs)
+        if rules:
+            cls._compile()
+        return cls
+
+
+class InputSchema(object):
+    """ Declarative description of a request body.
+
+    The rules are compiled into a validator function when the class is
+    defined. ``validate()`` checks the whole body and raises a single
+    ``BadRequest`` listing every error by field path, e.g.::
+
+        {'errors': {'name': 'required', 'tags.2.label': 'too long'}}
+
+    The error content is formatted with the datamapper of the request.
+
+    Example::
+
+        class ProductInput(InputSchema):
+            name = Rule(str, min_length=1, max_length=200)
+            price = Rule(float, min=0)
+            tags = Rule(schema=TagInput, many=True, required=False, default=[])
+
+        class Products(Resource):
+            input_schemas = {'post': ProductInput, 'put': ProductInput}
+    """
+
+    __metaclass__ = InputSchemaMeta
+
+    """ ``False`` if fields without a rule are errors. """
+    allow_extra = True
+
+    @classmethod
+    def validate(cls, data):
+        """ Validate the decoded body.
+
+        An iterator (streamed input) is validated lazily, an item at a
+        time as the handler consumes it.
+
+        :returns: the data, with defaults filled in
+        :raises: ``BadRequest`` with all the errors
+        """
+
+        if is_iterator(data):
+            return cls._validate_items(data)
+        errors = []
+        if cls._check(data, errors):
+            raise BadRequest({'errors': dict(errors)})
+        return data
+
+    @classmethod
+    def create(cls, data):
+        """ Turn the validated data into the object given to the handler.
+
+        Override to create model objects, by default returns the data.
+        """
+
+        return data
+
+    @classmethod
+    def _validate_items(cls, items):
+        for i, item in enumerate(items):
+            errors = []
+            if cls._check(item, errors):
+                _prefix_errors(errors, len(errors), str(i))
+                raise BadRequest({'errors': dict(errors)})
+            yield item
+
+    @classmethod
+    def _compile(cls):
+        """ Generate the ``_check(data, errors)`` function.
+
+        The function appends ``(path, message)`` pairs to ``errors`` and
+        returns the number of errors it added. Paths are relative to
+        ``data``, nested schemas are prefixed only when they fail. The
+        constants are bound as default arguments (i.e. fast locals).
+        """
+
+        namespace = {
+            '_missing': _missing,
+            '_dict': dict,
+            '_prefix': _prefix_errors,
+            '_names': frozenset(name for name, rule in cls._rules),
+            }
+        body = [
+            '    count = len(errors)',
+            '    if data.__class__ is not _dict and not isinstance(data, _dict):',
+            '        errors.append(("", "expected an object"))',
+            '        return 1',
+            ]
+        for i, (name, rule) in enumerate(cls._rules):
+            body.extend(cls._compile_rule(i, name, rule, namespace))
+        if not cls.allow_extra:
+            body.extend([
+                '    for key in data:',
+                '        if key not in _names:',
+                '            errors.append((key, "unknown field"))',
+                ])
+        body.append('    return len(errors) - count')
+        args = ''.join(', %s=%s' % (key, key) for key in sorted(namespace))
+        source = 'def _check(data, errors%s):\n%s\n' % (args, '\n'.join(body))
+        code = compile(source, '<input schema %s>' % (cls.__name__,), 'exec')
+        exec code in namespace
+        cls._check = staticmethod(namespace['_check'])
+        cls._source = source
+
+    @classmethod
+    def _compile_rule(cls, i, name, rule, namespace):
+        """ Generate the lines that check one field. """
+
+        def error(message, indent='        '):
+            return '%serrors.append((%r, %r))' % (indent, name, message)
+
+        lines = [
+            '    try:',
+            '        value = data[%r]' % (name,),
+            '    except KeyError:',
+            ]
+        if rule.required:
+            lines.append(error('required'))
+        elif rule.default is not None:
+            # mutable defaults are copied for each request
+            namespace['_d%d' % (i,)] = rule.default
+            default = '_d%d' % (i,)
+            if isinstance(rule.default, (list, dict)):
+                default = '%s(%s)' % (type(rule.default).__name__, default)
+            lines.append('        data[%r] = %s' % (name, default))
+        else:
+            lines.append('        pass')
+        lines.append('    else:')
+        lines.extend('    ' + line for line in cls._compile_value(i, name, rule, namespace, error))
+        return lines
+
+    @classmethod
+    def _compile_value(cls, i, name, rule, namespace, error):
+        """ Generate the lines that check the value of a field. """
+
+        lines = ['    if value is None:']
+        lines.append('        pass' if rule.null else error('must not be null'))
+
+        value_type = rule.type
+        if value_type is None and rule.schema is not None:
+            value_type = list if rule.many else dict
+        if value_type is not None:
+            types, type_name = _types.get(
+                value_type, ((value_type,), value_type.__name__))
+            # exact classes are checked first, subclasses with isinstance
+            namespace['_e%d' % (i,)] = frozenset(types)
+            namespace['_t%d' % (i,)] = types
+            condition = 'not isinstance(value, _t%d)' % (i,)
+            if bool not in types and int in types:
+                condition += ' or value is True or value is False'
+            lines.append('    elif value.__class__ not in _e%d and (%s):' % (
+                i, condition))
+            lines.append(error('expected ' + type_name))
+
+        checks = []
+        if rule.min is not None:
+            namespace['_min%d' % (i,)] = rule.min
+            checks.append(('value < _min%d' % (i,),
+                           'must be at least %s' % (rule.min,)))
+        if rule.max is not None:
+            namespace['_max%d' % (i,)] = rule.max
+            checks.append(('value > _max%d' % (i,),
+                           'must be at most %s' % (rule.max,)))
+        length_checks = []
+        if rule.min_length is not None:
+            length_checks.append(('len(value) < %d' % (rule.min_length,),
+                                  'must be at least %d long' % (rule.min_length,)))
+        if rule.max_length is not None:
+            length_checks.append(('len(value) > %d' % (rule.max_length,),
+                                  'must be at most %d long' % (rule.max_length,)))
+        if rule.choices is not None:
+            namespace['_ch%d' % (i,)] = tuple(rule.choices)
+            checks.append(('value not in _ch%d' % (i,),
+                           'must be one of %s' % (
+                               ', '.join(sorted(map(unicode, rule.choices)))),))
+        nested = []
+        if rule.schema is not None:
+            namespace['_v%d' % (i,)] = rule.schema._check
+            if rule.many:
+                nested = [
+                    '        for i, item in enumerate(value):',
+                    '            failed = _v%d(item, errors)' % (i,),
+                    '            if failed:',
+                    '                _prefix(errors, failed, "%s.%%d" %% (i,))' % (name,),
+                    ]
+            else:
+                nested = [
+                    '        failed = _v%d(value, errors)' % (i,),
+                    '        if failed:',
+                    '            _prefix(errors, failed, %r)' % (name,),
+                    ]
+
+        if checks or length_checks or nested:
+            lines.append('    else:')
+            for condition, message in checks:
+                lines.append('        if %s:' % (condition,))
+                lines.append(error(message, '            '))
+            indent = '        '
+            if length_checks and not hasattr(value_type, '__len__'):
+                # the type doesn't guarantee that the value has a length
+                lines.append('        if not hasattr(value, "__len__"):')
+                lines.append(error('expected a string or a list', '            '))
+                lines.append('        else:')
+                indent = '            '
+            for condition, message in length_checks:
+                lines.append('%sif %s:' % (indent, condition))
+                lines.append(error(message, indent + '    '))
+            lines.extend(nested)
+        return lines
+
+
+#
+#  validation.py ends here
@@ -0,0 +1,121 @@
+#  -*- coding: utf-8 -*-
+#  xmlrpc.py ---
+#
+#  XML-RPC resource with system.multicall support.
+#
+
+
+import xmlrpclib
+
+from twisted.internet import defer
+
+from .http import HTTPError
+from .resource import Resource
+from .mappers.xmlrpcmapper import XmlRpcMapper
+
+
+# fault codes (same as in twisted.web.xmlrpc)
+NOT_FOUND = 8001
+FAILURE = 8002
+
+
+class XmlRpcResource(Resource):
+    """ Resource that dispatches XML-RPC calls to handler methods.
+
+    Method ``foo.bar`` is handled by ``xmlrpc_foo_bar(request, *params)``.
+    Handlers may return deferreds. Raising ``xmlrpclib.Fault`` or
+    ``HTTPError`` in a handler results in a fault response.
+
+    ``system.multicall`` executes many calls in one HTTP request. The
+    calls are started together and their results are returned in one
+    response. A failing call only produces a fault struct in its own
+    place in the results.
+
+    Example::
+
+        class Calculator(XmlRpcResource):
+            def xmlrpc_math_add(self, request, a, b):
+                return a + b
+    """
+
+    mapper = XmlRpcMapper()
+
+    def post(self, data, request, *args, **kw):
+        """ Execute the XML-RPC call. """
+
+        if not data:
+            return xmlrpclib.Fault(FAILURE, 'no method call')
+        params, methodname = data
+        if methodname == 'system.multicall':
+            if len(params) != 1 or not isinstance(params[0], list):
+                return xmlrpclib.Fault(FAILURE, 'system.multicall expects a list of calls')
+            return self._multicall(params[0], request)
+        d = self._call(methodname, params, request)
+        d.addErrback(self._toFault)
+        return d
+
+    def _multicall(self, calls, request):
+        """ Execute all the calls and return their results in a list.
+
+        :returns: deferred list of ``[result]`` or fault structs.
+        """
+
+        def call(spec):
+            try:
+                methodname = spec['methodName']
+                params = spec.get('params', [])
+            except (TypeError, KeyError, AttributeError):
+                return defer.succeed(
+                    self._faultStruct(FAILURE, 'invalid call: %r' % (spec,)))
+            if methodname == 'system.multicall':
+                return defer.succeed(
+                    self._faultStruct(FAILURE, 'recursive system.multicall'))
+            d = self._call(methodname, params, request)
+            d.addCallbacks(lambda result: [result], self._toFaultStruct)
+            return d
+
+        return defer.gatherResults([call(spec) for spec in calls])
+
+    def _call(self, methodname, params, request):
+        """ Invoke the handler of the method.
+
+        :returns: deferred
+        """
+
+        handler = self._getHandler(methodname)
+        if handler is None:
+            return defer.fail(xmlrpclib.Fault(
+                NOT_FOUND, 'method not found: %s' % (methodname,)))
+        return defer.maybeDeferred(handler, request, *params)
+
+    def _getHandler(self, methodname):
+        """ Return the handler method for the XML-RPC method or ``None``. """
+
+        if not isinstance(methodname, basestring):
+            return None
+        return getattr(self, 'xmlrpc_' + methodname.replace('.', '_'), None)
+
+    def _toFault(self, failure):
+        """ Turn the failure of a call into ``xmlrpclib.Fault``. """
+
+        if failure.check(xmlrpclib.Fault):
+            return failure.value
+        elif failure.check(HTTPError):
+            return xmlrpclib.Fault(
+                failure.value.code, str(failure.value.content or ''))
+        else:
+            self.log.error(failure.getTraceback())
+            return xmlrpclib.Fault(FAILURE, str(failure.value))
+
+    def _toFaultStruct(self, failure):
+        """ Turn the failure of a call into a multicall fault struct. """
+
+        fault = self._toFault(failure)
+        return self._faultStruct(fault.faultCode, fault.faultString)
+
+    def _faultStruct(self, code, string):
+        return {'faultCode': code, 'faultString': string}
+
+
+#
+#  xmlrpc.py ends here
@@ -0,0 +1,478 @@
+#  -*- coding: utf-8 -*-
+#  test_mappers.py ---
+#
+
+import datetime
+import json
+import uuid
+from decimal import Decimal
+from StringIO import StringIO
+
+from twisted.trial import unittest
+from twisted.web.test.test_web import DummyRequest
+
+from diablo.adapters import AdapterRegistry
+from diablo.datamapper import DataMapper
+from diablo.fragment import Fragment
+from diablo.http import BadRequest, RequestEntityTooLarge
+from diablo.mappers.csvmapper import CsvMapper, TsvMapper
+from diablo.mappers.jsonmapper import JsonMapper, JsonArrayDecoder
+from diablo.mappers.msgpackmapper import MsgPackMapper
+from diablo.mappers.multipartmapper import MultipartMapper
+from diablo.mappers import pymsgpack
+from diablo.mappers.ndjsonmapper import NdJsonMapper
+from diablo.mappers.xmlmapper import XmlMapper
+from diablo.mappers.yamlmapper import YamlMapper
+
+
+class DataMapperTest(unittest.TestCase):
+
+    def test_content_is_bytes(self):
+        res = DataMapper().encode(u'Hämeenlinna')
+        self.assertEquals(res.content, 'H\xc3\xa4meenlinna')
+        self.assertEquals(res.headers['Content-Length'], 12)
+        self.assertEquals(res.headers['Content-Type'], 'text/plain; charset=utf-8')
+
+    def test_other_charset(self):
+        mapper = DataMapper()
+        mapper.charset = 'latin-1'
+        self.assertEquals(mapper.encode(u'ä').content, '\xe4')
+        self.assertEquals(mapper.encode('\xc3\xa4').content, '\xe4')
+        self.assertEquals(mapper.encode('abc').content, 'abc')
+        self.assertEquals(mapper.encode(None).content, '')
+        self.assertEquals(mapper.encode(12).content, '12')
+        self.assertEquals(mapper.encode('x').headers['Content-Type'], 'text/plain; charset=latin-1')
+
+    def test_decode(self):
+        self.assertEquals(DataMapper().decode('\xc3\xa4'), u'ä')
+        self.assertEquals(DataMapper().decode('\xe4', 'latin-1'), u'ä')
+        self.assertRaises(BadRequest, DataMapper().decode, '\xe4')
+
+    def test_iterators(self):
+        data = {'count': 2, 'rows': (i for i in xrange(2))}
+        self.assertEquals(DataMapper().encode(data).content, str({'count': 2, 'rows': [0, 1]}))
+        self.assertEquals(DataMapper().encode(iter([(1, 2)])).content, '[(1, 2)]')
+
+
+class JsonMapperTest(unittest.TestCase):
+
+    data = {'name': u'Åke', 'ids': [1, 2, 3]}
+
+    def test_compact_by_default(self):
+        mapper = JsonMapper()
+        content = mapper._format_data(self.data, 'utf-8')
+        self.assertNotIn(' ', content)
+        self.assertNotIn('\n', content)
+        self.assertEquals(json.loads(content), self.data)
+
+    def test_utf8_output(self):
+        mapper = JsonMapper(ensure_ascii=False)
+        content = mapper._format_data(self.data, 'utf-8')
+        self.assertTrue(isinstance(content, str))
+        self.assertIn(u'Åke'.encode('utf-8'), content)
+        self.assertEquals(json.loads(content), self.data)
+
+    def test_pretty_query_param(self):
+        mapper = JsonMapper()
+        request = DummyRequest([''])
+        self.assertIdentical(mapper.for_request(request, None), mapper)
+        request.args['pretty'] = ['1']
+        pretty = mapper.for_request(request, None)
+        self.assertTrue(pretty.pretty)
+        self.assertIdentical(pretty, mapper.for_request(request, None))
+        self.assertIn('\n    ', pretty._format_data(self.data, 'utf-8'))
+
+    def test_iterencode_nested_iterators(self):
+        mapper = JsonMapper()
+        data = {'rows': (dict(id=i, tags=iter('ab')) for i in range(3)), 1: None}
+        chunks = list(mapper.iterencode(data))
+        self.assertTrue(len(chunks) > 3)
+        self.assertEquals(json.loads(''.join(chunks)), {
+            'rows': [{'id': i, 'tags': ['a', 'b']} for i in range(3)],
+            '1': None})
+
+    def test_iterator_is_streamed(self):
+        mapper = JsonMapper()
+        content = mapper._format_data(iter([1, 2, 3]), 'utf-8')
+        self.assertFalse(isinstance(content, basestring))
+        self.assertEquals(''.join(content), '[1,2,3]')
+
+
+class JsonArrayDecoderTest(unittest.TestCase):
+
+    def test_feed_in_pieces(self):
+        data = [{'id': i, 'name': u'ä' * i} for i in range(50)] + [12345, []]
+        text = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        decoder = JsonArrayDecoder()
+        items = []
+        for i in range(0, len(text), 7):
+            items.extend(decoder.feed(text[i:i + 7]))
+        items.extend(decoder.close())
+        self.assertEquals(items, data)
+
+    def test_number_at_chunk_boundary(self):
+        decoder = JsonArrayDecoder()
+        self.assertEquals(decoder.feed('[1, 22'), [1])
+        self.assertEquals(decoder.feed('33]'), [2233])
+        self.assertEquals(decoder.close(), [])
+
+    def test_invalid(self):
+        for text in ('[1,,2]', '[1 2]', '{"a": 1}', '[1] 2'):
+            decoder = JsonArrayDecoder()
+            self.assertRaises(BadRequest, lambda: decoder.feed(text) + decoder.close())
+
+    def test_incomplete(self):
+        decoder = JsonArrayDecoder()
+        decoder.feed('[1, 2')
+        self.assertRaises(BadRequest, decoder.close)
+
+
+class NdJsonMapperTest(unittest.TestCase):
+
+    def test_format_list(self):
+        mapper = NdJsonMapper()
+        content = mapper._format_data([{'id': 1}, {'id': 2}], 'utf-8')
+        self.assertEquals(content, '{"id":1}\n{"id":2}\n')
+
+    def test_format_iterator(self):
+        mapper = NdJsonMapper()
+        content = mapper._format_data(({'id': i} for i in range(3)), 'utf-8')
+        self.assertFalse(isinstance(content, basestring))
+        lines = ''.join(content).splitlines()
+        self.assertEquals([json.loads(line) for line in lines],
+                          [{'id': 0}, {'id': 1}, {'id': 2}])
+
+    def test_parse_reports_bad_lines(self):
+        mapper = NdJsonMapper()
+        reader = mapper._parse_data('{"id": 1}\n{"id": \n\n{"id": 3}\n', 'utf-8')
+        self.assertEquals(list(reader), [{'id': 1}, {'id': 3}])
+        self.assertEquals([lineno for lineno, error in reader.errors], [2])
+
+    def test_decode_stream(self):
+        mapper = NdJsonMapper()
+        reader = mapper.decode_stream(StringIO('{"id": 1}\nxx\n{"id": 2}'))
+        self.assertEquals(list(reader), [{'id': 1}, {'id': 2}])
+        self.assertEquals(reader.errors[0][0], 2)
+
+
+class XmlMapperParseTest(unittest.TestCase):
+
+    document = (
+        '<root><orders>'
+        '<order_item><id>3</id><name>Skates</name></order_item>'
+        '<order_item><id>4</id><name>Snowboard</name></order_item>'
+        '<order_info>Urgent</order_info>'
+        '</orders><count>2</count><price>1.5</price></root>')
+
+    def test_same_as_sax(self):
+        for numbermode in (None, 'basic', 'decimal'):
+            sax = XmlMapper(numbermode, parser='sax')._parse_data(self.document, 'utf-8')
+            etree = XmlMapper(numbermode)._parse_data(self.document, 'utf-8')
+            self.assertEquals(sorted(sax.keys()), sorted(etree.keys()))
+            self.assertEquals(sorted(sax['orders']), sorted(etree['orders']))
+            self.assertEquals(sax['price'], etree['price'])
+
+    def test_list_keeps_document_order(self):
+        data = XmlMapper('basic')._parse_data(self.document, 'utf-8')
+        self.assertEquals(data['orders'], [
+            {'id': 3, 'name': 'Skates'},
+            {'id': 4, 'name': 'Snowboard'},
+            'Urgent'])
+        self.assertEquals(data['count'], 2)
+
+    def test_invalid(self):
+        mapper = XmlMapper()
+        self.assertRaises(BadRequest, mapper._parse_data, '<root><a></root>', 'utf-8')
+        self.assertRaises(BadRequest, mapper._parse_data, '<other/>', 'utf-8')
+
+
+class XmlMapperFormatTest(unittest.TestCase):
+
+    data = {
+        'name': u'Åke <&> co',
+        'raw': 'utf-8 \xc3\xa4',
+        'volumes': [12, 3.5, None, True, (1, 2)],
+        'nested': {'a': [{'b': 1L}]},
+        }
+
+    class LegacyXmlMapper(XmlMapper):
+        def _get_encoder(self, charset):
+            return None
+
+    def test_same_as_generator(self):
+        for charset in ('utf-8', 'iso-8859-1', 'ascii'):
+            legacy = self.LegacyXmlMapper()._format_data(self.data, charset)
+            fast = XmlMapper()._format_data(self.data, charset)
+            self.assertEquals(legacy, fast)
+
+    def test_item_names(self):
+        content = XmlMapper()._format_data({'volumes': [12, 34]}, 'utf-8')
+        self.assertEquals(content, (
+            '<?xml version="1.0" encoding="utf-8"?>\n<root><volumes>'
+            '<volumes_item>12</volumes_item><volumes_item>34</volumes_item>'
+            '</volumes></root>'))
+
+    def test_streaming(self):
+        mapper = XmlMapper()
+        rows = ({'id': i} for i in range(3))
+        content = mapper._format_data({'count': 3, 'rows': rows}, 'utf-8')
+        self.assertFalse(isinstance(content, basestring))
+        expected = mapper._format_data({'count': 3, 'rows': [{'id': i} for i in range(3)]}, 'utf-8')
+        self.assertEquals(''.join(content), expected)
+
+    def test_tag_cache_is_bounded(self):
+        encoder = XmlMapper()._get_encoder('utf-8')
+        encoder._max_tags = 10
+        data = dict(('id%d' % (i,), [i]) for i in xrange(100))
+        content = ''.join(encoder.iterencode(data, 'root'))
+        self.assertIn('<id42><id42_item>42</id42_item></id42>', content)
+        self.assertTrue(len(encoder._tags) <= 10)
+        self.assertTrue(len(encoder._item_tags) <= 10)
+
+    def test_iterencode_yields_items(self):
+        encoder = XmlMapper()._get_encoder('utf-8')
+        chunks = list(encoder.iterencode(iter([1, 2, 3]), 'root'))
+        self.assertEquals(chunks[1:4], ['<_item>1</_item>', '<_item>2</_item>', '<_item>3</_item>'])
+
+    def test_overridden_to_xml(self):
+        class CustomXmlMapper(XmlMapper):
+            def _to_xml(self, xml, data, key=None):
+                xml.characters(u'custom')
+        content = CustomXmlMapper()._format_data({'a': 1}, 'utf-8')
+        self.assertIn('<root>custom</root>', content)
+
+
+class YamlMapperTest(unittest.TestCase):
+
+    def test_format(self):
+        content = YamlMapper()._format_data({'a': (1, 2), u'b': u'x'}, 'utf-8')
+        self.assertEquals(content, '{a: [1, 2], b: x}\n')
+        content = YamlMapper(default_flow_style=False)._format_data({'a': [1, 2]}, 'utf-8')
+        self.assertEquals(content, 'a:\n- 1\n- 2\n')
+
+    def test_pure_python(self):
+        mapper = YamlMapper(use_libyaml=False)
+        data = {'a': [1, 2], 'b': {'c': u'Åke'}}
+        self.assertEquals(mapper._parse_data(mapper._format_data(data, 'utf-8'), 'utf-8'), data)
+
+    def test_safe_load(self):
+        mapper = YamlMapper()
+        self.assertRaises(BadRequest, mapper._parse_data, '!!python/object/apply:os.getcwd []', 'utf-8')
+        self.assertRaises(BadRequest, mapper._parse_data, 'a: [1, 2', 'utf-8')
+
+    def test_iterators(self):
+        for mapper in (YamlMapper(), YamlMapper(use_libyaml=False)):
+            data = {'count': 2, 'rows': ({'id': i} for i in xrange(2))}
+            self.assertEquals(mapper._format_data(data, 'utf-8'),
+                              '{count: 2, rows: [{id: 0}, {id: 1}]}\n')
+
+
+class MsgPackMapperTest(unittest.TestCase):
+
+    data = {u'a': [1, -1, 2 ** 40, 1.5, None, True, 'x']}
+    packed = '\x81\xa1a\x97\x01\xff\xcf\x00\x00\x01\x00\x00\x00\x00\x00\xcb?\xf8\x00\x00\x00\x00\x00\x00\xc0\xc3\xa1x'
+
+    def test_encode(self):
+        for mapper in (MsgPackMapper(), MsgPackMapper(use_msgpack=False)):
+            res = mapper.encode(self.data)
+            self.assertEquals(res.content, self.packed)
+            self.assertEquals(res.headers['Content-Type'], 'application/msgpack')
+            self.assertEquals(res.headers['Content-Length'], len(self.packed))
+
+    def test_decode(self):
+        for mapper in (MsgPackMapper(), MsgPackMapper(use_msgpack=False)):
+            self.assertEquals(mapper.decode(self.packed, 'latin-1'), {u'a': [1, -1, 2 ** 40, 1.5, None, True, u'x']})
+            self.assertRaises(BadRequest, mapper.decode, '\x92\x01')
+            self.assertRaises(BadRequest, mapper.decode, '\xc1')
+
+    def test_pymsgpack_sizes(self):
+        for obj in (127, 128, -32, -33, 2 ** 16, -2 ** 31 - 1, u'ä' * 40, 'x' * 70000, range(16), dict.fromkeys(range(16))):
+            self.assertEquals(pymsgpack.unpackb(pymsgpack.packb(obj)), obj)
+        self.assertEquals(pymsgpack.unpackb('\xc4\x02ab'), 'ab')
+        self.assertRaises(ValueError, pymsgpack.unpackb, '\x01\x02')
+        self.assertRaises(ValueError, pymsgpack.packb, 2 ** 64)
+        self.assertRaises(TypeError, pymsgpack.packb, object())
+
+    def test_pymsgpack_depth(self):
+        self.assertEquals(pymsgpack.unpackb('\x91' * 255 + '\x90'), reduce(lambda a, b: [a], xrange(255), []))
+        self.assertRaises(pymsgpack.UnpackValueError, pymsgpack.unpackb, '\x91' * 100000 + '\x90')
+        self.assertRaises(pymsgpack.UnpackValueError, pymsgpack.unpackb, '\x81\x01' * 300 + '\xc0')
+        self.assertRaises(BadRequest, MsgPackMapper(use_msgpack=False).decode, '\x91' * 100000 + '\x90')
+
+
+class CsvMapperTest(unittest.TestCase):
+
+    def test_format(self):
+        content = CsvMapper()._format_data([{'b': u'ä,x', 'a': 1}, {'a': None, 'c': 3}], 'utf-8')
+        self.assertEquals(content, 'a,b\r\n1,"\xc3\xa4,x"\r\n,\r\n')
+        self.assertEquals(TsvMapper()._format_data([[1, 2], (3, 4)], 'utf-8'), '1\t2\r\n3\t4\r\n')
+        self.assertEquals(CsvMapper(['a'])._format_data([], 'utf-8'), 'a\r\n')
+        self.assertEquals(CsvMapper()._format_data(None, 'utf-8'), '')
+
+    def test_resource_columns(self):
+        class Report(object):
+            csv_columns = ['b', 'a']
+        mapper = CsvMapper().for_request(DummyRequest(['']), Report())
+        content = ''.join(mapper.encode(iter([{'a': 1, 'b': 2}] * 1200)).content)
+        self.assertEquals(content, 'b,a\r\n' + '2,1\r\n' * 1200)
+
+    def test_parse(self):
+        reader = CsvMapper().decode('a,b\r\n1,"x\ny"\r\n\r\n\xc3\xa4,2\r\n')
+        self.assertEquals(reader.header, [u'a', u'b'])
+        self.assertEquals(list(reader), [{u'a': u'1', u'b': u'x\ny'}, {u'a': u'ä', u'b': u'2'}])
+        self.assertEquals(list(CsvMapper().decode_stream(StringIO(''))), [])
+        self.assertRaises(BadRequest, list, CsvMapper().decode('a,b\n1\n'))
+        self.assertRaises(BadRequest, list, CsvMapper().decode('a\n\xe4\n'))
+
+
+class FragmentTest(unittest.TestCase):
+
+    user = {'id': 1, 'tags': ['a', 'b']}
+
+    def test_json_splice(self):
+        mapper = JsonMapper()
+        data = {'user': Fragment(json='{"id":1}'), 'list': [Fragment(self.user), 2]}
+        self.assertEquals(json.loads(''.join(mapper._format_data(data, 'utf-8'))),
+                          {'user': {'id': 1}, 'list': [self.user, 2]})
+        self.assertEquals(''.join(mapper._format_data(iter([Fragment(json='[]')]), 'utf-8')), '[[]]')
+
+    def test_xml_splice(self):
+        mapper = XmlMapper()
+        expected = mapper._format_data({'user': self.user, 'x': 1}, 'utf-8')
+        data = {'user': Fragment(self.user), 'x': Fragment(xml='1')}
+        self.assertEquals(mapper._format_data(data, 'utf-8'), expected)
+        self.assertEquals(mapper._format_data({'tags': Fragment(['a'])}, 'utf-8'),
+                          mapper._format_data({'tags': ['a']}, 'utf-8'))
+
+    def test_xml_splice_other_charset(self):
+        mapper = XmlMapper()
+        data = {'user': Fragment(self.user), 'name': Fragment(xml=u'Hämeen'.encode('utf-8'))}
+        content = mapper._format_data(data, 'utf-16')
+        self.assertEquals(content, mapper._format_data({'user': self.user, 'name': u'Hämeen'}, 'utf-16'))
+        self.assertTrue(u'<name>Hämeen</name>' in content.decode('utf-16'))
+
+    def test_lazy_encoding_is_cached(self):
+        calls = []
+        fragment = Fragment(self.user)
+        encode = lambda data: calls.append(data) or 'x'
+        self.assertEquals(fragment.encoded('json', 'key', encode), 'x')
+        self.assertEquals(fragment.encoded('json', 'key', encode), 'x')
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(Fragment(json='y').encoded('json', 'key', encode), 'y')
+        self.assertRaises(TypeError, Fragment, json=u'{}')
+
+    def test_json_fragment_next_to_iterator(self):
+        pulled = []
+
+        def rows():
+            for i in range(3):
+                pulled.append(i)
+                yield {'id': i}
+        data = {'a': Fragment(json='{"cached":true}'), 'b': rows(), 'c': [Fragment(json='1'), rows()]}
+        content = JsonMapper()._format_data(data, 'utf-8')
+        # streamed: nothing is pulled before the body is written
+        self.assertFalse(isinstance(content, str))
+        self.assertEquals(pulled, [])
+        self.assertEquals(json.loads(''.join(content)), {
+            'a': {'cached': True},
+            'b': [{'id': 0}, {'id': 1}, {'id': 2}],
+            'c': [1, [{'id': 0}, {'id': 1}, {'id': 2}]]})
+
+
+class MultipartMapperTest(unittest.TestCase):
+
+    body = (
+        'preamble\r\n'
+        '--XyZ\r\n'
+        'Content-Disposition: form-data; name="title"\r\n'
+        '\r\n'
+        'Hello \xc3\xa4\r\n'
+        '--XyZ\r\n'
+        'Content-Disposition: form-data; name="export"; filename="a.bin"\r\n'
+        'Content-Type: application/octet-stream\r\n'
+        '\r\n' + '\r\n--Xy\r\n' * 1000 + '\r\n'
+        '--XyZ--\r\n')
+
+    def _mapper(self, **kw):
+        request = DummyRequest([''])
+        request.headers = {'content-type': 'multipart/form-data; boundary=XyZ'}
+        mapper = MultipartMapper(**kw).for_request(request, None)
+        mapper.chunk_size = 100
+        return mapper
+
+    def test_parse(self):
+        form = self._mapper().decode_stream(StringIO(self.body))
+        self.assertEquals([part.name for part in form], [u'title', u'export'])
+        self.assertEquals(form['title'].value, u'Hello \xe4')
+        self.assertEquals(form['export'].filename, u'a.bin')
+        self.assertEquals(form['export'].content_type, 'application/octet-stream')
+        self.assertEquals(form['export'].read(), '\r\n--Xy\r\n' * 1000)
+
+    def test_spill_to_disk(self):
+        form = self._mapper(memory_limit=1000).decode_stream(StringIO(self.body))
+        self.assertTrue(form['title'].in_memory)
+        self.assertFalse(form['export'].in_memory)
+        self.assertEquals(form['export'].size, 8000)
+        form.close()
+
+    def test_limits(self):
+        mapper = self._mapper(max_part_size=7999)
+        self.assertRaises(RequestEntityTooLarge, mapper.decode_stream, StringIO(self.body))
+        mapper = self._mapper(max_total_size=len(self.body) - 1)
+        self.assertRaises(RequestEntityTooLarge, mapper.decode_stream, StringIO(self.body))
+
+    def test_invalid(self):
+        mapper = self._mapper()
+        self.assertRaises(BadRequest, mapper.decode_stream, StringIO(self.body[:-20]))
+        self.assertRaises(BadRequest, mapper.decode_stream, StringIO('--XyZ\r\nfoo\r\n\r\n'))
+        self.assertEquals(mapper.decode_stream(StringIO('')), None)
+
+
+class AdapterTest(unittest.TestCase):
+
+    data = {
+        'at': datetime.datetime(2012, 4, 8, 13, 43, 27),
+        'price': Decimal('9.50'),
+        'id': uuid.UUID('12345678123456781234567812345678'),
+        'tags': set(['snow']),
+        }
+
+    def test_registry_lookup(self):
+        class Base(object):
+            pass
+        class Child(Base):
+            pass
+        registry = AdapterRegistry()
+        self.assertEquals(registry.lookup(Child), None)
+        registry.register(Base, repr)
+        self.assertEquals(registry.lookup(Child), repr)
+        registry.register(Child, str)
+        self.assertEquals(registry.lookup(Child), str)
+        self.assertRaises(TypeError, registry.adapt, 1)
+
+    def test_json(self):
+        self.assertEquals(json.loads(JsonMapper()._format_data(self.data, 'utf-8')), {
+            'at': '2012-04-08T13:43:27',
+            'price': '9.50',
+            'id': '12345678-1234-5678-1234-567812345678',
+            'tags': ['snow'],
+            })
+
+    def test_xml(self):
+        legacy = XmlMapperFormatTest.LegacyXmlMapper()._format_data(self.data, 'utf-8')
+        fast = XmlMapper()._format_data(self.data, 'utf-8')
+        self.assertEquals(legacy, fast)
+        self.assertIn('<at>2012-04-08T13:43:27</at>', fast)
+        self.assertIn('<tags><tags_item>snow</tags_item></tags>', fast)
+
+    def test_msgpack(self):
+        data = MsgPackMapper(use_msgpack=False)._format_data(self.data, None)
+        self.assertEquals(pymsgpack.unpackb(data)['price'], '9.50')
+
+    def test_yaml(self):
+        content = YamlMapper()._format_data({'price': Decimal('9.50')}, 'utf-8')
+        self.assertEquals(YamlMapper()._parse_data(content, 'utf-8'), {'price': '9.50'})
+
+
+#
+#  test_mappers.py ends here
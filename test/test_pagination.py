@@ -0,0 +1,85 @@
+#  -*- coding: utf-8 -*-
+#  test_pagination.py ---
+#
+
+from twisted.trial import unittest
+
+from diablo.http import BadRequest
+from diablo.pagination import Paginated, encode_cursor, decode_cursor
+
+
+class PaginatedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pulled = []
+
+    def rows(self, count):
+        for i in xrange(count):
+            self.pulled.append(i)
+            yield {'id': i}
+
+    def test_cursor(self):
+        for value in (0, 120, 'abc', [1, u'\xe4']):
+            cursor = encode_cursor(value)
+            self.assertFalse('=' in cursor)
+            self.assertEquals(decode_cursor(cursor), value)
+        self.assertRaises(BadRequest, decode_cursor, 'not a cursor')
+        self.assertRaises(BadRequest, decode_cursor, u'\xe4')
+
+    def test_iterable(self):
+        paginated = Paginated(self.rows(100))
+        items, cursor = paginated.page(None, 10)
+        self.assertEquals([item['id'] for item in items], range(10))
+        self.assertEquals(cursor, 10)
+        # one lookahead row
+        self.assertEquals(len(self.pulled), 11)
+
+    def test_iterable_last_page(self):
+        items, cursor = Paginated(self.rows(25)).page(20, 10)
+        self.assertEquals([item['id'] for item in items], range(20, 25))
+        self.assertEquals(cursor, None)
+        self.assertRaises(BadRequest, Paginated([]).page, 'x', 10)
+        self.assertRaises(BadRequest, Paginated([]).page, -1, 10)
+
+    def test_max_offset(self):
+        self.assertRaises(BadRequest, Paginated(self.rows(100)).page, 10 ** 9, 10)
+        self.assertRaises(BadRequest, Paginated(self.rows(100), max_offset=20).page, 30, 10)
+        self.assertEquals(self.pulled, [])
+        items, cursor = Paginated(self.rows(100), max_offset=30).page(20, 10)
+        self.assertEquals(cursor, 30)
+        # no next page that the client couldn't ask for
+        items, cursor = Paginated(self.rows(100), max_offset=20).page(20, 10)
+        self.assertEquals(len(items), 10)
+        self.assertEquals(cursor, None)
+        items, cursor = Paginated(iter(xrange(20000))).page(10000, 50)
+        self.assertEquals(items[0], 10000)
+        self.assertEquals(cursor, None)
+
+    def test_keyset(self):
+        calls = []
+
+        def fetch(after, limit):
+            calls.append((after, limit))
+            return self.rows(100) if after is None else ({'id': i} for i in xrange(after + 1, 100))
+        paginated = Paginated(fetch, key=lambda item: item['id'])
+        items, cursor = paginated.page(None, 10)
+        self.assertEquals(cursor, 9)
+        self.assertEquals(len(self.pulled), 11)
+        items, cursor = paginated.page(cursor, 10)
+        self.assertEquals(items[0], {'id': 10})
+        self.assertEquals(calls, [(None, 11), (9, 11)])
+
+    def test_callable_offset(self):
+        calls = []
+
+        def fetch(offset, limit):
+            calls.append((offset, limit))
+            return range(offset or 0, min((offset or 0) + limit, 15))
+        paginated = Paginated(fetch)
+        self.assertEquals(paginated.page(None, 10), (range(10), 10))
+        self.assertEquals(paginated.page(10, 10), (range(10, 15), None))
+        self.assertEquals(calls, [(None, 11), (10, 11)])
+
+
+#
+#  test_pagination.py ends here
@@ -0,0 +1,103 @@
+#  -*- coding: utf-8 -*-
+#  test_patch.py ---
+#
+
+from twisted.trial import unittest
+
+from diablo.http import BadRequest, Conflict
+from diablo.mappers.patchmapper import JsonPatchMapper, MergePatchMapper
+from diablo.patch import JsonPatch, MergePatch, apply_patch, merge_patch, parse_pointer
+
+
+class JsonPatchTest(unittest.TestCase):
+
+    def test_pointer(self):
+        self.assertEquals(parse_pointer(''), ())
+        self.assertEquals(parse_pointer('/a~1b/0/~01'), ('a/b', '0', '~1'))
+        self.assertRaises(BadRequest, parse_pointer, 'a')
+
+    def test_operations(self):
+        doc = {'foo': ['bar', 'baz'], 'baz': {'qux': 'hello'}}
+        patch = JsonPatch([
+            {'op': 'add', 'path': '/foo/1', 'value': 'qux'},
+            {'op': 'replace', 'path': '/baz/qux', 'value': 'world'},
+            {'op': 'copy', 'from': '/baz', 'path': '/copy'},
+            {'op': 'move', 'from': '/foo/0', 'path': '/moved'},
+            {'op': 'remove', 'path': '/copy/qux'},
+            {'op': 'test', 'path': '/foo', 'value': ['qux', 'baz']},
+            ])
+        self.assertEquals(patch.apply(doc), {
+            'foo': ['qux', 'baz'],
+            'baz': {'qux': 'world'},
+            'copy': {},
+            'moved': 'bar',
+            })
+        # the original is intact
+        self.assertEquals(doc, {'foo': ['bar', 'baz'], 'baz': {'qux': 'hello'}})
+        self.assertEquals(patch.paths, ['/foo/1', '/baz/qux', '/copy', '/foo/0', '/moved', '/copy/qux'])
+
+    def test_replace_document(self):
+        self.assertEquals(JsonPatch([{'op': 'replace', 'path': '', 'value': [1]}]).apply({}), [1])
+
+    def test_atomic(self):
+        doc = {'a': {'b': 1}}
+        patch = JsonPatch([
+            {'op': 'replace', 'path': '/a/b', 'value': 2},
+            {'op': 'test', 'path': '/a/b', 'value': 1},
+            ])
+        self.assertRaises(Conflict, patch.apply, doc)
+        self.assertEquals(doc, {'a': {'b': 1}})
+
+    def test_conflicts(self):
+        for operation in (
+                {'op': 'remove', 'path': '/missing'},
+                {'op': 'replace', 'path': '/list/2', 'value': 1},
+                {'op': 'add', 'path': '/list/01', 'value': 1},
+                {'op': 'add', 'path': '/missing/a', 'value': 1},
+                {'op': 'add', 'path': '/scalar/a', 'value': 1}):
+            self.assertRaises(Conflict, JsonPatch([operation]).apply, {'list': [1, 2], 'scalar': 1})
+
+    def test_malformed(self):
+        for operations in (
+                {'op': 'add'},
+                [{'op': 'unknown', 'path': '/a'}],
+                [{'op': 'add', 'path': '/a'}],
+                [{'op': 'move', 'path': '/a'}],
+                [{'op': 'move', 'from': '/a', 'path': '/a/b'}],
+                ['add']):
+            self.assertRaises(BadRequest, JsonPatch, operations)
+
+
+class MergePatchTest(unittest.TestCase):
+
+    def test_merge(self):
+        doc = {'title': 'Goodbye!', 'author': {'givenName': 'John', 'familyName': 'Doe'},
+               'tags': ['example', 'sample'], 'content': 'This will be unchanged'}
+        patch = {'title': 'Hello!', 'phoneNumber': '+01-123-456-7890',
+                 'author': {'familyName': None}, 'tags': ['example']}
+        self.assertEquals(merge_patch(doc, patch), {
+            'title': 'Hello!', 'author': {'givenName': 'John'}, 'tags': ['example'],
+            'content': 'This will be unchanged', 'phoneNumber': '+01-123-456-7890'})
+        self.assertEquals(doc['author'], {'givenName': 'John', 'familyName': 'Doe'})
+        self.assertEquals(merge_patch({'a': 'b'}, {'a': {'b': 'c'}}), {'a': {'b': 'c'}})
+        self.assertEquals(merge_patch(['a'], {'a': None}), {})
+
+    def test_apply_patch(self):
+        self.assertEquals(apply_patch({'a': 1}, {'a': 2}), {'a': 2})
+        self.assertEquals(apply_patch({'a': 1}, [{'op': 'remove', 'path': '/a'}]), {})
+
+
+class PatchMapperTest(unittest.TestCase):
+
+    def test_decode(self):
+        patch = JsonPatchMapper()._parse_data('[{"op": "remove", "path": "/a"}]', 'utf-8')
+        self.assertTrue(isinstance(patch, JsonPatch))
+        self.assertEquals(patch, [('remove', ('a',), None, ())])
+        patch = MergePatchMapper()._parse_data('{"a": null}', 'utf-8')
+        self.assertTrue(isinstance(patch, MergePatch))
+        self.assertRaises(BadRequest, MergePatchMapper()._parse_data, '[]', 'utf-8')
+        self.assertTrue(JsonPatchMapper.input_only and MergePatchMapper.input_only)
+
+
+#
+#  test_patch.py ends here
@@ -3,23 +3,32 @@
 #
 
 import json
+import zlib
 import base64
+import xmlrpclib
+from StringIO import StringIO
 
 from twisted.internet import defer, reactor
 from twisted.web import server
 from twisted.web.test.test_web import DummyRequest
+from twisted.web.test.requesthelper import DummyChannel
 from twisted.trial import unittest
 from twisted.internet.defer import succeed
 from twisted.python import log
-from twisted.web.http import OK, NOT_FOUND, INTERNAL_SERVER_ERROR, CONFLICT
+from twisted.web.http import OK, NOT_FOUND, INTERNAL_SERVER_ERROR, CONFLICT, BAD_REQUEST, CREATED
 
 from diablo.resource import Resource
+from diablo.xmlrpc import XmlRpcResource
 from diablo.api import RESTApi
+from diablo.batch import BatchResource
 from diablo.auth import HttpBasic, register_authenticator
 from diablo.mappers.xmlmapper import XmlMapper
 from diablo.mappers.jsonmapper import JsonMapper
 from diablo.mappers.yamlmapper import YamlMapper
-from diablo.http import NotFound, Response, Conflict
+from diablo.http import NotFound, Response, RawResponse, FileResponse, Conflict, Unauthorized
+from diablo.pagination import Paginated
+from diablo.patch import apply_patch
+from diablo.validation import InputSchema, Rule
 
 
 class DiabloDummyRequest(DummyRequest):
@@ -52,6 +61,41 @@ class AuthenticatedResource(Resource):
         return 'hello %s' % (request.user,)
 
 
+class HeaderAuthentication(object):
+    """ Accepts the requests that have the given header value. """
+
+    def __init__(self, header, value, user):
+        self.header, self.value, self.user = header, value, user
+
+    def authenticate(self, request):
+        if request.getHeader(self.header) != self.value:
+            raise Unauthorized()
+        return self.user
+
+    def auth_failed(self, exc):
+        return Response(401, '')
+
+
+class KeyAuthenticatedBatchResource(BatchResource):
+
+    allow_anonymous = False
+    authentication = HeaderAuthentication('x-batch-key', 'k1', 'batcher')
+
+
+class BatchKeyResource(Resource):
+
+    allow_anonymous = False
+    authentication = KeyAuthenticatedBatchResource.authentication
+
+    def get(self, request):
+        return {'user': request.user}
+
+
+class AdminKeyResource(BatchKeyResource):
+
+    authentication = HeaderAuthentication('x-admin-key', 'k2', 'admin')
+
+
 class DiabloTestResource(Resource):
 
     collection = {}
@@ -119,6 +163,116 @@ class DeferredTestResource(Resource):
         return d
 
 
+class StreamingTestResource(Resource):
+
+    def get(self, request, *args, **kw):
+        rows = ({'id': i} for i in range(1000))
+        return {'count': 1000, 'rows': rows}
+
+
+class CreatedTestResource(Resource):
+
+    def post(self, data, request, *args, **kw):
+        return Response(201, {'id': 1}, {'Location': '/testcreated/1'})
+
+
+class RawTestResource(Resource):
+
+    encoders = [server.GzipEncoderFactory()]
+
+    def get(self, request, *args, **kw):
+        return RawResponse('{"cached": true}' * 100, 'application/json',
+                           etag='"v1"', last_modified=1000000000)
+
+
+class FileTestResource(Resource):
+
+    path = None
+
+    def get(self, request, *args, **kw):
+        return FileResponse(self.path, 'application/octet-stream',
+                            etag='"f1"', filename='export.bin')
+
+
+class OrderInput(InputSchema):
+    product = Rule(str, min_length=1)
+    quantity = Rule(int, min=1)
+
+
+class ValidatedTestResource(Resource):
+
+    input_schemas = {'post': OrderInput}
+
+    def post(self, data, request, *args, **kw):
+        return Response(201, data)
+
+
+class HookedTestResource(ValidatedTestResource):
+    """ Overrides the hooks with their original signatures. """
+
+    def _executeHandler(self, username, methodname, method, data, request):
+        self.called = (username, methodname, data)
+        return ValidatedTestResource._executeHandler(
+            self, username, methodname, method, data, request)
+
+    def _getErrorResponse(self, exc):
+        response = ValidatedTestResource._getErrorResponse(self, exc)
+        response.headers['x-error'] = 'yes'
+        return response
+
+
+class PatchTestResource(Resource):
+
+    document = {'name': 'board', 'tags': ['snow'], 'vendor': {'name': 'Lauta', 'country': 'FI'}}
+
+    def patch(self, patch, request, *args, **kw):
+        return apply_patch(self.document, patch)
+
+
+class PagedTestResource(Resource):
+
+    page_size = 10
+
+    def get(self, request, *args, **kw):
+        return Paginated({'id': i, 'name': 'n%d' % (i,)} for i in xrange(25))
+
+
+class PagedBodyTestResource(PagedTestResource):
+
+    page_metadata = 'body'
+
+
+class ReportTestResource(Resource):
+
+    csv_columns = ('name', 'id')
+
+    def get(self, request, *args, **kw):
+        return ({'id': i, 'name': u'n\xe4me %d' % (i,), 'extra': i} for i in range(1000))
+
+
+class BulkTestResource(Resource):
+
+    stream_input = True
+
+    def post(self, data, request, *args, **kw):
+        self.received = data
+        return {'count': sum(1 for item in data)}
+
+
+class CalculatorResource(XmlRpcResource):
+
+    def xmlrpc_math_add(self, request, a, b):
+        return a + b
+
+    def xmlrpc_math_div(self, request, a, b):
+        return a / b
+
+    def xmlrpc_math_later(self, request, a):
+        d = defer.Deferred()
+        reactor.callLater(0, d.callback, a)
+        return d
+
+
 class ErrorResource(Resource):
     """ Resource to test error scenarios. """
 
@@ -158,8 +312,21 @@ def _render(resource, request):
 routes = [
     ('/auth/unaccessible', 'test_resource.UnaccessibleResource'),
     ('/auth/normal', 'test_resource.AuthenticatedResource'),
+    ('/auth/batchkey$', 'test_resource.BatchKeyResource'),
+    ('/auth/adminkey$', 'test_resource.AdminKeyResource'),
     ('/testregular(?P<format>\.?\w{1,8})?$', 'test_resource.RegularTestResource'),
     ('/testdeferred(?P<format>\.?\w{1,8})?$', 'test_resource.DeferredTestResource'),
+    ('/teststreaming(?P<format>\.?\w{1,8})?$', 'test_resource.StreamingTestResource'),
+    ('/testbulk$', 'test_resource.BulkTestResource'),
+    ('/testcreated$', 'test_resource.CreatedTestResource'),
+    ('/testraw$', 'test_resource.RawTestResource'),
+    ('/testfile$', 'test_resource.FileTestResource'),
+    ('/testvalidated$', 'test_resource.ValidatedTestResource'),
+    ('/testpatch$', 'test_resource.PatchTestResource'),
+    ('/testpaged$', 'test_resource.PagedTestResource'),
+    ('/testpagedbody$', 'test_resource.PagedBodyTestResource'),
+    ('/testreport(?P<format>\.?\w{1,8})?$', 'test_resource.ReportTestResource'),
+    ('/xmlrpc$', 'test_resource.CalculatorResource'),
     ('/a/useless/path$', 'test_resource.RouteTestResource1'),
     ('/a/useful/path(/)?(?P<tendigit>\d{10})?$', 'test_resource.RouteTestResource2'),
     ('/a/test/resource(/)?(?P<key>\w{1,10})?$', 'test_resource.DiabloTestResource'),
@@ -250,6 +417,7 @@ class AuthResourceTest(unittest.TestCase):
 
         def renderer(ignored):
             self.assertEquals(401, request.responseCode)
+            self.assertEquals(request.outgoingHeaders['www-authenticate'], 'Basic realm="diablo"')
 
         d.addCallback(renderer)
 
@@ -472,6 +640,382 @@ class ResourceTestCase(unittest.TestCase):
         d.addCallback(rendered)
         return d
 
+    def test_streaming_response(self):
+        request = DiabloDummyRequest([''])
+        request.path = '/teststreaming'
+        request.headers = {'content-type': 'application/json'}
+        resource = self.api.getChild('/teststreaming', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            response = ''.join(request.written)
+            response_obj = json.loads(response)
+            self.assertEquals(response_obj['rows'], [{'id': i} for i in range(1000)])
+            self.assertNotIn('content-length', request.outgoingHeaders)
+            self.assertEquals(request.finished, 1)
+        d.addCallback(rendered)
+        return d
+
+    def test_streaming_xml_response(self):
+        request = DiabloDummyRequest([''])
+        request.path = '/teststreaming.xml'
+        resource = self.api.getChild('/teststreaming', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            response_obj = XmlMapper('basic')._parse_data(''.join(request.written), 'utf-8')
+            self.assertEquals(response_obj['rows'], [{'id': i} for i in range(1000)])
+            self.assertNotIn('content-length', request.outgoingHeaders)
+        d.addCallback(rendered)
+        return d
+
+    def test_handler_headers(self):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/testcreated'
+        request.headers = {'content-type': 'application/json'}
+        resource = self.api.getChild('/testcreated', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, 201)
+            self.assertEquals(request.outgoingHeaders['location'], '/testcreated/1')
+            self.assertEquals(request.outgoingHeaders['content-length'], 8)
+            self.assertEquals(''.join(request.written), '{"id":1}')
+        d.addCallback(rendered)
+        return d
+
+    def test_streaming_csv_response(self):
+        request = DiabloDummyRequest([''])
+        request.path = '/testreport.csv'
+        resource = self.api.getChild('/testreport.csv', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            lines = ''.join(request.written).split('\r\n')
+            self.assertEquals(lines[0], 'name,id')
+            self.assertEquals(lines[1], 'n\xc3\xa4me 0,0')
+            self.assertEquals(len(lines), 1002)
+            self.assertEquals(request.outgoingHeaders['content-type'], 'text/csv; charset=utf-8')
+        d.addCallback(rendered)
+        return d
+
+    def test_streamed_csv_input(self):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/testbulk'
+        request.headers = {'content-type': 'text/csv'}
+        request.content = StringIO('id,name\r\n' + ''.join('%d,x\r\n' % (i,) for i in range(100)))
+        resource = self.api.getChild('/testbulk', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, OK)
+            self.assertEquals(''.join(request.written), 'count\r\n100\r\n')
+        d.addCallback(rendered)
+        return d
+
+    def test_streamed_multipart_input(self):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/testbulk'
+        request.headers = {'content-type': 'multipart/form-data; boundary=b0'}
+        request.content = StringIO(''.join(
+            '--b0\r\nContent-Disposition: form-data; name="f%d"\r\n\r\n%d\r\n' % (i, i)
+            for i in range(10)) + '--b0--\r\n')
+        resource = self.api.getChild('/testbulk', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, OK)
+            self.assertEquals(resource.received['f9'].value, u'9')
+        d.addCallback(rendered)
+        return d
+
+    def test_streamed_input(self):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/testbulk'
+        request.headers = {'content-type': 'application/json'}
+        request.content = StringIO(json.dumps([{'id': i} for i in range(100)]))
+        resource = self.api.getChild('/testbulk', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, OK)
+            self.assertFalse(isinstance(resource.received, list))
+            self.assertEquals(json.loads(''.join(request.written)), {'count': 100})
+        d.addCallback(rendered)
+        return d
+
+    def test_streamed_input_invalid(self):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/testbulk'
+        request.headers = {'content-type': 'application/json'}
+        request.content = StringIO('[{"id": 1}, {"id": 2')
+        resource = self.api.getChild('/testbulk', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, BAD_REQUEST)
+        d.addCallback(rendered)
+        return d
+
+    def test_invalid_input(self):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/a/test/resource'
+        request.headers = {'content-type': 'application/json'}
+        request.data = '{"key": '
+        resource = self.api.getChild('/ignored', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, BAD_REQUEST)
+        d.addCallback(rendered)
+        return d
+
+    def test_validated_input(self):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/testvalidated'
+        request.headers = {'content-type': 'application/json'}
+        request.data = '{"product": "", "quantity": "2"}'
+        resource = self.api.getChild('/testvalidated', request)
+        d = _render(resource, request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, BAD_REQUEST)
+            self.assertEquals(json.loads(''.join(request.written)), {'errors': {
+                'product': 'must be at least 1 long',
+                'quantity': 'expected integer'}})
+        d.addCallback(rendered)
+        return d
+
+    def test_overridden_hooks(self):
+        resource = HookedTestResource()
+
+        def post(body):
+            request = DiabloDummyRequest([''])
+            request.method = 'POST'
+            request.path = '/testhooked'
+            request.headers = {'content-type': 'application/json'}
+            request.data = body
+            return request, _render(resource, request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, CREATED)
+            self.assertEquals(resource.called, (None, 'post', {'product': 'ski', 'quantity': 1}))
+            failed_request, d = post('{"product": "ski", "quantity": 0}')
+            return d.addCallback(failed, failed_request)
+
+        def failed(ignored, request):
+            self.assertEquals(request.responseCode, BAD_REQUEST)
+            self.assertEquals(request.outgoingHeaders['x-error'], 'yes')
+            self.assertEquals(json.loads(''.join(request.written)),
+                              {'errors': {'quantity': 'must be at least 1'}})
+        request, d = post('{"product": "ski", "quantity": 1}')
+        d.addCallback(rendered)
+        return d
+
+    def _patch(self, content_type, body, accept='application/json'):
+        request = DiabloDummyRequest([''])
+        request.method = 'PATCH'
+        request.path = '/testpatch'
+        request.headers = {'content-type': content_type}
+        if accept is not None:
+            request.headers['accept'] = accept
+        request.data = body
+        resource = self.api.getChild('/testpatch', request)
+        return request, _render(resource, request)
+
+    def test_json_patch(self):
+        request, d = self._patch('application/json-patch+json', json.dumps([
+            {'op': 'test', 'path': '/name', 'value': 'board'},
+            {'op': 'add', 'path': '/tags/-', 'value': 'powder'},
+            {'op': 'remove', 'path': '/vendor/country'},
+            ]))
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, OK)
+            self.assertEquals(request.outgoingHeaders['content-type'],
+                              'application/json; charset=utf-8')
+            self.assertEquals(json.loads(''.join(request.written)), {
+                'name': 'board', 'tags': ['snow', 'powder'], 'vendor': {'name': 'Lauta'}})
+            self.assertEquals(PatchTestResource.document['tags'], ['snow'])
+        d.addCallback(rendered)
+        return d
+
+    def test_merge_patch(self):
+        request, d = self._patch('application/merge-patch+json',
+                                 '{"name": "ski", "vendor": {"country": null}}')
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, OK)
+            self.assertEquals(json.loads(''.join(request.written)), {
+                'name': 'ski', 'tags': ['snow'], 'vendor': {'name': 'Lauta'}})
+        d.addCallback(rendered)
+        return d
+
+    def test_patch_response_format(self):
+        body = '{"name": "ski"}'
+        results = [self._patch('application/merge-patch+json', body, accept)
+                   for accept in (None, '*/*', 'application/yaml')]
+
+        def rendered(ignored):
+            for request, content_type in zip([request for request, d in results], (
+                    'application/json', 'application/json', 'application/yaml')):
+                self.assertEquals(request.responseCode, OK)
+                self.assertEquals(request.outgoingHeaders['content-type'],
+                                  content_type + '; charset=utf-8')
+            self.assertEquals(json.loads(''.join(results[0][0].written))['name'], 'ski')
+        return defer.gatherResults([d for request, d in results]).addCallback(rendered)
+
+    def test_failed_patch(self):
+        request, d = self._patch('application/json-patch+json',
+                                 '[{"op": "test", "path": "/name", "value": "ski"}]')
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, CONFLICT)
+        d.addCallback(rendered)
+        return d
+
+    def _get(self, path, args):
+        request = DiabloDummyRequest([''])
+        request.method = 'GET'
+        request.path = path
+        request.args = args
+        request.headers = {'accept': 'application/json'}
+        return request, _render(self.api.getChild(path, request), request)
+
+    def test_paginated_link(self):
+        request, d = self._get('/testpaged', {'fields': ['id']})
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, OK)
+            self.assertEquals(json.loads(''.join(request.written)), [{'id': i} for i in range(10)])
+            self.assertEquals(request.outgoingHeaders['link'],
+                              '</testpaged?cursor=MTA&fields=id>; rel="next"')
+        d.addCallback(rendered)
+        return d
+
+    def test_paginated_body(self):
+        request, d = self._get('/testpagedbody', {'limit': ['20'], 'cursor': ['MTA']})
+
+        def rendered(ignored):
+            content = json.loads(''.join(request.written))
+            self.assertEquals([item['id'] for item in content['items']], range(10, 25))
+            self.assertEquals(content['next'], None)
+            self.assertNotIn('link', request.outgoingHeaders)
+        d.addCallback(rendered)
+        return d
+
+    def test_paginated_invalid(self):
+        request, d = self._get('/testpaged', {'limit': ['0']})
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, BAD_REQUEST)
+        d.addCallback(rendered)
+        return d
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = RESTApi(routes, batch_path='/batch')
+
+    def _batch(self, body):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/batch'
+        request.headers = {'content-type': 'application/json'}
+        request.data = json.dumps(body)
+        return request, _render(self.api.getChild('/batch', request), request)
+
+    def test_batch(self):
+        request, d = self._batch([
+            {'path': '/testregular'},
+            {'path': '/testdeferred'},
+            {'path': '/teststreaming?x=1'},
+            {'method': 'POST', 'path': '/testvalidated', 'body': {'product': 'ski', 'quantity': 0}},
+            {'method': 'DELETE', 'path': '/testregular'},
+            {'path': '/missing'},
+            {'path': '/auth/normal'},
+            {'path': '/batch'},
+            ])
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, OK)
+            responses = json.loads(''.join(request.written))
+            self.assertEquals([response['status'] for response in responses],
+                              [200, 200, 200, 400, 405, 404, 401, 400])
+            self.assertEquals(responses[0]['body'], regular_result)
+            self.assertEquals(responses[0]['headers']['content-type'], 'application/json; charset=utf-8')
+            self.assertEquals(responses[1]['body'], deferred_result)
+            self.assertEquals(len(responses[2]['body']['rows']), 1000)
+            self.assertEquals(responses[3]['body'], {'errors': {'quantity': 'must be at least 1'}})
+            self.assertEquals(responses[6]['headers']['www-authenticate'], 'Basic realm="diablo"')
+        d.addCallback(rendered)
+        return d
+
+    def test_invalid_batch(self):
+        request, d = self._batch([{'method': 'GET'}])
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, BAD_REQUEST)
+            self.assertEquals(json.loads(''.join(request.written)),
+                              {'errors': {'0.path': 'required'}})
+        d.addCallback(rendered)
+        return d
+
+    def test_invalid_method(self):
+        request, d = self._batch([{'method': 'RENDER', 'path': '/testregular'}])
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, BAD_REQUEST)
+            self.assertEquals(json.loads(''.join(request.written))['errors'].keys(),
+                              ['0.method'])
+        d.addCallback(rendered)
+        return d
+
+    def test_batch_paths(self):
+        api = RESTApi(routes, batch_path='/batch/')
+        request = DiabloDummyRequest([''])
+        for path in ('/batch', '/batch/'):
+            request.path = path
+            self.assertTrue(isinstance(api.getChild(path, request), BatchResource))
+        request.path = '/batc'
+        self.assertFalse(isinstance(api.getChild('/batc', request), BatchResource))
+
+    def test_authentication(self):
+        api = RESTApi(routes, batch_path='/batch', batch_resource=KeyAuthenticatedBatchResource)
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/batch'
+        request.headers = {'content-type': 'application/json', 'x-batch-key': 'k1'}
+        request.data = json.dumps([
+            {'path': '/auth/batchkey'},
+            {'path': '/auth/adminkey'},
+            {'path': '/auth/adminkey', 'headers': {'x-batch-key': 'k1'}},
+            {'path': '/auth/adminkey', 'headers': {'X-Admin-Key': 'k2'}},
+            ])
+        d = _render(api.getChild('/batch', request), request)
+
+        def rendered(ignored):
+            self.assertEquals(request.responseCode, OK)
+            responses = json.loads(''.join(request.written))
+            self.assertEquals([response['status'] for response in responses], [200, 401, 401, 200])
+            self.assertEquals(responses[0]['body'], {'user': 'batcher'})
+            self.assertEquals(responses[3]['body'], {'user': 'admin'})
+        d.addCallback(rendered)
+        return d
+
+    def test_disabled(self):
+        request = DiabloDummyRequest([''])
+        request.path = '/batch'
+        self.assertFalse(isinstance(RESTApi(routes).getChild('/batch', request), BatchResource))
+
 
 class ContentTypeFormatterTestCase(unittest.TestCase):
 
@@ -529,6 +1073,30 @@ class ContentTypeFormatterTestCase(unittest.TestCase):
         d.addCallback(rendered)
         return d
 
+    def _accept(self, accept):
+        request = DiabloDummyRequest([''])
+        request.path = '/testregular'
+        request.headers = {'accept': accept}
+        resource = self.api.getChild('/testregular', request)
+        return request, _render(resource, request)
+
+    def test_application_wildcard(self):
+        request, d = self._accept('application/*')
+
+        def rendered(ignored):
+            self.assertEquals(request.outgoingHeaders['content-type'], 'application/yaml; charset=utf-8')
+            self.assertEquals(yamlMapper._parse_data(''.join(request.written), 'utf-8'), regular_result)
+        d.addCallback(rendered)
+        return d
+
+    def test_text_wildcard(self):
+        request, d = self._accept('text/*')
+
+        def rendered(ignored):
+            self.assertEquals(request.outgoingHeaders['content-type'], 'application/yaml; charset=utf-8')
+        d.addCallback(rendered)
+        return d
+
 
 class FormatArgTestCase(unittest.TestCase):
 
@@ -645,6 +1213,51 @@ class UrlFormatTestCase(unittest.TestCase):
         return d
 
 
+class XmlRpcTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = RESTApi(routes)
+
+    def _call(self, params, methodname):
+        request = DiabloDummyRequest([''])
+        request.method = 'POST'
+        request.path = '/xmlrpc'
+        request.headers = {'content-type': 'text/xml'}
+        request.data = xmlrpclib.dumps(params, methodname)
+        resource = self.api.getChild('/xmlrpc', request)
+        d = _render(resource, request)
+        d.addCallback(lambda ignored: xmlrpclib.loads(''.join(request.written)))
+        return d
+
+    def test_call(self):
+        d = self._call((1, 2), 'math.add')
+        d.addCallback(lambda result: self.assertEquals(result, ((3,), None)))
+        return d
+
+    def test_fault(self):
+        d = self._call((1, 2), 'math.nope')
+        self.assertFailure(d, xmlrpclib.Fault)
+        return d
+
+    def test_multicall(self):
+        calls = [
+            {'methodName': 'math.add', 'params': [1, 2]},
+            {'methodName': 'math.div', 'params': [1, 0]},
+            {'methodName': 'math.later', 'params': ['x']},
+            {'methodName': 'math.nope', 'params': []},
+            ]
+
+        def check(result):
+            results = result[0][0]
+            self.assertEquals(results[0], [3])
+            self.assertIn('faultCode', results[1])
+            self.assertEquals(results[2], ['x'])
+            self.assertEquals(results[3]['faultCode'], 8001)
+        d = self._call((calls,), 'system.multicall')
+        d.addCallback(check)
+        return d
+
+
 class TestErrors(unittest.TestCase):
     def setUp(self):
         self.api = RESTApi(routes)
@@ -706,5 +1319,172 @@ class TestErrors(unittest.TestCase):
         return d
 
 
+class RawResponseTest(unittest.TestCase):
+    """ Uses real twisted requests to see the conditional GET and
+    compression handling. """
+
+    def setUp(self):
+        self.api = RESTApi(routes)
+
+    def _render(self, headers):
+        channel = DummyChannel()
+        request = server.Request(channel, False)
+        request.method = 'GET'
+        request.uri = request.path = '/testraw'
+        request.clientproto = 'HTTP/1.1'
+        request.args = {}
+        request.content = StringIO('')
+        for name, value in headers.items():
+            request.requestHeaders.setRawHeaders(name, [value])
+        self.api.getChild('/testraw', request).render(request)
+        self.assertTrue(request.finished)
+        head, body = channel.transport.written.getvalue().split('\r\n\r\n', 1)
+        return head, body
+
+    def test_raw_content(self):
+        head, body = self._render({'accept': 'text/xml'})
+        self.assertTrue(head.startswith('HTTP/1.1 200 OK'))
+        self.assertIn('Content-Type: application/json', head)
+        self.assertIn('ETag: "v1"', head)
+        self.assertIn('Content-Length: 1600', head)
+        self.assertIn('Vary: Accept-Encoding', head)
+        self.assertEquals(body, '{"cached": true}' * 100)
+
+    def test_not_modified(self):
+        head, body = self._render({'if-none-match': '"v1"'})
+        self.assertTrue(head.startswith('HTTP/1.1 304 Not Modified'))
+        self.assertEquals(body, '')
+        head, body = self._render({'if-modified-since': 'Mon, 10 Sep 2001 00:00:00 GMT'})
+        self.assertTrue(head.startswith('HTTP/1.1 304 Not Modified'))
+        head, body = self._render({'if-none-match': '"v0"'})
+        self.assertTrue(head.startswith('HTTP/1.1 200 OK'))
+
+    def test_compressed(self):
+        head, body = self._render({'accept-encoding': 'gzip'})
+        self.assertIn('Content-Encoding: gzip', head)
+        self.assertIn('Vary: Accept-Encoding', head)
+        self.assertNotIn('Content-Length', head)
+        chunks, rest = [], body
+        while rest:
+            size, rest = rest.split('\r\n', 1)
+            chunks.append(rest[:int(size, 16)])
+            rest = rest[int(size, 16) + 2:]
+        self.assertEquals(zlib.decompress(''.join(chunks), 16 + zlib.MAX_WBITS), '{"cached": true}' * 100)
+
+    def test_bytes_only(self):
+        self.assertRaises(TypeError, RawResponse, u'x', 'text/plain')
+
+
+class FileResponseTest(unittest.TestCase):
+    """ Serves a file through the static producers. """
+
+    data = ''.join(chr(i % 251) for i in range(100000))
+
+    def setUp(self):
+        self.api = RESTApi(routes)
+        FileTestResource.path = self.mktemp()
+        with open(FileTestResource.path, 'wb') as f:
+            f.write(self.data)
+
+    def _render(self, headers):
+        channel = DummyChannel()
+        channel.transport.unregisterProducer = lambda: None
+        request = server.Request(channel, False)
+        request.method = 'GET'
+        request.uri = request.path = '/testfile'
+        request.clientproto = 'HTTP/1.0'
+        request.args = {}
+        request.content = StringIO('')
+        for name, value in headers.items():
+            request.requestHeaders.setRawHeaders(name, [value])
+        self.api.getChild('/testfile', request).render(request)
+        while request.producer:
+            request.producer.resumeProducing()
+        self.assertTrue(request.finished)
+        return channel.transport.written.getvalue().split('\r\n\r\n', 1)
+
+    def test_whole_file(self):
+        head, body = self._render({})
+        self.assertTrue(head.startswith('HTTP/1.0 200 OK'))
+        self.assertIn('Content-Length: 100000', head)
+        self.assertIn('Accept-Ranges: bytes', head)
+        self.assertIn('Content-Disposition: attachment; filename="export.bin"', head)
+        self.assertIn('Last-Modified: ', head)
+        self.assertEquals(body, self.data)
+
+    def test_range(self):
+        head, body = self._render({'range': 'bytes=1000-1999'})
+        self.assertTrue(head.startswith('HTTP/1.0 206 Partial Content'))
+        self.assertIn('Content-Range: bytes 1000-1999/100000', head)
+        self.assertIn('Content-Length: 1000', head)
+        self.assertEquals(body, self.data[1000:2000])
+        head, body = self._render({'range': 'bytes=-10'})
+        self.assertEquals(body, self.data[-10:])
+
+    def test_unsatisfiable_range(self):
+        head, body = self._render({'range': 'bytes=100000-'})
+        self.assertTrue(head.startswith('HTTP/1.0 416'))
+        self.assertIn('Content-Range: bytes */100000', head)
+        self.assertEquals(body, '')
+
+    def test_if_range(self):
+        head, body = self._render({'range': 'bytes=0-9', 'if-range': '"f1"'})
+        self.assertTrue(head.startswith('HTTP/1.0 206'))
+        head, body = self._render({'range': 'bytes=0-9', 'if-range': '"f0"'})
+        self.assertTrue(head.startswith('HTTP/1.0 200'))
+        self.assertEquals(body, self.data)
+
+    def test_not_modified(self):
+        head, body = self._render({'if-none-match': '"f1"', 'range': 'bytes=0-9'})
+        self.assertTrue(head.startswith('HTTP/1.0 304'))
+        self.assertEquals(body, '')
+
+    def test_filename(self):
+        def disposition(filename):
+            return FileResponse(StringIO(''), filename=filename).getHeader('Content-Disposition')
+        self.assertEquals(disposition('a "b"\\c.txt'), 'attachment; filename="a \\"b\\"\\\\c.txt"')
+        self.assertEquals(disposition('a\r\nSet-Cookie: x=1.txt'), 'attachment; filename="aSet-Cookie: x=1.txt"')
+        self.assertEquals(disposition(u'r\xe4kki \u20ac.txt'),
+                          'attachment; filename="r?kki ?.txt"; filename*=UTF-8\'\'r%C3%A4kki%20%E2%82%AC.txt')
+        self.assertEquals(disposition('r\xc3\xa4kki.txt'),
+                          'attachment; filename="r?kki.txt"; filename*=UTF-8\'\'r%C3%A4kki.txt')
+
+    def test_blob(self):
+        response = FileResponse(StringIO('blob'), 'text/plain')
+        self.assertEquals(response.size, 4)
+        self.assertEquals(response.getHeader('Content-Length'), 4)
+
+
+class ResponseTest(unittest.TestCase):
+
+    def test_shared_headers_are_copied_on_write(self):
+        shared = {'Content-Type': 'text/plain'}
+        first, second = Response(200), Response(200)
+        first.shareHeaders(shared)
+        second.shareHeaders(shared)
+        self.assertEquals(first.getHeader('Content-Type'), 'text/plain')
+        first.setHeader('Content-Length', 3)
+        self.assertEquals(shared, {'Content-Type': 'text/plain'})
+        self.assertEquals(dict(first.iterheaders()), {'Content-Type': 'text/plain', 'Content-Length': 3})
+        self.assertEquals(dict(second.iterheaders()), shared)
+
+    def test_own_headers_are_kept(self):
+        response = Response(201, 'x', {'Location': '/a'})
+        response.shareHeaders({'Content-Type': 'text/plain'})
+        self.assertEquals(response.headers, {'Location': '/a', 'Content-Type': 'text/plain'})
+        self.assertRaises(AttributeError, setattr, response, 'foo', 1)
+
+    def test_given_headers_are_not_modified(self):
+        constant = {'Cache-Control': 'no-cache'}
+        response = Response(200, 'x', constant)
+        response.shareHeaders({'Content-Type': 'text/plain'})
+        response.addHeaders({'Content-Length': 1})
+        raw = RawResponse('x', 'text/plain', headers=constant)
+        self.assertEquals(constant, {'Cache-Control': 'no-cache'})
+        self.assertEquals(response.headers, {
+            'Cache-Control': 'no-cache', 'Content-Type': 'text/plain', 'Content-Length': 1})
+        self.assertEquals(raw.getHeader('Content-Type'), 'text/plain')
+
+
 #
 #  test_resource.py ends here
@@ -0,0 +1,165 @@
+#  -*- coding: utf-8 -*-
+#  test_serializer.py ---
+#
+
+from decimal import Decimal
+
+from twisted.trial import unittest
+
+from diablo.fields import parse_fields, project
+from diablo.http import BadRequest
+from diablo.resource import Resource
+from diablo.serializer import Schema, Field
+
+
+class Obj(object):
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+class VendorSchema(Schema):
+    name = Field()
+    country = Field('country_code')
+
+
+class TagSchema(Schema):
+    from_dicts = True
+    label = Field('tag')
+
+
+class ProductSchema(Schema):
+    id = Field()
+    name = Field('title')
+    price = Field(convert=str)
+    vendor = Field(schema=VendorSchema)
+    tags = Field('tag_set', schema=TagSchema, many=True)
+    city = Field('vendor.address.city')
+
+
+class ProductResource(Resource):
+    output_schema = ProductSchema
+
+
+def make_product(i, vendor=True):
+    return Obj(
+        id=i,
+        title=u'Board %d' % (i,),
+        price=Decimal('9.50'),
+        vendor=Obj(name=u'Lauta', country_code='FI', address=Obj(city=u'Hämeenlinna')) if vendor else None,
+        tag_set=[{'tag': 'snow'}, {'tag': 'board'}])
+
+
+class SchemaTest(unittest.TestCase):
+
+    expected = {
+        'id': 1,
+        'name': u'Board 1',
+        'price': '9.50',
+        'vendor': {'name': u'Lauta', 'country': 'FI'},
+        'tags': [{'label': 'snow'}, {'label': 'board'}],
+        'city': u'Hämeenlinna',
+        }
+
+    def test_serialize_one(self):
+        self.assertEquals(ProductSchema.serialize(make_product(1)), self.expected)
+
+    def test_serialize_many(self):
+        products = [make_product(1), make_product(1)]
+        self.assertEquals(ProductSchema.serialize(products), [self.expected] * 2)
+        self.assertEquals(list(ProductSchema.serialize(iter(products))), [self.expected] * 2)
+
+    def test_nested_none(self):
+        self.assertEquals(VendorSchema.serialize_one(None), None)
+
+    def test_field_order_and_inheritance(self):
+        class Extended(VendorSchema):
+            country = Field(convert=len, source='country_code')
+            founded = Field()
+        self.assertEquals([name for name, field in Extended._fields],
+                          ['name', 'country', 'founded'])
+        self.assertEquals(Extended.serialize(Obj(name='x', country_code='FI', founded=1)),
+                          {'name': 'x', 'country': 2, 'founded': 1})
+
+    def test_invalid_source(self):
+        def define():
+            class Invalid(Schema):
+                name = Field('a-b')
+        self.assertRaises(ValueError, define)
+
+    def test_resource(self):
+        resource = ProductResource()
+        self.assertEquals(resource._serializeObject([make_product(1)], None), [self.expected])
+        self.assertEquals(Resource()._serializeObject([1], None), [1])
+
+
+class FieldsTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEquals(parse_fields('id, vendor.name,vendor.country'),
+                          {'id': None, 'vendor': {'name': None, 'country': None}})
+        self.assertEquals(parse_fields('vendor,vendor.name'), {'vendor': None})
+        self.assertEquals(parse_fields(','), None)
+        self.assertRaises(BadRequest, parse_fields, 'vendor..name')
+
+    def test_parse_returns_copy(self):
+        fields = parse_fields('id,vendor.name')
+        fields['vendor']['country'] = None
+        del fields['id']
+        self.assertEquals(parse_fields('id,vendor.name'),
+                          {'id': None, 'vendor': {'name': None}})
+
+    def test_project(self):
+        data = {'id': 1, 'name': 'x', 'vendor': {'name': 'y', 'country': 'FI'}}
+        fields = parse_fields('id,vendor.country,missing')
+        expected = {'id': 1, 'vendor': {'country': 'FI'}}
+        self.assertEquals(project(data, fields), expected)
+        self.assertEquals(project([data], fields), [expected])
+        self.assertEquals(list(project(iter([data]), fields)), [expected])
+        self.assertEquals(project('x', fields), 'x')
+
+    def test_schema_select(self):
+        fields = parse_fields('id,vendor.country,tags')
+        schema = ProductSchema.select(fields)
+        self.assertTrue(schema is ProductSchema.select(parse_fields('tags,vendor.country,id')))
+        self.assertTrue(ProductSchema.select(None) is ProductSchema)
+        self.assertEquals(schema.serialize(make_product(1)), {
+            'id': 1,
+            'vendor': {'country': 'FI'},
+            'tags': [{'label': 'snow'}, {'label': 'board'}],
+            })
+        # the full schema is intact
+        self.assertEquals(ProductSchema.serialize(make_product(1)), SchemaTest.expected)
+
+    def test_schema_select_unknown_fields(self):
+        class Schema2(Schema):
+            id = Field()
+            vendor = Field(schema=VendorSchema)
+        schema = Schema2.select(parse_fields('id,vendor.name'))
+        self.assertTrue(schema is Schema2.select(parse_fields('id,x,vendor.name,vendor.y')))
+        Schema2._max_selections = 2
+        for value in ('id', 'vendor', 'vendor.name', 'vendor.country'):
+            Schema2.select(parse_fields(value))
+        self.assertTrue(len(Schema2._selections) <= 2)
+        self.assertEquals(schema.serialize(make_product(1)),
+                          {'id': 1, 'vendor': {'name': u'Lauta'}})
+
+    def test_schema_select_plain_value(self):
+        class Schema2(Schema):
+            meta = Field()
+        schema = Schema2.select(parse_fields('meta.a'))
+        self.assertEquals(schema.serialize(Obj(meta={'a': 1, 'b': 2})), {'meta': {'a': 1}})
+
+    def test_resource(self):
+        request = Obj(args={'fields': ['id,vendor.name']})
+        resource = Resource()
+        request.fields = resource._getFields(request)
+        self.assertEquals(resource._selectFields({'id': 1, 'x': 2}, request), {'id': 1})
+        resource = ProductResource()
+        self.assertEquals(resource._serializeObject(make_product(1), request),
+                          {'id': 1, 'vendor': {'name': u'Lauta'}})
+        resource.fields_argument = None
+        self.assertEquals(resource._getFields(request), None)
+
+
+#
+#  test_serializer.py ends here
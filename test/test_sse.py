@@ -0,0 +1,138 @@
+#  -*- coding: utf-8 -*-
+#  test_sse.py ---
+#
+
+from twisted.internet import task
+from twisted.python.failure import Failure
+from twisted.trial import unittest
+from twisted.web.test.test_web import DummyRequest
+from twisted.web.server import NOT_DONE_YET
+
+from diablo.mappers.jsonmapper import JsonMapper
+from diablo.mappers.xmlmapper import XmlMapper
+from diablo.sse import Channel, Event, EventSource
+
+
+class EventRequest(DummyRequest):
+
+    code = 200
+    content = None
+
+
+class CountingMapper(JsonMapper):
+
+    def __init__(self):
+        JsonMapper.__init__(self)
+        self.count = 0
+
+    def encode(self, response):
+        self.count += 1
+        return JsonMapper.encode(self, response)
+
+
+class EventTest(unittest.TestCase):
+
+    def test_frame(self):
+        event = Event({'a': 1}, event='update', id=7)
+        self.assertEquals(event.frame(JsonMapper()), 'id: 7\nevent: update\ndata: {"a":1}\n\n')
+        self.assertEquals(Event('a\nb').frame(JsonMapper(pretty=True)), 'data: "a\\nb"\n\n')
+        self.assertEquals(Event([1]).frame(JsonMapper(pretty=True)), 'data: [\ndata:     1\ndata: ]\n\n')
+        self.assertRaises(ValueError, Event, 1, event='a\nb')
+
+
+class ChannelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.channel = Channel(history=3, clock=self.clock)
+
+    def test_fan_out(self):
+        mapper = CountingMapper()
+        xml = XmlMapper()
+        requests = [DummyRequest(['']) for i in range(100)]
+        for request in requests:
+            self.channel.subscribe(request, mapper)
+        self.channel.subscribe(requests[0], xml)
+        self.assertEquals(len(self.channel), 101)
+        self.channel.publish({'a': 1})
+        self.assertEquals(mapper.count, 1)
+        self.assertEquals(requests[-1].written, ['id: 1\ndata: {"a":1}\n\n'])
+        self.assertEquals(len(requests[0].written), 2)
+
+    def test_heartbeat_and_unsubscribe(self):
+        first, second = DummyRequest(['']), DummyRequest([''])
+        self.channel.subscribe(first, JsonMapper())
+        self.channel.subscribe(second, JsonMapper())
+        self.clock.advance(self.channel.heartbeat_interval)
+        self.assertEquals(first.written, [':\n\n'])
+        # connection lost
+        first.processingFailed(Failure(Exception('lost')))
+        self.flushLoggedErrors()
+        self.channel.publish(1)
+        self.assertEquals(len(first.written), 1)
+        self.assertEquals(len(second.written), 2)
+        self.channel.close()
+        self.assertTrue(second.finished)
+        self.assertEquals(len(self.channel), 0)
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+
+    def test_last_event_id(self):
+        for i in range(5):
+            self.channel.publish(i)
+        request = DummyRequest([''])
+        self.channel.subscribe(request, JsonMapper(), last_event_id='3')
+        self.assertEquals(request.written, ['id: 4\ndata: 3\n\n', 'id: 5\ndata: 4\n\n'])
+        request = DummyRequest([''])
+        self.channel.subscribe(request, JsonMapper(), last_event_id='1')
+        self.assertEquals(request.written, [])
+        self.channel.close()
+
+
+class EventSourceTest(unittest.TestCase):
+
+    def test_stream(self):
+        channel = Channel(clock=task.Clock())
+        channel.publish('old')
+
+        class Events(EventSource):
+            retry = 3000
+        Events.channel = channel
+        request = EventRequest([''])
+        request.method = 'GET'
+        request.path = '/events'
+        request.headers = {'accept': 'text/event-stream', 'last-event-id': '0'}
+        request.args = {'format': ['json']}
+        self.assertEquals(Events().render(request), NOT_DONE_YET)
+        channel.publish({'a': 1})
+        self.assertEquals(request.outgoingHeaders['content-type'], 'text/event-stream; charset=utf-8')
+        self.assertEquals(request.written, ['retry: 3000\n\n', 'id: 2\ndata: {"a":1}\n\n'])
+        channel.close()
+
+    def test_binary_format(self):
+        class Events(EventSource):
+            channel = Channel(clock=task.Clock())
+
+        def render(format):
+            request = EventRequest([''])
+            request.method = 'GET'
+            request.path = '/events'
+            request.headers = {'accept': 'text/event-stream'}
+            request.args = {'format': [format]}
+            Events().render(request)
+            return request
+        self.assertEquals(render('msgpack').responseCode, 406)
+        self.assertEquals(len(Events.channel), 0)
+        render('json')
+        self.assertEquals(len(Events.channel), 1)
+        Events.channel.close()
+
+    def test_no_channel(self):
+        request = EventRequest([''])
+        request.method = 'GET'
+        request.path = '/events'
+        EventSource().render(request)
+        self.assertEquals(request.responseCode, 404)
+
+
+#
+#  test_sse.py ends here
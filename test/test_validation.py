@@ -0,0 +1,84 @@
+#  -*- coding: utf-8 -*-
+#  test_validation.py ---
+#
+
+from decimal import Decimal
+
+from twisted.trial import unittest
+
+from diablo.http import BadRequest
+from diablo.validation import InputSchema, Rule
+
+
+class TagInput(InputSchema):
+    allow_extra = False
+    label = Rule(str, max_length=5)
+
+
+class ProductInput(InputSchema):
+    name = Rule(str, min_length=1, max_length=20)
+    price = Rule(float, min=Decimal('0.01'))
+    count = Rule(int, required=False, default=1, max=10)
+    kind = Rule(choices=['a', 'b'], required=False)
+    tags = Rule(schema=TagInput, many=True, required=False, default=[])
+    vendor = Rule(schema=TagInput, required=False, null=True)
+
+
+class InputSchemaTest(unittest.TestCase):
+
+    def _errors(self, data):
+        try:
+            ProductInput.validate(data)
+        except BadRequest, exc:
+            return exc.content['errors']
+        self.fail('no errors')
+
+    def test_valid(self):
+        data = ProductInput.validate({'name': u'Board', 'price': 1.5, 'vendor': None})
+        self.assertEquals(data, {'name': u'Board', 'price': 1.5, 'vendor': None,
+                                 'count': 1, 'tags': []})
+        ProductInput.validate({'name': 'x', 'price': 1})['tags'].append(1)
+        self.assertEquals(ProductInput.validate({'name': 'x', 'price': 1})['tags'], [])
+
+    def test_all_errors(self):
+        errors = self._errors({
+            'price': True,
+            'count': 11,
+            'kind': 'c',
+            'tags': [{'label': 'too long'}, {'x': 1}, 3],
+            'vendor': {'label': None}})
+        self.assertEquals(errors, {
+            'name': 'required',
+            'price': 'expected number',
+            'count': 'must be at most 10',
+            'kind': 'must be one of a, b',
+            'tags.0.label': 'must be at most 5 long',
+            'tags.1.label': 'required',
+            'tags.1.x': 'unknown field',
+            'tags.2': 'expected an object',
+            'vendor.label': 'must not be null'})
+
+    def test_not_an_object(self):
+        self.assertEquals(self._errors([1]), {'': 'expected an object'})
+        self.assertEquals(self._errors(None), {'': 'expected an object'})
+
+    def test_streamed_items(self):
+        items = ProductInput.validate(iter([{'name': 'x', 'price': 1}, {'name': 'y'}]))
+        self.assertEquals(items.next()['name'], 'x')
+        self.assertRaises(BadRequest, items.next)
+
+    def test_length_without_type(self):
+        class Untyped(InputSchema):
+            name = Rule(min_length=2)
+        for value, error in ((5, 'expected a string or a list'), ('x', 'must be at least 2 long')):
+            try:
+                Untyped.validate({'name': value})
+            except BadRequest, exc:
+                self.assertEquals(exc.content, {'errors': {'name': error}})
+            else:
+                self.fail('no errors')
+        self.assertEquals(Untyped.validate({'name': [1, 2]}), {'name': [1, 2]})
+
+
+#
+#  test_validation.py ends here